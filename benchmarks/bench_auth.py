@@ -0,0 +1,73 @@
+"""
+Auth overhead per request: JWT verification with and without the decoded-token
+cache, the whole get_current_user dependency with a cached user, and bcrypt.
+
+    python -m benchmarks.bench_auth
+"""
+import asyncio
+from datetime import datetime
+from unittest.mock import AsyncMock
+
+from benchmarks.report import Timer, print_results, summarize
+from src.services.auth import auth_service
+from src.services.cache import CachedUser
+from src.services.passwords import password_hasher
+from src.services.tokens import BACKENDS, TokenCache
+
+
+async def run(number: int = 20000, bcrypt_number: int = 10) -> dict:
+    """
+    Times the JWT and password paths.
+
+    :param number: Calls per JWT case.
+    :type number: int
+    :param bcrypt_number: Calls per bcrypt case, each takes hundreds of milliseconds.
+    :type bcrypt_number: int
+    :return: The statistics of every case.
+    :rtype: dict
+    """
+    results = {}
+    key, algorithm = auth_service.SECRET_KEY, auth_service.ALGORITHM
+    token = await auth_service.create_access_token(data={"sub": "bench@example.com"})
+    results["jwt encode"] = summarize((await Timer().measure(
+        lambda: auth_service.create_access_token(data={"sub": "bench@example.com"}), number)).samples)
+    for name, backend_class in BACKENDS.items():
+        try:
+            backend = backend_class()
+        except ImportError:
+            results[f"jwt {name} decode"] = summarize([])
+            continue
+        results[f"jwt {name} decode"] = summarize(
+            Timer().measure_sync(lambda: backend.decode(token, key, algorithm), number).samples)
+        tokens = TokenCache(backend, key, algorithm)
+        results[f"jwt {name} decode, cached"] = summarize(
+            Timer().measure_sync(lambda: tokens.decode(token), number).samples)
+
+    user = CachedUser(id=1, username="bench", email="bench@example.com", created_at=datetime.now(),
+                      confirmed=True, avatar=None)
+    auth_service.user_cache.local.set(user.email, user, ttl=3600)
+    db = AsyncMock()
+    auth_service.tokens.clear()
+    cached = await Timer().measure(lambda: auth_service.get_current_user(token, db), number)
+    original = auth_service.tokens.decode
+    auth_service.tokens.decode = lambda t: auth_service.jwt.decode(t, key, algorithm)
+    uncached = await Timer().measure(lambda: auth_service.get_current_user(token, db), number)
+    auth_service.tokens.decode = original
+    results["get_current_user, token cache off"] = summarize(uncached.samples)
+    results["get_current_user, token cache on"] = summarize(cached.samples)
+
+    hashed = await password_hasher.hash_password("benchpass")
+    results["bcrypt hash"] = summarize((await Timer().measure(
+        lambda: password_hasher.hash_password("benchpass"), bcrypt_number)).samples)
+    results["bcrypt verify"] = summarize((await Timer().measure(
+        lambda: password_hasher.verify_and_update("benchpass", hashed), bcrypt_number)).samples)
+    return results
+
+
+async def main():
+    print_results(await run())
+    password_hasher.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
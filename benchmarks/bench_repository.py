@@ -0,0 +1,72 @@
+"""
+Repository functions against a seeded database, every call in a new session as
+in a request.
+
+    python -m benchmarks.bench_repository sqlite+aiosqlite:///bench.db
+"""
+import argparse
+import asyncio
+import random
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from benchmarks.report import Timer, print_results, summarize
+from benchmarks.seed import Dataset, seed
+from src.database.db import async_database_url, engine_options
+from src.repository import contacts as repository_contacts
+from src.repository import emails as repository_emails
+from src.repository import users as repository_users
+
+
+async def run(session_factory, dataset: Dataset, number: int = 200) -> dict:
+    """
+    Times the read paths of the repositories for the first seeded user.
+
+    :param session_factory: Sessions on the seeded database.
+    :param dataset: The seeded dataset.
+    :type dataset: Dataset
+    :param number: Calls per case.
+    :type number: int
+    :return: The statistics of every case.
+    :rtype: dict
+    """
+    email, contact_ids = next(iter(dataset.accounts.items()))
+    async with session_factory() as db:
+        user = await repository_users.get_user_by_email(email, db)
+    rng = random.Random(dataset.seed)
+    cases = {
+        "repository.get_user_by_email": lambda db: repository_users.get_user_by_email(email, db),
+        "repository.get_contacts limit=100": lambda db: repository_contacts.get_contacts(0, 100, user, db),
+        "repository.get_contact": lambda db: repository_contacts.get_contact(rng.choice(contact_ids), user, db),
+        "repository.search_contacts": lambda db: repository_contacts.search_contacts("logan", 20, user, db),
+        "repository.get_upcoming_birthdays": lambda db: repository_contacts.get_upcoming_birthdays(30, 100, user, db),
+        "repository.get_emails limit=100": lambda db: repository_emails.get_emails(0, 100, user, db),
+    }
+    results = {}
+    for name, case in cases.items():
+        async def call():
+            async with session_factory() as db:
+                await case(db)
+
+        results[name] = summarize((await Timer().measure(call, number)).samples)
+    return results
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("url")
+    parser.add_argument("--users", type=int, default=1)
+    parser.add_argument("--contacts", type=int, default=1000)
+    parser.add_argument("--emails", type=int, default=2)
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+    url = async_database_url(args.url)
+    engine = create_async_engine(url, **engine_options(url))
+    dataset = await seed(engine, Dataset(args.users, args.contacts, args.emails))
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+    print_results(await run(session_factory, dataset, args.number))
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,83 @@
+"""
+A page of contacts through the validated ORM path and through the column-tuple
+path of the list endpoints, with and without the query.
+
+    python -m benchmarks.bench_serialization sqlite+aiosqlite:///bench.db --limit 100
+"""
+import argparse
+import asyncio
+import json
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import parse_obj_as
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from benchmarks.report import Timer, print_results, summarize
+from benchmarks.seed import Dataset, seed
+from src.database.db import async_database_url, engine_options
+from src.repository import contacts as repository_contacts
+from src.repository import users as repository_users
+from src.schemas import ContactResponse
+from src.services.cache import dumps_json
+
+
+def validated(contacts) -> bytes:
+    return json.dumps(jsonable_encoder(parse_obj_as(List[ContactResponse], contacts)), separators=(",", ":")).encode()
+
+
+async def run(session_factory, dataset: Dataset, number: int = 200, limit: int = 100) -> dict:
+    """
+    Times one page of ``limit`` contacts of the first seeded user.
+
+    :param session_factory: Sessions on the seeded database.
+    :param dataset: The seeded dataset.
+    :type dataset: Dataset
+    :param number: Calls per case.
+    :type number: int
+    :param limit: The page size.
+    :type limit: int
+    :return: The statistics of every case.
+    :rtype: dict
+    """
+    email = next(iter(dataset.accounts))
+    async with session_factory() as db:
+        user = await repository_users.get_user_by_email(email, db)
+        contacts = await repository_contacts.get_contacts(0, limit, user, db)
+        rows = await repository_contacts.get_contact_rows(0, limit, user, db)
+
+    async def orm_page():
+        async with session_factory() as db:
+            validated(await repository_contacts.get_contacts(0, limit, user, db))
+
+    async def rows_page():
+        async with session_factory() as db:
+            dumps_json(await repository_contacts.get_contact_rows(0, limit, user, db))
+
+    return {
+        f"serialize {limit} contacts, pydantic": summarize(
+            Timer().measure_sync(lambda: validated(contacts), number).samples),
+        f"serialize {limit} contacts, rows": summarize(Timer().measure_sync(lambda: dumps_json(rows), number).samples),
+        f"list {limit} contacts, orm + pydantic": summarize((await Timer().measure(orm_page, number)).samples),
+        f"list {limit} contacts, rows": summarize((await Timer().measure(rows_page, number)).samples),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("url")
+    parser.add_argument("--contacts", type=int, default=1000)
+    parser.add_argument("--emails", type=int, default=2)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+    url = async_database_url(args.url)
+    engine = create_async_engine(url, **engine_options(url))
+    dataset = await seed(engine, Dataset(1, args.contacts, args.emails))
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+    print_results(await run(session_factory, dataset, args.number, args.limit))
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,129 @@
+"""
+HTTP load scenario against the in-process ASGI app.
+
+Every virtual user logs in, then repeatedly lists contacts, reads one, creates one
+and updates it. Requests go through the whole middleware and dependency stack over
+httpx's ASGI transport, without sockets. Redis is replaced by fakeredis unless a
+Redis URL is given, and the rate limits are lifted.
+
+    python -m benchmarks.load sqlite+aiosqlite:///bench.db --concurrency 10 --iterations 50
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import defaultdict
+from datetime import date
+
+import httpx
+from fakeredis import FakeAsyncRedis
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from benchmarks.report import print_results, summarize
+from benchmarks.seed import PASSWORD, Dataset, seed
+from main import app
+from src.database.db import async_database_url, engine_options, get_db, get_read_db, get_read_session_factory, \
+    get_session_factory
+from src.services.auth import auth_service
+from src.services.cache import response_cache
+from src.services.metrics import InstrumentedRedis
+from src.services.rate_limit import rate_limiter
+
+
+def configure(session_factory, redis_url: str | None = None) -> None:
+    """
+    Points the app at the benchmark database and at Redis or fakeredis.
+    """
+
+    async def override_get_db():
+        async with session_factory() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
+    app.dependency_overrides[get_session_factory] = lambda: session_factory
+    app.dependency_overrides[get_read_session_factory] = lambda: session_factory
+    r = InstrumentedRedis.from_url(redis_url) if redis_url else FakeAsyncRedis()
+    auth_service.user_cache.r = r
+    auth_service.sessions.r = r
+    response_cache.r = r
+    rate_limiter.r = r
+    rate_limiter.limits = {}
+
+
+async def virtual_user(client: httpx.AsyncClient, email: str, contact_ids: list, iterations: int,
+                       rng: random.Random, timings: dict, errors: dict) -> None:
+    async def request(name: str, method: str, url: str, **kwargs) -> httpx.Response:
+        started = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        timings[name].append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            errors[f"{name} {response.status_code}"] += 1
+        return response
+
+    response = await request("login", "POST", "/api/auth/login", data={"username": email, "password": PASSWORD})
+    client.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+    for _ in range(iterations):
+        await request("list", "GET", "/api/contacts/", params={"limit": 100})
+        await request("get", "GET", f"/api/contacts/{rng.choice(contact_ids)}")
+        body = {"name": "Bench", "surname": "Mark", "birthday": date(1990, 1, rng.randint(1, 28)).isoformat(),
+                "description": "created by the load scenario", "emails": []}
+        response = await request("create", "POST", "/api/contacts/", json=body)
+        if response.status_code == 200:
+            body["description"] = "updated by the load scenario"
+            await request("update", "PUT", f"/api/contacts/{response.json()['id']}", json=body)
+
+
+async def run(dataset: Dataset, concurrency: int = 10, iterations: int = 20) -> dict:
+    """
+    Runs ``concurrency`` virtual users over the seeded accounts, round-robin.
+
+    :param dataset: The seeded dataset.
+    :type dataset: Dataset
+    :param concurrency: Virtual users running at once.
+    :type concurrency: int
+    :param iterations: Scenario iterations per virtual user.
+    :type iterations: int
+    :return: The statistics of every operation and of all requests, and the error counts.
+    :rtype: dict
+    """
+    timings, errors = defaultdict(list), defaultdict(int)
+    accounts = list(dataset.accounts.items())
+    clients = [httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+               for _ in range(concurrency)]
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        virtual_user(client, *accounts[i % len(accounts)], iterations, random.Random(i), timings, errors)
+        for i, client in enumerate(clients)))
+    wall_time = time.perf_counter() - started
+    for client in clients:
+        await client.aclose()
+    results = {f"http {name}": summarize(samples, wall_time) for name, samples in timings.items()}
+    results["http all"] = summarize([sample for samples in timings.values() for sample in samples], wall_time)
+    return {"results": results, "errors": dict(errors)}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("url")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--contacts", type=int, default=1000)
+    parser.add_argument("--emails", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--redis-url")
+    args = parser.parse_args()
+    url = async_database_url(args.url)
+    engine = create_async_engine(url, **engine_options(url))
+    dataset = await seed(engine, Dataset(args.users, args.contacts, args.emails))
+    configure(async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False),
+              args.redis_url)
+    load = await run(dataset, args.concurrency, args.iterations)
+    print_results(load["results"])
+    if load["errors"]:
+        print("errors:", load["errors"])
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,118 @@
+"""
+Latency statistics and the JSON report shared by the benchmarks.
+
+A report holds one entry per measured case with its throughput and latency
+percentiles, so two reports (e.g. of two commits) can be compared case by case:
+
+    python -m benchmarks.report baseline.json report.json
+"""
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+
+class Timer:
+    """
+    Collects the latency of every call of a case.
+    """
+
+    def __init__(self):
+        self.samples = []
+
+    async def measure(self, func, number: int) -> "Timer":
+        for _ in range(number):
+            started = time.perf_counter()
+            await func()
+            self.samples.append(time.perf_counter() - started)
+        return self
+
+    def measure_sync(self, func, number: int) -> "Timer":
+        for _ in range(number):
+            started = time.perf_counter()
+            func()
+            self.samples.append(time.perf_counter() - started)
+        return self
+
+    def add(self, elapsed: float) -> None:
+        self.samples.append(elapsed)
+
+
+def summarize(samples: list, wall_time: float | None = None) -> dict:
+    """
+    Summarizes latencies in seconds as throughput and milliseconds percentiles.
+
+    :param samples: The latency of every call, in seconds.
+    :type samples: list
+    :param wall_time: The time the calls took together, for concurrent calls. Defaults to their sum.
+    :type wall_time: float | None
+    :return: count, throughput (calls per second), mean_ms, p50_ms, p95_ms and p99_ms.
+    :rtype: dict
+    """
+    if not samples:
+        return {"count": 0}
+    wall_time = wall_time if wall_time is not None else sum(samples)
+    if len(samples) > 1:
+        cuts = statistics.quantiles(samples, n=100, method="inclusive")
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = samples[0]
+    return {
+        "count": len(samples),
+        "throughput": round(len(samples) / wall_time, 2) if wall_time else None,
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+        "p50_ms": round(p50 * 1000, 3),
+        "p95_ms": round(p95 * 1000, 3),
+        "p99_ms": round(p99 * 1000, 3),
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def new_report(**context) -> dict:
+    return {
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        **context,
+        "results": {},
+    }
+
+
+def print_results(results: dict) -> None:
+    print(f"{'case':<40}{'count':>8}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, stats in results.items():
+        if not stats.get("count"):
+            print(f"{name:<40}{'n/a':>8}")
+            continue
+        print(f"{name:<40}{stats['count']:>8}{stats['throughput']:>10.1f}{stats['p50_ms']:>10.2f}"
+              f"{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}")
+
+
+def compare(baseline: dict, report: dict) -> None:
+    """
+    Prints the relative change of every case present in both reports.
+    """
+    print(f"{baseline.get('commit')} -> {report.get('commit')}")
+    print(f"{'case':<40}{'ops/s':>10}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name, stats in report["results"].items():
+        before = baseline["results"].get(name)
+        if not before or not before.get("count") or not stats.get("count"):
+            continue
+        changes = [f"{(stats[key] - before[key]) / before[key] * 100:+.1f}%" if before[key] else "n/a"
+                   for key in ("throughput", "p50_ms", "p95_ms", "p99_ms")]
+        print(f"{name:<40}" + "".join(f"{change:>10}" for change in changes))
+
+
+if __name__ == "__main__":
+    with open(sys.argv[1]) as f1, open(sys.argv[2]) as f2:
+        compare(json.load(f1), json.load(f2))
@@ -0,0 +1,114 @@
+"""
+Seeds a database with N users, M contacts per user and K emails per contact.
+
+The data is generated from a fixed random seed, so two runs with the same sizes
+produce the same rows. Every user can log in with ``PASSWORD``.
+
+    python -m benchmarks.seed sqlite+aiosqlite:///bench.db --users 10 --contacts 1000 --emails 2
+"""
+import argparse
+import asyncio
+import random
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from src.conf.config import settings
+from src.database.db import async_database_url
+from src.database.models import Base, Contact, Email, User, contacts_emails
+from src.services.passwords import _hash
+
+PASSWORD = "benchpass"
+NAMES = ["Logan", "Wade", "Peter", "Natasha", "Wanda", "Steve", "Tony", "Carol", "Bruce", "Jean", "Scott", "Ororo"]
+SURNAMES = ["Howlett", "Wilson", "Parker", "Romanoff", "Maximoff", "Rogers", "Stark", "Danvers", "Banner", "Grey"]
+WORDS = ["met", "at", "the", "conference", "old", "friend", "colleague", "neighbour", "from", "school", "gym", "club"]
+
+
+@dataclass
+class Dataset:
+    users: int
+    contacts: int
+    emails: int
+    seed: int = 0
+    # filled in by seed(): email of every user and the ids of their contacts
+    accounts: dict = field(default_factory=dict)
+
+
+def _chunks(rows: list, size: int):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def _contact(rng: random.Random, user_id: int) -> dict:
+    return {
+        "name": rng.choice(NAMES),
+        "surname": rng.choice(SURNAMES),
+        "birthday": date(1950, 1, 1) + timedelta(days=rng.randrange(20000)),
+        "description": " ".join(rng.choices(WORDS, k=rng.randint(3, 12))),
+        "user_id": user_id,
+    }
+
+
+async def seed(engine: AsyncEngine, dataset: Dataset, reset: bool = True, chunk_size: int = 1000) -> Dataset:
+    """
+    Creates the tables and inserts the dataset with batched INSERT ... RETURNING.
+
+    :param engine: The engine of the benchmark database.
+    :type engine: AsyncEngine
+    :param dataset: The sizes to generate.
+    :type dataset: Dataset
+    :param reset: Drop the tables first.
+    :type reset: bool
+    :param chunk_size: Rows per INSERT statement.
+    :type chunk_size: int
+    :return: The dataset with the generated accounts.
+    :rtype: Dataset
+    """
+    rng = random.Random(dataset.seed)
+    # hashed once with the configured cost, logins then cost what they cost in production
+    password = _hash(PASSWORD, settings.bcrypt_rounds)
+    async with engine.begin() as conn:
+        if reset:
+            await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        users = [{"username": f"bench{i}", "email": f"bench{i}@example.com", "password": password,
+                  "confirmed": True} for i in range(dataset.users)]
+        user_ids = (await conn.execute(insert(User).returning(User.id, sort_by_parameter_order=True),
+                                       users)).scalars().all()
+        for user_id, user in zip(user_ids, users):
+            contact_ids = []
+            for chunk in _chunks([_contact(rng, user_id) for _ in range(dataset.contacts)], chunk_size):
+                contact_ids += (await conn.execute(insert(Contact).returning(Contact.id, sort_by_parameter_order=True),
+                                                   chunk)).scalars().all()
+            emails = [{"email": f"c{contact_id}e{k}@b.io", "user_id": user_id}
+                      for contact_id in contact_ids for k in range(dataset.emails)]
+            email_ids = []
+            for chunk in _chunks(emails, chunk_size):
+                email_ids += (await conn.execute(insert(Email).returning(Email.id, sort_by_parameter_order=True),
+                                                 chunk)).scalars().all()
+            links = [{"contact_id": contact_ids[i // dataset.emails], "email_id": email_id}
+                     for i, email_id in enumerate(email_ids)]
+            for chunk in _chunks(links, chunk_size):
+                await conn.execute(insert(contacts_emails), chunk)
+            dataset.accounts[user["email"]] = contact_ids
+    return dataset
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("url", help="database URL, e.g. sqlite+aiosqlite:///bench.db or postgresql://...")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--contacts", type=int, default=1000, help="contacts per user")
+    parser.add_argument("--emails", type=int, default=2, help="emails per contact")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    engine = create_async_engine(async_database_url(args.url))
+    await seed(engine, Dataset(args.users, args.contacts, args.emails, args.seed))
+    await engine.dispose()
+    print(f"seeded {args.users} users x {args.contacts} contacts x {args.emails} emails, password {PASSWORD!r}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,12 +1,18 @@
+import asyncio
+
 import uvicorn
 from fastapi import FastAPI, Depends
-import redis.asyncio as redis
+from fastapi.staticfiles import StaticFiles
 
 from src.conf.config import settings
-from src.routes import contacts, emails, auth
+from src.database.db import engine, pool_metrics, replicas
+from src.routes import contacts, emails, auth, users
+from src.services.passwords import password_hasher
+from src.services.email import mail_sender
+from src.services.avatars import avatar_processor
+from src.services.metrics import MetricsMiddleware, metrics_response, register_pool_metrics
+from src.services.profiling import ProfilingMiddleware
 
-from fastapi_limiter import FastAPILimiter
-from fastapi_limiter.depends import RateLimiter
 from fastapi.middleware.cors import CORSMiddleware
 
 app = FastAPI()
@@ -23,16 +29,52 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(MetricsMiddleware)
+register_pool_metrics(pool_metrics)
+
+if settings.profile_requests:
+    app.add_middleware(ProfilingMiddleware, slow_ms=settings.profile_slow_ms,
+                       slow_query_ms=settings.profile_slow_query_ms, sample_every=settings.profile_sample_every,
+                       sample_interval=settings.profile_sample_interval, directory=settings.profile_dir)
+
 app.include_router(emails.router, prefix='/api')
 app.include_router(contacts.router, prefix='/api')
 app.include_router(auth.router, prefix='/api')
 app.include_router(users.router, prefix='/api')
 
+if settings.avatar_storage == "local":
+    app.mount(settings.avatar_base_url, StaticFiles(directory=settings.avatar_local_dir, check_dir=False),
+              name="avatars")
+
 @app.on_event("startup")
 async def startup():
-    r = await redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0, encoding="utf-8",
-                          decode_responses=True)
-    await FastAPILimiter.init(r)
+    await mail_sender.start()
+    if replicas:
+        app.state.replica_health = asyncio.create_task(
+            replicas.run_health_checks(settings.db_replica_health_interval))
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    if replicas:
+        app.state.replica_health.cancel()
+        await replicas.dispose()
+    await engine.dispose()
+    await mail_sender.close()
+    password_hasher.shutdown()
+    if avatar_processor is not None:
+        avatar_processor.shutdown()
+
+
+@app.get("/metrics", include_in_schema=False)
+def read_metrics():
+    return metrics_response()
+
+
+@app.get("/metrics/db-pool")
+def read_pool_metrics():
+    return pool_metrics.snapshot()
+
 
 @app.get("/")
 def read_root():
@@ -0,0 +1,43 @@
+"""Contacts emails association and birthday
+
+Revision ID: 5f0c2a7d9b13
+Revises: 1a714c0e5a21
+Create Date: 2026-10-18 10:12:44.512038
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5f0c2a7d9b13'
+down_revision: Union[str, None] = '1a714c0e5a21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('contacts_emails',
+    sa.Column('contact_id', sa.Integer(), nullable=False),
+    sa.Column('email_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['contact_id'], ['contacts.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['email_id'], ['emails.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('contact_id', 'email_id')
+    )
+    op.execute('INSERT INTO contacts_emails (contact_id, email_id) '
+               'SELECT id, email_id FROM contacts WHERE email_id IS NOT NULL')
+    with op.batch_alter_table('contacts') as batch_op:
+        batch_op.drop_column('email_id')
+        batch_op.add_column(sa.Column('birthday', sa.Date(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('contacts') as batch_op:
+        batch_op.drop_column('birthday')
+        batch_op.add_column(sa.Column('email_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('contacts_email_id_fkey', 'emails', ['email_id'], ['id'])
+    op.execute('UPDATE contacts SET email_id = '
+               '(SELECT MIN(email_id) FROM contacts_emails WHERE contacts_emails.contact_id = contacts.id)')
+    op.drop_table('contacts_emails')
@@ -0,0 +1,28 @@
+"""User id, id indexes for keyset pagination
+
+Revision ID: 8d41b6e0c3a2
+Revises: 5f0c2a7d9b13
+Create Date: 2026-10-18 11:03:27.190446
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d41b6e0c3a2'
+down_revision: Union[str, None] = '5f0c2a7d9b13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_contacts_user_id_id', 'contacts', ['user_id', 'id'], unique=False)
+    op.create_index('ix_emails_user_id_id', 'emails', ['user_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_emails_user_id_id', table_name='emails')
+    op.drop_index('ix_contacts_user_id_id', table_name='contacts')
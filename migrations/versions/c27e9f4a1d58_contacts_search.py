@@ -0,0 +1,59 @@
+"""Contacts full-text search
+
+Revision ID: c27e9f4a1d58
+Revises: 8d41b6e0c3a2
+Create Date: 2026-10-18 12:41:09.337215
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c27e9f4a1d58'
+down_revision: Union[str, None] = '8d41b6e0c3a2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute("ALTER TABLE contacts ADD COLUMN search_vector tsvector GENERATED ALWAYS AS "
+                   "(to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(surname, '') || ' ' "
+                   "|| coalesce(description, ''))) STORED")
+        op.execute("CREATE INDEX ix_contacts_search_vector ON contacts USING gin (search_vector)")
+        op.execute("CREATE INDEX ix_contacts_name_trgm ON contacts USING gin (name gin_trgm_ops)")
+        op.execute("CREATE INDEX ix_contacts_surname_trgm ON contacts USING gin (surname gin_trgm_ops)")
+        op.execute("CREATE INDEX ix_emails_email_trgm ON emails USING gin (email gin_trgm_ops)")
+    elif op.get_bind().dialect.name == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE contacts_fts USING fts5(name, surname, description, "
+                   "content='contacts', content_rowid='id')")
+        op.execute("CREATE TRIGGER contacts_fts_ai AFTER INSERT ON contacts BEGIN "
+                   "INSERT INTO contacts_fts(rowid, name, surname, description) "
+                   "VALUES (new.id, new.name, new.surname, new.description); END")
+        op.execute("CREATE TRIGGER contacts_fts_ad AFTER DELETE ON contacts BEGIN "
+                   "INSERT INTO contacts_fts(contacts_fts, rowid, name, surname, description) "
+                   "VALUES ('delete', old.id, old.name, old.surname, old.description); END")
+        op.execute("CREATE TRIGGER contacts_fts_au AFTER UPDATE ON contacts BEGIN "
+                   "INSERT INTO contacts_fts(contacts_fts, rowid, name, surname, description) "
+                   "VALUES ('delete', old.id, old.name, old.surname, old.description); "
+                   "INSERT INTO contacts_fts(rowid, name, surname, description) "
+                   "VALUES (new.id, new.name, new.surname, new.description); END")
+        op.execute("INSERT INTO contacts_fts(contacts_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_emails_email_trgm', table_name='emails')
+        op.drop_index('ix_contacts_surname_trgm', table_name='contacts')
+        op.drop_index('ix_contacts_name_trgm', table_name='contacts')
+        op.drop_index('ix_contacts_search_vector', table_name='contacts')
+        op.drop_column('contacts', 'search_vector')
+    elif op.get_bind().dialect.name == 'sqlite':
+        op.execute("DROP TRIGGER contacts_fts_au")
+        op.execute("DROP TRIGGER contacts_fts_ad")
+        op.execute("DROP TRIGGER contacts_fts_ai")
+        op.execute("DROP TABLE contacts_fts")
@@ -0,0 +1,33 @@
+"""Contacts birthday key
+
+Revision ID: e5a3f19c8b07
+Revises: c27e9f4a1d58
+Create Date: 2026-10-18 13:28:52.604117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a3f19c8b07'
+down_revision: Union[str, None] = 'c27e9f4a1d58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    birthday = sa.column('birthday', sa.Date())
+    # SQLite can only add VIRTUAL generated columns with ALTER TABLE, they are indexable as well
+    persisted = op.get_bind().dialect.name != 'sqlite'
+    op.add_column('contacts', sa.Column('birthday_key', sa.Integer(),
+                                        sa.Computed(sa.extract('month', birthday) * 100 + sa.extract('day', birthday),
+                                                    persisted=persisted)))
+    op.create_index('ix_contacts_user_id_birthday_key', 'contacts', ['user_id', 'birthday_key'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_user_id_birthday_key', table_name='contacts')
+    op.drop_column('contacts', 'birthday_key')
@@ -1,17 +1,69 @@
+from typing import Dict, List
+
 from pydantic import BaseSettings
 
 
 class Settings(BaseSettings):
     sqlalchemy_database_url: str
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    db_connect_timeout: int = 10
+    db_statement_timeout: int = 0
+    sqlalchemy_replica_urls: List[str] = []
+    db_replica_health_interval: float = 5
+    db_replica_max_lag: float = 5
     secret_key: str
     algorithm: str
+    jwt_backend: str = 'jose'
+    jwt_cache_size: int = 4096
+    refresh_token_ttl: int = 7 * 24 * 3600
     mail_username: str
     mail_password: str
     mail_from: str
     mail_port: int
     mail_server: str
+    mail_ssl_tls: bool = True
+    mail_starttls: bool = False
+    mail_validate_certs: bool = True
+    mail_pool_size: int = 2
+    mail_keepalive: int = 60
+    mail_queue_batch: int = 50
+    mail_max_attempts: int = 5
+    mail_retry_backoff: int = 30
+    mail_dedupe_window: int = 300
+    mail_worker_heartbeat: int = 60
     redis_host: str = 'localhost'
     redis_port: int = 6379
+    user_cache_size: int = 1024
+    user_cache_ttl: int = 900
+    user_cache_local_ttl: int = 30
+    response_cache_size: int = 1024
+    response_cache_ttl: int = 300
+    response_cache_local_ttl: int = 30
+    rate_limits: Dict[str, str] = {'contacts:list': '10/60'}
+    rate_limit_lease_fraction: float = 0.2
+    rate_limit_fail_open: bool = True
+    profile_requests: bool = False
+    profile_slow_ms: float = 500
+    profile_slow_query_ms: float = 100
+    profile_sample_every: int = 0
+    profile_sample_interval: float = 0.005
+    profile_dir: str = 'profiles'
+    bcrypt_rounds: int = 12
+    password_hash_executor: str = 'process'
+    password_hash_workers: int = 2
+    password_hash_queue: int = 32
+    bulk_chunk_size: int = 1000
+    avatar_storage: str = 'cloudinary'
+    avatar_local_dir: str = 'static/avatars'
+    avatar_base_url: str = '/static/avatars'
+    avatar_max_bytes: int = 5 * 1024 * 1024
+    avatar_resize: bool = False
+    avatar_size: int = 250
+    avatar_workers: int = 2
     cloudinary_name: str
     cloudinary_api_key: str
     cloudinary_api_secret: str
@@ -1,31 +1,195 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.ext.declarative import declarative_base
+import bisect
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool
 
 from src.conf.config import settings
+from src.database.replicas import RecentWrites, ReplicaSet, RoutingSession
+from src.services.metrics import InstrumentedRedis, instrument_engine
 
 #SQLALCHEMY_DATABASE_URL = "sqlite:///./sql_app12.db"
 
 SQLALCHEMY_DATABASE_URL = settings.sqlalchemy_database_url
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def async_database_url(url: str) -> str:
+    """
+    Maps a plain database URL onto the matching asyncio driver.
+
+    Alembic keeps using the synchronous URL from the settings, the application
+    talks to the same database through asyncpg (Postgres) or aiosqlite (SQLite).
+
+    :param url: The database URL from the settings.
+    :type url: str
+    :return: The URL with an asyncio driver.
+    :rtype: str
+    """
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None or url.drivername == driver:
+        return url.render_as_string(hide_password=False)
+    return url.set(drivername=driver).render_as_string(hide_password=False)
+
+
+class PoolMetrics:
+    """
+    Checkout statistics of a connection pool: how long requests waited for a
+    connection, how many waits timed out, and the current pool occupancy.
+    """
+
+    BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30)
+
+    def __init__(self):
+        self.pool: Pool | None = None
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.wait_buckets = [0] * (len(self.BUCKETS) + 1)
+
+    def observe(self, seconds: float, timed_out: bool = False) -> None:
+        if timed_out:
+            self.timeouts += 1
+        else:
+            self.checkouts += 1
+        self.wait_seconds_total += seconds
+        self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+        self.wait_buckets[bisect.bisect_left(self.BUCKETS, seconds)] += 1
+
+    def snapshot(self) -> dict:
+        """
+        Returns the counters together with the pool size, the connections in use
+        and the overflow connections opened beyond the pool size.
+
+        :return: The pool metrics.
+        :rtype: dict
+        """
+        pool = self.pool
+        return {
+            "size": pool.size() if pool is not None else 0,
+            "in_use": pool.checkedout() if pool is not None else 0,
+            "idle": pool.checkedin() if pool is not None else 0,
+            "overflow": max(pool.overflow(), 0) if pool is not None else 0,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_seconds_total": self.wait_seconds_total,
+            "wait_seconds_max": self.wait_seconds_max,
+            "wait_seconds_buckets": dict(zip([*map(str, self.BUCKETS), "+Inf"], self.wait_buckets)),
+        }
+
+
+class MeteredQueuePool(AsyncAdaptedQueuePool):
+    """
+    Queue pool that records checkout wait times into ``metrics``.
+    """
 
-Base = declarative_base()
-Base.metadata.create_all(bind=engine)
+    metrics: PoolMetrics
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics.pool = self
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.metrics.observe(time.perf_counter() - started, timed_out=True)
+            raise
+        self.metrics.observe(time.perf_counter() - started)
+        return connection
+
+
+def metered_pool(metrics: PoolMetrics) -> type[MeteredQueuePool]:
+    # The class carries the metrics so pools recreated by engine.dispose() keep reporting into them
+    return type("MeteredQueuePool", (MeteredQueuePool,), {"metrics": metrics})
+
+
+def engine_options(url: str, metrics: PoolMetrics | None = None) -> dict:
+    """
+    Builds the engine keyword arguments for a database URL from the pool settings.
+
+    Pool sizing applies per process, so with several uvicorn workers the database
+    sees up to ``workers * (db_pool_size + db_max_overflow)`` connections.
+
+    :param url: The database URL.
+    :type url: str
+    :param metrics: Where to record pool checkouts, or None to not record them.
+    :type metrics: PoolMetrics | None
+    :return: The keyword arguments for create_async_engine.
+    :rtype: dict
+    """
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend == "sqlite":
+        options = {"connect_args": {"timeout": settings.db_connect_timeout}}
+        if url.database in (None, "", ":memory:"):
+            # an in-memory database lives in a single connection, there is no pool to size
+            return options
+    elif backend == "postgresql":
+        server_settings = {"application_name": "contacts-api"}
+        if settings.db_statement_timeout:
+            server_settings["statement_timeout"] = str(settings.db_statement_timeout)
+        options = {"connect_args": {"timeout": settings.db_connect_timeout, "server_settings": server_settings}}
+    else:
+        options = {}
+    options.update(pool_size=settings.db_pool_size, max_overflow=settings.db_max_overflow,
+                   pool_timeout=settings.db_pool_timeout, pool_recycle=settings.db_pool_recycle,
+                   pool_pre_ping=settings.db_pool_pre_ping)
+    if metrics is not None:
+        options["poolclass"] = metered_pool(metrics)
+    return options
+
+
+pool_metrics = PoolMetrics()
+engine = create_async_engine(async_database_url(SQLALCHEMY_DATABASE_URL),
+                             **engine_options(SQLALCHEMY_DATABASE_URL, pool_metrics))
+SessionLocal = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+replicas = ReplicaSet([create_async_engine(async_database_url(url), **engine_options(url))
+                       for url in settings.sqlalchemy_replica_urls])
+for _engine in (engine, *replicas.engines):
+    instrument_engine(_engine)
+ReadSessionLocal = async_sessionmaker(engine, class_=AsyncSession, sync_session_class=RoutingSession,
+                                      replicas=replicas, autoflush=False, expire_on_commit=False)
+recent_writes = RecentWrites(InstrumentedRedis(host=settings.redis_host, port=settings.redis_port, db=0),
+                             ttl=settings.db_replica_max_lag, enabled=bool(replicas))
 
 
 # Dependency
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
+async def get_read_db():
+    """
+    Dependency for read-only endpoints: SELECTs go to a healthy replica when
+    ``sqlalchemy_replica_urls`` are configured, and to the primary after any write
+    of the session or, see ``recent_writes``, of the current user.
+    """
+    async with ReadSessionLocal() as db:
+        yield db
+
 
+def get_session_factory():
+    """
+    Dependency for endpoints that need a session outliving the request handler,
+    e.g. streaming responses, which open and close their own session.
+    """
+    return SessionLocal
 
 
+def get_read_session_factory():
+    """
+    Like get_session_factory, for streaming reads that may be served by a replica.
+    """
+    return ReadSessionLocal
@@ -1,19 +1,33 @@
-from sqlalchemy import Column, Integer, String, Date, Boolean, UniqueConstraint, DateTime, func
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Date, Boolean, UniqueConstraint, DateTime, func, Table, Index, DDL, event, \
+    Computed, extract
+from sqlalchemy.orm import relationship, backref
 from sqlalchemy.sql.schema import ForeignKey
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
 
+contacts_emails = Table(
+    "contacts_emails",
+    Base.metadata,
+    Column("contact_id", Integer, ForeignKey("contacts.id", ondelete="CASCADE"), primary_key=True),
+    Column("email_id", Integer, ForeignKey("emails.id", ondelete="CASCADE"), primary_key=True),
+)
+
 class Contact(Base):
     __tablename__ = "contacts"
+    __table_args__ = (
+        Index('ix_contacts_user_id_id', 'user_id', 'id'),
+        Index('ix_contacts_user_id_birthday_key', 'user_id', 'birthday_key'),
+    )
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(50), nullable=False)
     surname = Column(String(100))
-    birthday = Date
+    birthday = Column(Date)
+    # month * 100 + day, e.g. 1231 for December 31, for indexed upcoming-birthday ranges
+    birthday_key = Column(Integer, Computed(extract('month', birthday) * 100 + extract('day', birthday), persisted=True))
     description = Column(String(250))
-    email_id = Column(Integer, ForeignKey("emails.id"), nullable=True)
-    emails = relationship("Email", backref="contacts")
+    emails = relationship("Email", secondary=contacts_emails, lazy="raise",
+                          backref=backref("contacts", lazy="raise", passive_deletes=True))
     user_id = Column('user_id', ForeignKey('users.id', ondelete='CASCADE'), default=None)
     user = relationship('User', backref="contacts")
 
@@ -23,6 +37,7 @@ class Email(Base):
     __tablename__ = "emails"
     __table_args__ = (
         UniqueConstraint('email', 'user_id', name='unique_email_user'),
+        Index('ix_emails_user_id_id', 'user_id', 'id'),
     )
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String(50), unique=True, index=True, nullable=False)
@@ -41,3 +56,44 @@ class User(Base):
     avatar = Column(String(255), nullable=True)
     refresh_token = Column(String(255), nullable=True)
 
+
+# Full-text search. The search structures are dialect specific and not mapped, they are
+# created next to the tables here (for create_all) and by the search migration.
+POSTGRES_SEARCH_DDL = {
+    Contact.__table__: [
+        "ALTER TABLE contacts ADD COLUMN search_vector tsvector GENERATED ALWAYS AS "
+        "(to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(surname, '') || ' ' "
+        "|| coalesce(description, ''))) STORED",
+        "CREATE INDEX ix_contacts_search_vector ON contacts USING gin (search_vector)",
+        "CREATE INDEX ix_contacts_name_trgm ON contacts USING gin (name gin_trgm_ops)",
+        "CREATE INDEX ix_contacts_surname_trgm ON contacts USING gin (surname gin_trgm_ops)",
+    ],
+    Email.__table__: [
+        "CREATE INDEX ix_emails_email_trgm ON emails USING gin (email gin_trgm_ops)",
+    ],
+}
+
+SQLITE_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS contacts_fts USING fts5(name, surname, description, "
+    "content='contacts', content_rowid='id')",
+    "CREATE TRIGGER contacts_fts_ai AFTER INSERT ON contacts BEGIN "
+    "INSERT INTO contacts_fts(rowid, name, surname, description) VALUES (new.id, new.name, new.surname, new.description); "
+    "END",
+    "CREATE TRIGGER contacts_fts_ad AFTER DELETE ON contacts BEGIN "
+    "INSERT INTO contacts_fts(contacts_fts, rowid, name, surname, description) "
+    "VALUES ('delete', old.id, old.name, old.surname, old.description); "
+    "END",
+    "CREATE TRIGGER contacts_fts_au AFTER UPDATE ON contacts BEGIN "
+    "INSERT INTO contacts_fts(contacts_fts, rowid, name, surname, description) "
+    "VALUES ('delete', old.id, old.name, old.surname, old.description); "
+    "INSERT INTO contacts_fts(rowid, name, surname, description) VALUES (new.id, new.name, new.surname, new.description); "
+    "END",
+]
+
+event.listen(Base.metadata, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"))
+for table, statements in POSTGRES_SEARCH_DDL.items():
+    for statement in statements:
+        event.listen(table, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+for statement in SQLITE_SEARCH_DDL:
+    event.listen(Contact.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(Contact.__table__, "before_drop", DDL("DROP TABLE IF EXISTS contacts_fts").execute_if(dialect="sqlite"))
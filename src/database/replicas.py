@@ -0,0 +1,191 @@
+import asyncio
+import logging
+from contextlib import contextmanager
+from typing import List, Sequence
+
+from redis.exceptions import RedisError
+from sqlalchemy import CompoundSelect, Select, event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+
+class ReplicaSet:
+    """
+    Read replicas picked round-robin, skipping the ones that failed their last health check.
+
+    Health checks run ``SELECT 1`` on every replica from a background task, see
+    ``run_health_checks``; a replica that fails is left out until it answers again.
+    """
+
+    def __init__(self, engines: Sequence[AsyncEngine], check_timeout: float = 2):
+        self.engines: List[AsyncEngine] = list(engines)
+        self.healthy: List[bool] = [True] * len(self.engines)
+        self.check_timeout = check_timeout
+        self._next = 0
+
+    def __bool__(self) -> bool:
+        return bool(self.engines)
+
+    def choose(self) -> Engine | None:
+        """
+        Returns the synchronous engine of the next healthy replica, or None if there is none.
+
+        :return: The replica engine.
+        :rtype: Engine | None
+        """
+        for _ in range(len(self.engines)):
+            index = self._next
+            self._next = (self._next + 1) % len(self.engines)
+            if self.healthy[index]:
+                return self.engines[index].sync_engine
+        return None
+
+    async def _ping(self, engine: AsyncEngine) -> bool:
+        try:
+            async with asyncio.timeout(self.check_timeout):
+                async with engine.connect() as conn:
+                    await conn.execute(text("SELECT 1"))
+            return True
+        except Exception as e:
+            logger.warning("replica %s failed its health check: %s", engine.url.render_as_string(), e)
+            return False
+
+    async def check(self) -> List[bool]:
+        """
+        Pings every replica and updates which ones are used.
+
+        :return: The health of each replica.
+        :rtype: List[bool]
+        """
+        self.healthy = list(await asyncio.gather(*(self._ping(engine) for engine in self.engines)))
+        return self.healthy
+
+    async def run_health_checks(self, interval: float) -> None:
+        while True:
+            await self.check()
+            await asyncio.sleep(interval)
+
+    async def dispose(self) -> None:
+        for engine in self.engines:
+            await engine.dispose()
+
+
+class RoutingSession(Session):
+    """
+    Session sending SELECTs to a replica and everything else to the primary (its bind).
+
+    The replica is chosen at the first read and kept for the whole session, so all
+    the queries of a response read the same snapshot. Once the session has flushed,
+    all of its later statements go to the primary too, so a request reads its own
+    writes even after the commit. Locking reads (``with_for_update``) and
+    ``use_primary`` sessions always use the primary.
+    """
+
+    def __init__(self, *args, replicas: ReplicaSet | None = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.replicas = replicas
+
+    def get_bind(self, mapper=None, *, clause=None, **kwargs):
+        primary = super().get_bind(mapper, clause=clause, **kwargs)
+        if not self.replicas or self.info.get("use_primary") or self._flushing:
+            return primary
+        if not isinstance(clause, (Select, CompoundSelect)) or clause._for_update_arg is not None:
+            return primary
+        if "replica" not in self.info:
+            self.info["replica"] = self.replicas.choose()
+        return self.info["replica"] or primary
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _stick_to_primary(session, flush_context):
+    session.info["use_primary"] = True
+
+
+def use_primary(db) -> None:
+    """
+    Sends every further statement of a session to the primary.
+
+    :param db: The database session.
+    :type db: AsyncSession
+    """
+    db.info["use_primary"] = True
+
+
+@contextmanager
+def on_primary(db):
+    """
+    Sends the statements of the block to the primary, e.g. to read a row that is
+    cached afterwards and must not come from a lagging replica.
+
+    :param db: The database session.
+    :type db: AsyncSession
+    """
+    if db.info.get("use_primary"):
+        yield
+        return
+    db.info["use_primary"] = True
+    try:
+        yield
+    finally:
+        db.info.pop("use_primary", None)
+
+
+class RecentWrites:
+    """
+    Remembers for ``ttl`` seconds, about the replication lag, that a user wrote data.
+
+    Reads of such a user go to the primary, so a client sees its own writes in the
+    next requests too, whichever worker serves them. The marker is a Redis key per
+    user; when Redis fails the user is treated as having written. Without replicas
+    nothing is recorded.
+    """
+
+    def __init__(self, r, ttl: float = 5, enabled: bool = True):
+        self.r = r
+        self.ttl = ttl
+        self.enabled = enabled
+
+    async def mark(self, user_id: int) -> None:
+        """
+        Records that a user has just committed a write.
+
+        :param user_id: The id of the user.
+        :type user_id: int
+        """
+        if not self.enabled:
+            return
+        try:
+            await self.r.set(f"rw:{user_id}", 1, px=int(self.ttl * 1000))
+        except RedisError as e:
+            logger.warning("could not record a write of user %s: %s", user_id, e)
+
+    async def recent(self, user_id: int) -> bool:
+        """
+        Tells whether a user wrote within the last ``ttl`` seconds.
+
+        :param user_id: The id of the user.
+        :type user_id: int
+        :return: True if the user's reads should use the primary.
+        :rtype: bool
+        """
+        if not self.enabled:
+            return False
+        try:
+            return bool(await self.r.exists(f"rw:{user_id}"))
+        except RedisError:
+            return True
+
+    async def route(self, db, user_id: int) -> None:
+        """
+        Sends the reads of a session to the primary if the user wrote recently.
+
+        :param db: The database session.
+        :type db: AsyncSession
+        :param user_id: The id of the user.
+        :type user_id: int
+        """
+        if not db.info.get("use_primary") and await self.recent(user_id):
+            use_primary(db)
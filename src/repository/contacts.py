@@ -1,16 +1,38 @@
-from typing import List
+import re
+from datetime import date, timedelta
+from typing import Dict, List, AsyncIterator, Tuple
 
-from sqlalchemy import and_
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, or_, select, insert, update, delete, exists, func, literal_column, literal, table, \
+    column, true
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
-from src.database.models import Contact, Email, User
-from src.schemas import ContactModel
+from src.database.models import Contact, Email, User, contacts_emails
+from src.schemas import ContactModel, ContactPatch
+from src.services.metrics import instrumented
 
 
-async def get_contacts(skip: int, limit: int, user: User, db: Session) -> List[Contact]:
+# FTS5 index of the contacts on SQLite, see SQLITE_SEARCH_DDL in src/database/models.py
+contacts_fts = table("contacts_fts", column("rowid"))
+
+
+def _with_emails(stmt, load_emails: bool = True):
+    # Contact.emails is lazy="raise": every caller states whether it needs the
+    # emails, and if so they are fetched for all rows in one extra SELECT ... IN.
+    if load_emails:
+        return stmt.options(selectinload(Contact.emails))
+    return stmt
+
+
+@instrumented
+async def get_contacts(skip: int, limit: int, user: User, db: AsyncSession, load_emails: bool = True,
+                       after_id: int | None = None) -> List[Contact]:
     """
     Retrieves a list of contacts for a specific user with specified pagination parameters.
 
+    Contacts are ordered by id. With ``after_id`` the page starts right after that
+    contact (keyset pagination on the ``(user_id, id)`` index) and ``skip`` is ignored.
+
     :param skip: The number of contacts to skip.
     :type skip: int
     :param limit: The maximum number of contacts to return.
@@ -18,14 +40,79 @@ async def get_contacts(skip: int, limit: int, user: User, db: Session) -> List[C
     :param user: The user to retrieve contacts for.
     :type user: User
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
+    :param load_emails: Whether to load the emails of the contacts.
+    :type load_emails: bool
+    :param after_id: The id of the last contact of the previous page.
+    :type after_id: int | None
     :return: A list of notes.
     :rtype: List[Note]
     """
-    return db.query(Contact).filter(Contact.user_id == user.id).offset(skip).limit(limit).all()
+    stmt = select(Contact).filter(Contact.user_id == user.id).order_by(Contact.id).limit(limit)
+    if after_id is not None:
+        stmt = stmt.filter(Contact.id > after_id)
+    else:
+        stmt = stmt.offset(skip)
+    stmt = _with_emails(stmt, load_emails)
+    contacts = await db.execute(stmt)
+    return contacts.scalars().all()
+
+
+async def _emails_by_contact(contact_ids: List[int], db: AsyncSession) -> Dict[int, List[dict]]:
+    emails = {contact_id: [] for contact_id in contact_ids}
+    if contact_ids:
+        rows = await db.execute(
+            select(contacts_emails.c.contact_id, Email.email, Email.id)
+            .join(Email, Email.id == contacts_emails.c.email_id)
+            .filter(contacts_emails.c.contact_id.in_(contact_ids))
+            .order_by(contacts_emails.c.contact_id, Email.id)
+        )
+        for contact_id, email, email_id in rows:
+            emails[contact_id].append({"email": email, "id": email_id})
+    return emails
+
+
+@instrumented
+async def get_contact_rows(skip: int, limit: int, user: User, db: AsyncSession,
+                           after_id: int | None = None) -> List[dict]:
+    """
+    Retrieves the same page as :func:`get_contacts` as plain dicts shaped like ContactResponse.
+
+    Contacts and their emails are read as column tuples in two queries, without
+    building ORM objects, for responses that are encoded without validation.
+
+    :param skip: The number of contacts to skip.
+    :type skip: int
+    :param limit: The maximum number of contacts to return.
+    :type limit: int
+    :param user: The user to retrieve contacts for.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :param after_id: The id of the last contact of the previous page.
+    :type after_id: int | None
+    :return: A list of contacts as dicts, ordered by id.
+    :rtype: List[dict]
+    """
+    stmt = (
+        select(Contact.id, Contact.name, Contact.surname, Contact.birthday, Contact.description)
+        .filter(Contact.user_id == user.id)
+        .order_by(Contact.id)
+        .limit(limit)
+    )
+    if after_id is not None:
+        stmt = stmt.filter(Contact.id > after_id)
+    else:
+        stmt = stmt.offset(skip)
+    rows = (await db.execute(stmt)).all()
+    emails = await _emails_by_contact([row[0] for row in rows], db)
+    return [{"name": name, "surname": surname, "birthday": birthday, "description": description,
+             "id": contact_id, "emails": emails[contact_id]}
+            for contact_id, name, surname, birthday, description in rows]
 
 
-async def get_contact(contact_id: int, user: User, db: Session) -> Contact:
+@instrumented
+async def get_contact(contact_id: int, user: User, db: AsyncSession, load_emails: bool = True) -> Contact:
     """
     Retrieves a single contact with the specified ID for a specific user.
 
@@ -34,14 +121,129 @@ async def get_contact(contact_id: int, user: User, db: Session) -> Contact:
     :param user: The user to retrieve the contact for.
     :type user: User
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
+    :param load_emails: Whether to load the emails of the contact.
+    :type load_emails: bool
     :return: The contact with the specified ID, or None if it does not exist.
     :rtype: Note | None
     """
-    return db.query(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id)).first()
+    stmt = select(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id))
+    stmt = _with_emails(stmt, load_emails)
+    contact = await db.execute(stmt)
+    return contact.scalar_one_or_none()
+
+
+def _search_hits(q: str, terms: List[str], user: User, dialect: str):
+    # Ids and ranks of the user's contacts matching the dialect's full-text search.
+    # Contacts found only through one of their email addresses get rank 0.
+    email_match = exists().where(and_(contacts_emails.c.contact_id == Contact.id,
+                                      Email.id == contacts_emails.c.email_id,
+                                      Email.email.istartswith(q, autoescape=True)))
+    if dialect == "postgresql":
+        vector = literal_column("contacts.search_vector")
+        tsquery = func.to_tsquery("simple", " & ".join(f"{term}:*" for term in terms))
+        rank = func.ts_rank(vector, tsquery) + func.greatest(func.similarity(Contact.name, q),
+                                                              func.similarity(func.coalesce(Contact.surname, ""), q))
+        match = or_(vector.op("@@")(tsquery), Contact.name.op("%")(q), Contact.surname.op("%")(q), email_match)
+        return select(Contact.id, rank.label("rank")).filter(and_(Contact.user_id == user.id, match)).subquery()
+    fts = (
+        select(contacts_fts.c.rowid.label("id"), (-func.bm25(literal_column("contacts_fts"))).label("rank"))
+        .filter(literal_column("contacts_fts").op("MATCH")(" ".join(f'"{term}"*' for term in terms)))
+        .subquery()
+    )
+    return (
+        select(Contact.id, func.coalesce(fts.c.rank, literal(0.0)).label("rank"))
+        .outerjoin(fts, fts.c.id == Contact.id)
+        .filter(and_(Contact.user_id == user.id, or_(fts.c.id.isnot(None), email_match)))
+        .subquery()
+    )
+
+
+@instrumented
+async def search_contacts(q: str, limit: int, user: User, db: AsyncSession,
+                          after: Tuple[float, int] | None = None) -> List[Tuple[Contact, float]]:
+    """
+    Searches the contacts of a specific user by name, surname, description and email addresses.
+
+    Postgres ranks matches of the generated ``search_vector`` column (GIN index) with
+    prefix terms and adds trigram similarity for fuzzy name matches; SQLite uses the
+    ``contacts_fts`` FTS5 table. Results are ordered by rank, best first, then by id.
+
+    :param q: The search query.
+    :type q: str
+    :param limit: The maximum number of contacts to return.
+    :type limit: int
+    :param user: The user to search contacts for.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :param after: The rank and id of the last contact of the previous page.
+    :type after: Tuple[float, int] | None
+    :return: A list of contacts with their rank.
+    :rtype: List[Tuple[Contact, float]]
+    """
+    terms = re.findall(r"\w+", q.lower())
+    if not terms:
+        return []
+    hits = _search_hits(q, terms, user, db.get_bind().dialect.name)
+    stmt = (
+        select(Contact, hits.c.rank)
+        .join(hits, hits.c.id == Contact.id)
+        .order_by(hits.c.rank.desc(), hits.c.id)
+        .limit(limit)
+    )
+    if after is not None:
+        after_rank, after_id = after
+        stmt = stmt.filter(or_(hits.c.rank < after_rank, and_(hits.c.rank == after_rank, hits.c.id > after_id)))
+    contacts = await db.execute(_with_emails(stmt))
+    return contacts.all()
+
+
+@instrumented
+async def get_upcoming_birthdays(days: int, limit: int, user: User, db: AsyncSession,
+                                 today: date | None = None) -> List[Contact]:
+    """
+    Retrieves the contacts of a specific user whose birthday is within the next days.
+
+    Birthdays are compared through ``birthday_key`` (month * 100 + day) on the
+    ``(user_id, birthday_key)`` index. When the period crosses the new year it is split
+    into two ranges. Contacts are ordered by how soon their birthday comes.
+
+    :param days: The number of days to look ahead, today included.
+    :type days: int
+    :param limit: The maximum number of contacts to return.
+    :type limit: int
+    :param user: The user to retrieve contacts for.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :param today: The first day of the period, defaults to the current date.
+    :type today: date | None
+    :return: A list of contacts.
+    :rtype: List[Contact]
+    """
+    today = today or date.today()
+    end = today + timedelta(days=days)
+    start_key = today.month * 100 + today.day
+    end_key = end.month * 100 + end.day
+    if days >= 365:
+        period = Contact.birthday_key.isnot(None)
+    elif start_key <= end_key and end.year == today.year:
+        period = Contact.birthday_key.between(start_key, end_key)
+    else:
+        period = or_(Contact.birthday_key >= start_key, Contact.birthday_key <= end_key)
+    stmt = (
+        select(Contact)
+        .filter(and_(Contact.user_id == user.id, period))
+        .order_by(Contact.birthday_key < start_key, Contact.birthday_key, Contact.id)
+        .limit(limit)
+    )
+    contacts = await db.execute(_with_emails(stmt))
+    return contacts.scalars().all()
 
 
-async def create_contact(body: ContactModel, user: User, db: Session) -> Contact:
+@instrumented
+async def create_contact(body: ContactModel, user: User, db: AsyncSession) -> Contact:
     """
     Creates a new contact for a specific user.
 
@@ -50,20 +252,59 @@ async def create_contact(body: ContactModel, user: User, db: Session) -> Contact
     :param user: The user to create the contact for.
     :type user: User
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: The newly created contact.
     :rtype: Note
     """
-    emails = db.query(Email).filter(and_(Email.id.in_(body.emails), Email.user_id == user.id)).all()
+    stmt = select(Email).filter(and_(Email.id.in_(body.emails), Email.user_id == user.id))
+    emails = await db.execute(stmt)
     contact = Contact(name=body.name, surname=body.surname, birthday=body.birthday,
-                      description=body.description, emails=emails)
+                      description=body.description, emails=emails.scalars().all(), user_id=user.id)
     db.add(contact)
-    db.commit()
-    db.refresh(contact)
+    await db.commit()
     return contact
 
 
-async def remove_contact(contact_id: int, user: User, db: Session) -> Contact | None:
+@instrumented
+async def create_contacts(bodies: List[ContactModel], user: User, db: AsyncSession) -> List[int]:
+    """
+    Creates many contacts for a specific user in one transaction.
+
+    Email ids are resolved with a single query, contacts and their email links are
+    written with one batched INSERT each. Email ids the user does not own are ignored,
+    as in :func:`create_contact`. On SQLite, SQLAlchemy cannot return the new ids in
+    parameter order from a single statement and inserts the contacts row by row.
+
+    :param bodies: The data for the contacts to create.
+    :type bodies: List[ContactModel]
+    :param user: The user to create the contacts for.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: The ids of the new contacts, in the order of bodies.
+    :rtype: List[int]
+    """
+    if not bodies:
+        return []
+    requested = {email_id for body in bodies for email_id in body.emails}
+    owned = set()
+    if requested:
+        stmt = select(Email.id).filter(and_(Email.id.in_(requested), Email.user_id == user.id))
+        owned = set((await db.execute(stmt)).scalars().all())
+    stmt = insert(Contact).returning(Contact.id, sort_by_parameter_order=True)
+    ids = await db.execute(stmt, [{"name": body.name, "surname": body.surname, "birthday": body.birthday,
+                                   "description": body.description, "user_id": user.id} for body in bodies])
+    ids = ids.scalars().all()
+    links = [{"contact_id": contact_id, "email_id": email_id}
+             for contact_id, body in zip(ids, bodies) for email_id in set(body.emails) & owned]
+    if links:
+        await db.execute(insert(contacts_emails), links)
+    await db.commit()
+    return ids
+
+
+@instrumented
+async def remove_contact(contact_id: int, user: User, db: AsyncSession) -> Contact | None:
     """
     Removes a single contact with the specified ID for a specific user.
 
@@ -72,18 +313,21 @@ async def remove_contact(contact_id: int, user: User, db: Session) -> Contact |
     :param user: The user to remove the contact for.
     :type user: User
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: The removed contact, or None if it does not exist.
     :rtype: Note | None
     """
-    contact = db.query(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id)).first()
+    stmt = _with_emails(select(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id)))
+    contact = await db.execute(stmt)
+    contact = contact.scalar_one_or_none()
     if contact:
-        db.delete(contact)
-        db.commit()
+        await db.delete(contact)
+        await db.commit()
     return contact
 
 
-async def update_contact(contact_id: int, body: ContactModel, user: User, db: Session) -> Contact | None:
+@instrumented
+async def update_contact(contact_id: int, body: ContactModel, user: User, db: AsyncSession) -> Contact | None:
     """
     Updates a single contact with the specified ID for a specific user.
 
@@ -94,19 +338,128 @@ async def update_contact(contact_id: int, body: ContactModel, user: User, db: Se
     :param user: The user to update the contact for.
     :type user: User
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: The updated contact, or None if it does not exist.
     :rtype: Note | None
     """
-    contact = db.query(Contact).filter(Contact.id == contact_id).first()
+    stmt = _with_emails(select(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id)))
+    contact = await db.execute(stmt)
+    contact = contact.scalar_one_or_none()
     if contact:
-        emails = db.query(Contact).filter(and_(Contact.id.in_(body.emails), Contact.user_id == user.id)).all()
+        stmt = select(Email).filter(and_(Email.id.in_(body.emails), Email.user_id == user.id))
+        emails = await db.execute(stmt)
         contact.name = body.name
         contact.description = body.description
         contact.surname = body.surname
         contact.birthday = body.birthday
-        contact.emails = emails
-        db.commit()
+        contact.emails = emails.scalars().all()
+        await db.commit()
     return contact
 
 
+@instrumented
+async def update_contacts(contact_ids: List[int], changes: ContactPatch, user: User, db: AsyncSession) -> List[int]:
+    """
+    Applies the same partial update to many contacts of a specific user in one transaction.
+
+    The fields set in ``changes`` are written with one set-based UPDATE. When
+    ``changes.emails`` is given, the email associations of all the contacts are
+    replaced with one DELETE and one INSERT ... SELECT, emails of other users are ignored.
+
+    :param contact_ids: The IDs of the contacts to update.
+    :type contact_ids: List[int]
+    :param changes: The fields to change, unset fields are kept and explicit nulls clear them.
+    :type changes: ContactPatch
+    :param user: The user to update the contacts for.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: The IDs of the updated contacts.
+    :rtype: List[int]
+    """
+    if not contact_ids:
+        return []
+    owned = and_(Contact.id.in_(contact_ids), Contact.user_id == user.id)
+    values = changes.dict(exclude_unset=True, exclude={"emails"})
+    if values:
+        updated = await db.execute(update(Contact).where(owned).values(**values).returning(Contact.id))
+    else:
+        updated = await db.execute(select(Contact.id).where(owned))
+    updated = sorted(updated.scalars().all())
+    if updated and changes.emails is not None:
+        await db.execute(delete(contacts_emails).where(contacts_emails.c.contact_id.in_(updated)))
+        if changes.emails:
+            # every updated contact gets every listed email of the user
+            emails = (
+                select(Contact.id, Email.id)
+                .join(Email, true())
+                .where(and_(Contact.id.in_(updated), Email.id.in_(changes.emails), Email.user_id == user.id))
+            )
+            await db.execute(insert(contacts_emails).from_select(["contact_id", "email_id"], emails))
+    await db.commit()
+    return updated
+
+
+@instrumented
+async def remove_contacts(contact_ids: List[int], user: User, db: AsyncSession) -> List[int]:
+    """
+    Removes many contacts of a specific user with one set-based DELETE.
+
+    :param contact_ids: The IDs of the contacts to remove.
+    :type contact_ids: List[int]
+    :param user: The user to remove the contacts for.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: The IDs of the removed contacts.
+    :rtype: List[int]
+    """
+    if not contact_ids:
+        return []
+    owned = select(Contact.id).filter(and_(Contact.id.in_(contact_ids), Contact.user_id == user.id))
+    await db.execute(delete(contacts_emails).where(contacts_emails.c.contact_id.in_(owned)))
+    stmt = delete(Contact).filter(and_(Contact.id.in_(contact_ids), Contact.user_id == user.id)).returning(Contact.id)
+    removed = await db.execute(stmt)
+    removed = sorted(removed.scalars().all())
+    await db.commit()
+    return removed
+
+
+@instrumented
+async def stream_contacts(user: User, db: AsyncSession, batch_size: int = 1000) -> AsyncIterator[dict]:
+    """
+    Streams all contacts of a specific user together with their emails.
+
+    Rows are read through a server-side cursor in batches of ``batch_size`` as plain
+    column tuples, so memory use does not depend on the size of the address book.
+
+    :param user: The user to export contacts for.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :param batch_size: The number of rows fetched from the cursor at once.
+    :type batch_size: int
+    :return: An async iterator of contacts as dicts, ordered by id.
+    :rtype: AsyncIterator[dict]
+    """
+    stmt = (
+        select(Contact.id, Contact.name, Contact.surname, Contact.birthday, Contact.description,
+               Email.id, Email.email)
+        .outerjoin(contacts_emails, contacts_emails.c.contact_id == Contact.id)
+        .outerjoin(Email, Email.id == contacts_emails.c.email_id)
+        .filter(Contact.user_id == user.id)
+        .order_by(Contact.id, Email.id)
+        .execution_options(yield_per=batch_size)
+    )
+    contact = None
+    rows = await db.stream(stmt)
+    async for contact_id, name, surname, birthday, description, email_id, email in rows:
+        if contact is None or contact["id"] != contact_id:
+            if contact is not None:
+                yield contact
+            contact = {"id": contact_id, "name": name, "surname": surname, "birthday": birthday,
+                       "description": description, "emails": []}
+        if email_id is not None:
+            contact["emails"].append({"id": email_id, "email": email})
+    if contact is not None:
+        yield contact
@@ -1,16 +1,22 @@
 from typing import List
 
-from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, select, delete
+from sqlalchemy.dialects import postgresql, sqlite
 
-from src.database.models import Email, User
+from src.database.models import Email, User, contacts_emails
 from src.schemas import EmailModel
+from src.services.metrics import instrumented
 
 
-async def get_emails(skip: int, limit: int, user: User, db: Session) -> List[Email]:
+@instrumented
+async def get_emails(skip: int, limit: int, user: User, db: AsyncSession, after_id: int | None = None) -> List[Email]:
     """
     Retrieves a list of emails for a specific user with specified pagination parameters.
 
+    Emails are ordered by id. With ``after_id`` the page starts right after that
+    email (keyset pagination on the ``(user_id, id)`` index) and ``skip`` is ignored.
+
     :param skip: The number of emails to skip.
     :type skip: int
     :param limit: The maximum number of emails to return.
@@ -18,14 +24,51 @@ async def get_emails(skip: int, limit: int, user: User, db: Session) -> List[Ema
     :param user: The user to retrieve emails for.
     :type user: User
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
+    :param after_id: The id of the last email of the previous page.
+    :type after_id: int | None
     :return: A list of emails.
     :rtype: List[Note]
     """
-    return db.query(Email).filter(Email.user_id == user.id).offset(skip).limit(limit).all()
+    stmt = select(Email).filter(Email.user_id == user.id).order_by(Email.id).limit(limit)
+    if after_id is not None:
+        stmt = stmt.filter(Email.id > after_id)
+    else:
+        stmt = stmt.offset(skip)
+    emails = await db.execute(stmt)
+    return emails.scalars().all()
+
+
+@instrumented
+async def get_email_rows(skip: int, limit: int, user: User, db: AsyncSession,
+                         after_id: int | None = None) -> List[dict]:
+    """
+    Retrieves the same page as :func:`get_emails` as plain dicts shaped like EmailResponse.
+
+    :param skip: The number of emails to skip.
+    :type skip: int
+    :param limit: The maximum number of emails to return.
+    :type limit: int
+    :param user: The user to retrieve emails for.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :param after_id: The id of the last email of the previous page.
+    :type after_id: int | None
+    :return: A list of emails as dicts, ordered by id.
+    :rtype: List[dict]
+    """
+    stmt = select(Email.email, Email.id).filter(Email.user_id == user.id).order_by(Email.id).limit(limit)
+    if after_id is not None:
+        stmt = stmt.filter(Email.id > after_id)
+    else:
+        stmt = stmt.offset(skip)
+    rows = await db.execute(stmt)
+    return [{"email": email, "id": email_id} for email, email_id in rows]
 
 
-async def get_email(email_id: int, user: User, db: Session) -> Email:
+@instrumented
+async def get_email(email_id: int, user: User, db: AsyncSession) -> Email:
     """
        Retrieves a single email with the specified ID for a specific user.
 
@@ -34,14 +77,17 @@ async def get_email(email_id: int, user: User, db: Session) -> Email:
        :param user: The user to retrieve the email for.
        :type user: User
        :param db: The database session.
-       :type db: Session
+       :type db: AsyncSession
        :return: The email with the specified ID, or None if it does not exist.
        :rtype: Note | None
        """
-    return db.query(Email).filter(and_(Email.id == email_id, Email.user_id == user.id)).first()
+    stmt = select(Email).filter(and_(Email.id == email_id, Email.user_id == user.id))
+    email = await db.execute(stmt)
+    return email.scalar_one_or_none()
 
 
-async def create_email(body: EmailModel, user: User, db: Session) -> Email:
+@instrumented
+async def create_email(body: EmailModel, user: User, db: AsyncSession) -> Email:
     """
         Creates a new email for a specific user.
 
@@ -50,18 +96,19 @@ async def create_email(body: EmailModel, user: User, db: Session) -> Email:
         :param user: The user to create the email for.
         :type user: User
         :param db: The database session.
-        :type db: Session
+        :type db: AsyncSession
         :return: The newly created email.
         :rtype: Note
         """
     email = Email(email=body.email, user_id=user.id)
     db.add(email)
-    db.commit()
-    db.refresh(email)
+    await db.commit()
+    await db.refresh(email)
     return email
 
 
-async def update_email(email_id: int, body: EmailModel, user: User, db: Session) -> Email | None:
+@instrumented
+async def update_email(email_id: int, body: EmailModel, user: User, db: AsyncSession) -> Email | None:
     """
        Updates a single email with the specified ID for a specific user.
 
@@ -72,18 +119,21 @@ async def update_email(email_id: int, body: EmailModel, user: User, db: Session)
        :param user: The user to update the email for.
        :type user: User
        :param db: The database session.
-       :type db: Session
+       :type db: AsyncSession
        :return: The updated email, or None if it does not exist.
        :rtype: Note | None
        """
-    email = db.query(Email).filter(and_(Email.id == email_id, Email.user_id == user.id)).first()
+    stmt = select(Email).filter(and_(Email.id == email_id, Email.user_id == user.id))
+    email = await db.execute(stmt)
+    email = email.scalar_one_or_none()
     if email:
         email.email = body.email
-        db.commit()
+        await db.commit()
     return email
 
 
-async def remove_email(email_id: int, user: User, db: Session)  -> Email | None:
+@instrumented
+async def remove_email(email_id: int, user: User, db: AsyncSession)  -> Email | None:
     """
         Removes a single email with the specified ID for a specific user.
 
@@ -92,12 +142,101 @@ async def remove_email(email_id: int, user: User, db: Session)  -> Email | None:
         :param user: The user to remove the email for.
         :type user: User
         :param db: The database session.
-        :type db: Session
+        :type db: AsyncSession
         :return: The removed email, or None if it does not exist.
         :rtype: Note | None
         """
-    email = db.query(Email).filter(and_(Email.id == email_id, Email.user_id == user.id)).first()
+    stmt = select(Email).filter(and_(Email.id == email_id, Email.user_id == user.id))
+    email = await db.execute(stmt)
+    email = email.scalar_one_or_none()
     if email:
-        db.delete(email)
-        db.commit()
+        await db.execute(delete(contacts_emails).where(contacts_emails.c.email_id == email.id))
+        await db.delete(email)
+        await db.commit()
     return email
+
+
+INSERT_DIALECTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+
+@instrumented
+async def get_taken_addresses(addresses: List[str], user: User, db: AsyncSession) -> List[str]:
+    """
+    Finds which of the addresses already belong to other users.
+
+    :param addresses: The email addresses to look up.
+    :type addresses: List[str]
+    :param user: The user adding the addresses.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: The addresses owned by someone else.
+    :rtype: List[str]
+    """
+    if not addresses:
+        return []
+    stmt = select(Email.email).filter(and_(Email.email.in_(set(addresses)), Email.user_id.is_distinct_from(user.id)))
+    taken = await db.execute(stmt)
+    return taken.scalars().all()
+
+
+@instrumented
+async def create_emails(addresses: List[str], user: User, db: AsyncSession) -> List[Email]:
+    """
+    Creates many emails for a specific user with one INSERT ... ON CONFLICT DO NOTHING.
+
+    Only the user's own existing addresses are skipped. An address of another user
+    still violates the unique ``email`` column, leave those out, see
+    ``get_taken_addresses``.
+
+    :param addresses: The email addresses to create.
+    :type addresses: List[str]
+    :param user: The user to create the emails for.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: The emails that were created, addresses the user already has are skipped.
+    :rtype: List[Email]
+    :raises IntegrityError: If an address belongs to another user.
+    """
+    addresses = list(dict.fromkeys(addresses))
+    if not addresses:
+        return []
+    dialect = db.get_bind().dialect.name
+    insert = INSERT_DIALECTS[dialect](Email).values([{"email": address, "user_id": user.id} for address in addresses])
+    if dialect == "postgresql":
+        insert = insert.on_conflict_do_nothing(constraint="unique_email_user")
+    else:
+        insert = insert.on_conflict_do_nothing(index_elements=["email", "user_id"])
+    emails = await db.execute(insert.returning(Email))
+    emails = emails.scalars().all()
+    await db.commit()
+    return emails
+
+
+@instrumented
+async def remove_emails(email_ids: List[int], user: User, db: AsyncSession) -> List[int]:
+    """
+    Removes many emails of a specific user with one set-based DELETE.
+
+    :param email_ids: The IDs of the emails to remove.
+    :type email_ids: List[int]
+    :param user: The user to remove the emails for.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: The IDs of the removed emails.
+    :rtype: List[int]
+    """
+    if not email_ids:
+        return []
+    owned = select(Email.id).filter(and_(Email.id.in_(email_ids), Email.user_id == user.id))
+    await db.execute(delete(contacts_emails).where(contacts_emails.c.email_id.in_(owned)))
+    stmt = delete(Email).filter(and_(Email.id.in_(email_ids), Email.user_id == user.id)).returning(Email.id)
+    removed = await db.execute(stmt)
+    removed = removed.scalars().all()
+    await db.commit()
+    return removed
@@ -1,51 +1,114 @@
-from libgravatar import Gravatar
-from sqlalchemy.orm import Session
+from typing import Dict, List
+
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.schemas import UserModel
 from src.database.models import User
+from src.services.metrics import instrumented
 
-async def get_user_by_email(email: str, db: Session) -> User:
+@instrumented
+async def get_user_by_email(email: str, db: AsyncSession) -> User:
     """
        Retrieves a single user with the unique email for a specific user.
        :param email: The email of the user to retrieve.
        :type email: str
        :param db: The database session.
-       :type db: Session
+       :type db: AsyncSession
        :return: The user with the unique email, or None if it does not exist.
        :rtype: User | None
        """
-    return db.query(User).filter(User.email == email).first()
+    stmt = select(User).filter(User.email == email)
+    user = await db.execute(stmt)
+    return user.scalar_one_or_none()
 
 
-async def create_user(body: UserModel, db: Session) -> User:
+@instrumented
+async def create_user(body: UserModel, db: AsyncSession) -> User:
     """
         Creates a new user for a specific email.
 
         :param body: The data for the note to create.
         :type body: UserModel
         :param db: The database session.
-        :type db: Session
+        :type db: AsyncSession
         :return: The newly created user.
         :rtype: User
         """
-    avatar = None
-    try:
-        g = Gravatar(body.email)
-        avatar = g.get_image()
-    except Exception as e:
-        print(e)
-    new_user = User(**body.dict(), avatar=avatar)
+    new_user = User(**body.dict())
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     return new_user
 
 
-async def update_token(user: User, token: str | None, db: Session) -> None:
-    user.refresh_token = token
-    db.commit()
-    
-async def confirmed_email(email: str, db: Session) -> None:
+@instrumented
+async def update_password(user: User, password: str, db: AsyncSession) -> None:
+    user.password = password
+    await db.commit()
+
+@instrumented
+async def confirmed_email(email: str, db: AsyncSession) -> None:
     user = await get_user_by_email(email, db)
     user.confirmed = True
-    db.commit()
+    await db.commit()
+
+
+@instrumented
+async def update_avatar(email: str, url: str, db: AsyncSession) -> User:
+    """
+        Updates the avatar of the user with the specified email.
+
+        :param email: The email of the user to update.
+        :type email: str
+        :param url: The new avatar URL.
+        :type url: str
+        :param db: The database session.
+        :type db: AsyncSession
+        :return: The updated user.
+        :rtype: User
+        """
+    user = await get_user_by_email(email, db)
+    user.avatar = url
+    await db.commit()
+    return user
+
+
+@instrumented
+async def get_users_without_avatar(limit: int, db: AsyncSession, after_id: int | None = None) -> List[User]:
+    """
+        Retrieves users that have no avatar yet, ordered by id.
+
+        :param limit: The maximum number of users to return.
+        :type limit: int
+        :param db: The database session.
+        :type db: AsyncSession
+        :param after_id: Only return users with an id greater than this one.
+        :type after_id: int | None
+        :return: A list of users.
+        :rtype: List[User]
+        """
+    stmt = select(User).filter(User.avatar.is_(None)).order_by(User.id).limit(limit)
+    if after_id is not None:
+        stmt = stmt.filter(User.id > after_id)
+    users = await db.execute(stmt)
+    return users.scalars().all()
+
+
+@instrumented
+async def set_default_avatars(avatars: Dict[int, str], db: AsyncSession) -> None:
+    """
+        Sets the avatar of several users in one statement, skipping users that uploaded one meanwhile.
+
+        :param avatars: The avatar URL for each user id.
+        :type avatars: Dict[int, str]
+        :param db: The database session.
+        :type db: AsyncSession
+        """
+    if not avatars:
+        return
+    users = User.__table__
+    stmt = update(users).where(users.c.id == bindparam("user_id"), users.c.avatar.is_(None)) \
+        .values(avatar=bindparam("url"))
+    await db.execute(stmt, [{"user_id": user_id, "url": url} for user_id, url in avatars.items()])
+    await db.commit()
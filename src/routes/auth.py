@@ -1,60 +1,85 @@
+import logging
+
 from fastapi.security import OAuth2PasswordRequestForm, HTTPAuthorizationCredentials, HTTPBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from src.schemas import UserModel, UserResponse, TokenModel, RequestEmail
-from src.database.db import get_db
+from src.database.db import get_db, get_session_factory
+from src.database.models import User
 
 from src.repository import users as repository_users
 from src.services.auth import auth_service
+from src.services.sessions import TokenReuseError
 from fastapi import APIRouter, HTTPException, Depends, status, Security, BackgroundTasks, Request
 
-from src.services.email import send_email
+from src.services.gravatar import assign_gravatar
+from src.services.mail_queue import mail_queue
 
 router = APIRouter(prefix='/auth', tags=["auth"])
 security = HTTPBearer()
+logger = logging.getLogger(__name__)
 
 
 @router.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Request, db: Session = Depends(get_db)):
+async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Request,
+                 db: AsyncSession = Depends(get_db), session_factory=Depends(get_session_factory)):
     exist_user = await repository_users.get_user_by_email(body.email, db)
     if exist_user:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Account already exists")
-    body.password = auth_service.get_password_hash(body.password)
+    body.password = await auth_service.get_password_hash(body.password)
     new_user = await repository_users.create_user(body, db)
-    background_tasks.add_task(send_email, new_user.email, new_user.username, request.base_url)
+    background_tasks.add_task(assign_gravatar, session_factory, new_user.id, new_user.email)
+    try:
+        await mail_queue.enqueue_confirmation(new_user.email, new_user.username, str(request.base_url))
+    except HTTPException:
+        # the account exists already, the user can ask for the email again through request_email
+        logger.warning("confirmation email for %s was not queued", new_user.email)
+        return {"user": new_user,
+                "detail": "User successfully created. The confirmation email could not be sent, request it again."}
     return {"user": new_user, "detail": "User successfully created. Check your email for confirmation."}
 
 
 @router.get('/refresh_token', response_model=TokenModel)
-async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security), db: Session = Depends(get_db)):
-    token = credentials.credentials
-    email = await auth_service.decode_refresh_token(token)
-    user = await repository_users.get_user_by_email(email, db)
-    if user.refresh_token != token:
-        await repository_users.update_token(user, None, db)
+async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security)):
+    claims = await auth_service.decode_refresh_token(credentials.credentials)
+    email, jti = claims["sub"], claims.get("jti")
+    if jti is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+    try:
+        jti = await auth_service.sessions.rotate(jti, email)
+    except TokenReuseError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                            detail="Refresh token reused, the session has been revoked")
 
     access_token = await auth_service.create_access_token(data={"sub": email})
-    refresh_token = await auth_service.create_refresh_token(data={"sub": email})
-    await repository_users.update_token(user, refresh_token, db)
+    refresh_token = await auth_service.create_refresh_token(data={"sub": email, "jti": jti})
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
+
+@router.post('/logout_all')
+async def logout_all(current_user: User = Depends(auth_service.get_current_user)):
+    revoked = await auth_service.sessions.revoke_all(current_user.email)
+    return {"message": "Logged out of all sessions", "revoked": revoked}
+
 @router.post("/login", response_model=TokenModel)
-async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     user = await repository_users.get_user_by_email(body.username, db)
     if user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email")
     if not user.confirmed:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Email not confirmed")
-    if not auth_service.verify_password(body.password, user.password):
+    verified, new_hash = await auth_service.verify_and_update_password(body.password, user.password)
+    if not verified:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
+    if new_hash:
+        await repository_users.update_password(user, new_hash, db)
     # Generate JWT
     access_token = await auth_service.create_access_token(data={"sub": user.email})
-    refresh_token = await auth_service.create_refresh_token(data={"sub": user.email})
-    await repository_users.update_token(user, refresh_token, db)
+    jti = await auth_service.sessions.issue(user.email)
+    refresh_token = await auth_service.create_refresh_token(data={"sub": user.email, "jti": jti})
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 @router.get('/confirmed_email/{token}')
-async def confirmed_email(token: str, db: Session = Depends(get_db)):
+async def confirmed_email(token: str, db: AsyncSession = Depends(get_db)):
     email = await auth_service.get_email_from_token(token)
     user = await repository_users.get_user_by_email(email, db)
     if user is None:
@@ -62,15 +87,15 @@ async def confirmed_email(token: str, db: Session = Depends(get_db)):
     if user.confirmed:
         return {"message": "Your email is already confirmed"}
     await repository_users.confirmed_email(email, db)
+    await auth_service.user_cache.invalidate(email)
     return {"message": "Email confirmed"}
 
 @router.post('/request_email')
-async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, request: Request,
-                        db: Session = Depends(get_db)):
+async def request_email(body: RequestEmail, request: Request, db: AsyncSession = Depends(get_db)):
     user = await repository_users.get_user_by_email(body.email, db)
 
-    if user.confirmed:
+    if user and user.confirmed:
         return {"message": "Your email is already confirmed"}
     if user:
-        background_tasks.add_task(send_email, user.email, user.username, request.base_url)
+        await mail_queue.enqueue_confirmation(user.email, user.username, str(request.base_url))
     return {"message": "Check your email for confirmation."}
\ No newline at end of file
@@ -1,54 +1,159 @@
 from typing import List
 
-from fastapi import APIRouter, HTTPException, Depends, status
-from fastapi_limiter.depends import RateLimiter
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, HTTPException, Depends, status, Response, Request, UploadFile, File, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.db import get_db
+from src.database.db import get_db, get_read_db, get_read_session_factory, recent_writes
 from src.database.models import User
-from src.schemas import ContactModel, ContactResponse
+from src.conf.config import settings
+from src.schemas import ContactModel, ContactResponse, ExportFormat, BulkContactsResponse, ContactsBulkUpdateModel, \
+    ContactsBulkUpdateResponse, ContactIdsModel, ContactsBulkDeleteResponse
 from src.repository import contacts as repository_contacts
 from src.services.auth import auth_service
+from src.services.cache import response_cache
+from src.services.rate_limit import rate_limit
+from src.services.pagination import decode_cursor, next_cursor, encode_rank_cursor, decode_rank_cursor
+from src.services.export import to_ndjson, to_csv
+from src.services.imports import read_json, read_upload, import_contacts
 
 router = APIRouter(prefix='/contacts', tags=["contacts"])
 
-@router.get("/", response_model=List[ContactResponse], description='No more than 10 requests per minute',
-            dependencies=[Depends(RateLimiter(times=10, seconds=60))])
-async def read_contacts(skip: int = 0, limit: int = 100, db: Session = Depends(get_db),
-                     current_user: User = Depends(auth_service.get_current_user)):
-    contacts = await repository_contacts.get_contacts(skip, limit, current_user, db)
-    return contacts
+@router.get("/", response_model=List[ContactResponse],
+            description='Rate limited per user, see the rate_limits setting. '
+                        'Pass the X-Next-Cursor header of a page as cursor to get the next one.',
+            dependencies=[Depends(rate_limit('contacts:list'))])
+async def read_contacts(request: Request, skip: int = 0, limit: int = 100, cursor: str | None = None,
+                        db: AsyncSession = Depends(get_read_db),
+                        current_user: User = Depends(auth_service.get_current_user)):
+    after_id = decode_cursor(cursor) if cursor else None
+
+    async def produce():
+        contacts = await repository_contacts.get_contact_rows(skip, limit, current_user, db, after_id=after_id)
+        page = next_cursor(contacts, limit)
+        return contacts, {"X-Next-Cursor": page} if page else {}
+
+    # rows come straight from the database in the shape of ContactResponse, encoded without validation
+    return await response_cache.respond(request, current_user.id, List[ContactResponse], produce, validate=False, db=db)
+
+
+@router.get("/search", response_model=List[ContactResponse],
+            description='Searches name, surname, description and email addresses, best matches first. '
+                        'Pass the X-Next-Cursor header of a page as cursor to get the next one.')
+async def search_contacts(response: Response, q: str = Query(min_length=1, max_length=100),
+                          limit: int = Query(20, ge=1, le=100), cursor: str | None = None,
+                          db: AsyncSession = Depends(get_read_db),
+                          current_user: User = Depends(auth_service.get_current_user)):
+    after = decode_rank_cursor(cursor) if cursor else None
+    hits = await repository_contacts.search_contacts(q, limit, current_user, db, after=after)
+    if hits and len(hits) >= limit:
+        contact, rank = hits[-1]
+        response.headers["X-Next-Cursor"] = encode_rank_cursor(rank, contact.id)
+    return [contact for contact, rank in hits]
+
+
+@router.get("/birthdays", response_model=List[ContactResponse],
+            description='Contacts with a birthday within the next days, soonest first.')
+async def read_upcoming_birthdays(days: int = Query(7, ge=0, le=366), limit: int = 100,
+                                  db: AsyncSession = Depends(get_read_db),
+                                  current_user: User = Depends(auth_service.get_current_user)):
+    return await repository_contacts.get_upcoming_birthdays(days, limit, current_user, db)
+
+
+@router.get("/export", response_class=StreamingResponse,
+            description='Streams the whole address book with the emails of every contact.')
+async def export_contacts(format: ExportFormat = ExportFormat.ndjson,
+                          session_factory=Depends(get_read_session_factory),
+                          current_user: User = Depends(auth_service.get_current_user)):
+    async def contacts():
+        async with session_factory() as db:
+            await recent_writes.route(db, current_user.id)
+            async for contact in repository_contacts.stream_contacts(current_user, db):
+                yield contact
+
+    if format == ExportFormat.csv:
+        return StreamingResponse(to_csv(contacts()), media_type="text/csv",
+                                 headers={"Content-Disposition": 'attachment; filename="contacts.csv"'})
+    return StreamingResponse(to_ndjson(contacts()), media_type="application/x-ndjson")
 
 
 @router.get("/{contact_id}", response_model=ContactResponse)
-async def read_contact(contact_id: int, db: Session = Depends(get_db),
+async def read_contact(request: Request, contact_id: int, db: AsyncSession = Depends(get_read_db),
                     current_user: User = Depends(auth_service.get_current_user)):
-    contact = await repository_contacts.get_contact(contact_id, current_user, db)
-    if contact is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found")
-    return contact
+    async def produce():
+        contact = await repository_contacts.get_contact(contact_id, current_user, db)
+        if contact is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found")
+        return contact, {}
+
+    return await response_cache.respond(request, current_user.id, ContactResponse, produce, db=db)
 
 
 @router.post("/", response_model=ContactResponse)
-async def create_contact(body: ContactModel, db: Session = Depends(get_db),
+async def create_contact(body: ContactModel, db: AsyncSession = Depends(get_db),
                       current_user: User = Depends(auth_service.get_current_user)):
-    return await repository_contacts.create_contact(body, current_user, db)
+    contact = await repository_contacts.create_contact(body, current_user, db)
+    await response_cache.bump(current_user.id)
+    return contact
+
+
+@router.post("/bulk", response_model=BulkContactsResponse, status_code=status.HTTP_201_CREATED,
+             description='Accepts a JSON array of contacts or an uploaded CSV/NDJSON file.')
+async def create_contacts(request: Request, file: UploadFile | None = File(None), db: AsyncSession = Depends(get_db),
+                          current_user: User = Depends(auth_service.get_current_user)):
+    if file is not None:
+        rows = read_upload(file)
+    else:
+        try:
+            rows = read_json(await request.json())
+        except ValueError as err:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(err))
+    result = await import_contacts(rows, current_user, db, chunk_size=settings.bulk_chunk_size)
+    if result["created"]:
+        await response_cache.bump(current_user.id)
+    return result
+
+
+@router.patch("/bulk", response_model=ContactsBulkUpdateResponse,
+              description='Applies the same changes to many contacts in one transaction, '
+                          'fields left out are kept. emails replaces the emails of every contact.')
+async def update_contacts(body: ContactsBulkUpdateModel, db: AsyncSession = Depends(get_db),
+                          current_user: User = Depends(auth_service.get_current_user)):
+    updated = await repository_contacts.update_contacts(body.ids, body.changes, current_user, db)
+    if updated:
+        await response_cache.bump(current_user.id)
+    changed = set(updated)
+    not_found = [contact_id for contact_id in dict.fromkeys(body.ids) if contact_id not in changed]
+    return {"updated": updated, "not_found": not_found}
+
+
+@router.delete("/bulk", response_model=ContactsBulkDeleteResponse)
+async def remove_contacts(body: ContactIdsModel, db: AsyncSession = Depends(get_db),
+                          current_user: User = Depends(auth_service.get_current_user)):
+    deleted = await repository_contacts.remove_contacts(body.ids, current_user, db)
+    if deleted:
+        await response_cache.bump(current_user.id)
+    removed = set(deleted)
+    not_found = [contact_id for contact_id in dict.fromkeys(body.ids) if contact_id not in removed]
+    return {"deleted": deleted, "not_found": not_found}
 
 
 @router.put("/{contact_id}", response_model=ContactResponse)
-async def update_contact(body: ContactModel, contact_id: int, db: Session = Depends(get_db),
+async def update_contact(body: ContactModel, contact_id: int, db: AsyncSession = Depends(get_db),
                       current_user: User = Depends(auth_service.get_current_user)):
     contact = await repository_contacts.update_contact(contact_id, body, current_user, db)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found")
+    await response_cache.bump(current_user.id)
     return contact
 
 
 @router.delete("/{contact_id}", response_model=ContactResponse)
-async def remove_contact(contact_id: int, db: Session = Depends(get_db),
+async def remove_contact(contact_id: int, db: AsyncSession = Depends(get_db),
         current_user: User = Depends(auth_service.get_current_user)):
     contact = await repository_contacts.remove_contact(contact_id, current_user, db)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found")
+    await response_cache.bump(current_user.id)
     return contact
 
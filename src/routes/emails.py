@@ -1,52 +1,100 @@
 from typing import List
 
-from fastapi import APIRouter, HTTPException, Depends, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, HTTPException, Depends, status, Request
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.db import get_db
+from src.database.db import get_db, get_read_db
 from src.database.models import User
-from src.schemas import EmailModel, EmailResponse
+from src.schemas import EmailModel, EmailResponse, EmailsBulkModel, EmailIdsModel, EmailsBulkResponse, \
+    EmailsBulkDeleteResponse
 from src.repository import emails as repository_emails
 from src.services.auth import auth_service
+from src.services.cache import response_cache
+from src.services.pagination import decode_cursor, next_cursor
 
 router = APIRouter(prefix='/emails', tags=["emails"])
 
 
-@router.get("/", response_model=List[EmailResponse])
-async def read_emails(db: Session = Depends(get_db),
+@router.get("/", response_model=List[EmailResponse],
+            description='Pass the X-Next-Cursor header of a page as cursor to get the next one.')
+async def read_emails(request: Request, skip: int = 0, limit: int = 100, cursor: str | None = None,
+                      db: AsyncSession = Depends(get_read_db),
                       current_user: User = Depends(auth_service.get_current_user)):
-    emails = await repository_emails.get_emails(current_user, db)
-    return emails
+    after_id = decode_cursor(cursor) if cursor else None
+
+    async def produce():
+        emails = await repository_emails.get_email_rows(skip, limit, current_user, db, after_id=after_id)
+        page = next_cursor(emails, limit)
+        return emails, {"X-Next-Cursor": page} if page else {}
+
+    return await response_cache.respond(request, current_user.id, List[EmailResponse], produce, validate=False, db=db)
+
+
+@router.post("/bulk", response_model=EmailsBulkResponse, status_code=status.HTTP_201_CREATED,
+             description='Addresses the user already has are listed as duplicates, '
+                         'addresses of other users as taken.')
+async def create_emails(body: EmailsBulkModel, db: AsyncSession = Depends(get_db),
+                        current_user: User = Depends(auth_service.get_current_user)):
+    addresses = list(dict.fromkeys(body.emails))
+    taken = set(await repository_emails.get_taken_addresses(addresses, current_user, db))
+    try:
+        created = await repository_emails.create_emails([a for a in addresses if a not in taken], current_user, db)
+    except IntegrityError:
+        # another user added one of the addresses since they were looked up
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail="Some of the addresses belong to another user")
+    if created:
+        await response_cache.bump(current_user.id)
+    created_addresses = {email.email for email in created}
+    duplicates = [address for address in addresses if address not in created_addresses and address not in taken]
+    return {"created": created, "duplicates": duplicates,
+            "taken": [address for address in addresses if address in taken]}
+
+
+@router.delete("/bulk", response_model=EmailsBulkDeleteResponse)
+async def remove_emails(body: EmailIdsModel, db: AsyncSession = Depends(get_db),
+                        current_user: User = Depends(auth_service.get_current_user)):
+    deleted = await repository_emails.remove_emails(body.ids, current_user, db)
+    if deleted:
+        await response_cache.bump(current_user.id)
+    removed = set(deleted)
+    not_found = [email_id for email_id in dict.fromkeys(body.ids) if email_id not in removed]
+    return {"deleted": deleted, "not_found": not_found}
 
 
 @router.get("/{email_id}", response_model=EmailResponse)
-async def read_email(email_id: int, db: Session = Depends(get_db),
+async def read_email(email_id: int, db: AsyncSession = Depends(get_read_db),
                      current_user: User = Depends(auth_service.get_current_user)):
-    email = await repository_emails.get_email(email_id, db)
+    email = await repository_emails.get_email(email_id, current_user, db)
     if email is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Email not found")
     return email
 
 
 @router.post("/", response_model=EmailResponse, status_code=status.HTTP_201_CREATED)
-async def create_email(body: EmailModel, db: Session = Depends(get_db),
+async def create_email(body: EmailModel, db: AsyncSession = Depends(get_db),
         current_user: User = Depends(auth_service.get_current_user)):
-    return await repository_emails.create_email(body, current_user, db)
+    email = await repository_emails.create_email(body, current_user, db)
+    await response_cache.bump(current_user.id)
+    return email
 
 
 @router.put("/{email_id}", response_model=EmailResponse)
-async def update_email(body: EmailModel, email_id: int, db: Session = Depends(get_db),
+async def update_email(body: EmailModel, email_id: int, db: AsyncSession = Depends(get_db),
                      current_user: User = Depends(auth_service.get_current_user)):
     email = await repository_emails.update_email(email_id, body, current_user, db)
     if email is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Email not found")
+    await response_cache.bump(current_user.id)
     return email
 
 
 @router.delete("/{email_id}", response_model=EmailResponse)
-async def remove_email(email_id: int, db: Session = Depends(get_db),
+async def remove_email(email_id: int, db: AsyncSession = Depends(get_db),
                      current_user: User = Depends(auth_service.get_current_user)):
     email = await repository_emails.remove_email(email_id, current_user, db)
     if email is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Email not found")
+    await response_cache.bump(current_user.id)
     return email
@@ -1,35 +1,43 @@
-from fastapi import APIRouter, Depends, status, UploadFile, File
-from sqlalchemy.orm import Session
-import cloudinary
-import cloudinary.uploader
+from fastapi import APIRouter, Depends, Request
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.db import get_db
+from src.database.db import get_db, recent_writes
 from src.database.models import User
 from src.repository import users as repository_users
 from src.services.auth import auth_service
+from src.services.avatars import avatar_processor, avatar_storage, read_upload, store_avatar
 from src.conf.config import settings
 from src.schemas import UserDb
 
 router = APIRouter(prefix="/users", tags=["users"])
 
+AVATAR_FORM = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                }
+            }
+        },
+    }
+}
+
 
 @router.get("/me/", response_model=UserDb)
 async def read_users_me(current_user: User = Depends(auth_service.get_current_user)):
     return current_user
 
 
-@router.patch('/avatar', response_model=UserDb)
-async def update_avatar_user(file: UploadFile = File(), current_user: User = Depends(auth_service.get_current_user),
-                             db: Session = Depends(get_db)):
-    cloudinary.config(
-        cloud_name=settings.cloudinary_name,
-        api_key=settings.cloudinary_api_key,
-        api_secret=settings.cloudinary_api_secret,
-        secure=True
-    )
-
-    r = cloudinary.uploader.upload(file.file, public_id=f'NotesApp/{current_user.username}', overwrite=True)
-    src_url = cloudinary.CloudinaryImage(f'NotesApp/{current_user.username}')\
-                        .build_url(width=250, height=250, crop='fill', version=r.get('version'))
+@router.patch('/avatar', response_model=UserDb, openapi_extra=AVATAR_FORM)
+async def update_avatar_user(request: Request, current_user: User = Depends(auth_service.get_current_user),
+                             db: AsyncSession = Depends(get_db)):
+    file = await read_upload(request, "file", settings.avatar_max_bytes)
+    src_url = await store_avatar(file, current_user.username, avatar_storage, avatar_processor)
     user = await repository_users.update_avatar(current_user.email, src_url, db)
+    await auth_service.user_cache.invalidate(current_user.email)
+    await recent_writes.mark(current_user.id)
     return user
@@ -1,6 +1,7 @@
-from datetime import datetime
-from typing import List, Optional
-from pydantic import BaseModel, Field, EmailStr, PastDate
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel, Field, EmailStr, PastDate, root_validator, validator
 
 class UserModel(BaseModel):
     username: str = Field(min_length=5, max_length=16)
@@ -12,7 +13,7 @@ class UserDb(BaseModel):
     username: str
     email: str
     created_at: datetime
-    avatar: str
+    avatar: Optional[str]
 
     class Config:
         orm_mode = True
@@ -26,6 +27,9 @@ class TokenModel(BaseModel):
     refresh_token: str
     token_type: str = "bearer"
 
+EMAIL_MAX_LENGTH = 25
+
+
 class EmailModel(BaseModel):
     email: EmailStr = Field(max_length=25)
 
@@ -36,6 +40,31 @@ class EmailResponse(EmailModel):
     class Config:
         orm_mode = True
 
+class EmailsBulkModel(BaseModel):
+    emails: List[EmailStr] = Field(min_items=1, max_items=1000)
+
+    @validator("emails", each_item=True)
+    def email_length(cls, value):
+        # the limit of EmailModel.email, so bulk accepts exactly what single create does
+        if len(value) > EMAIL_MAX_LENGTH:
+            raise ValueError(f"ensure this value has at most {EMAIL_MAX_LENGTH} characters")
+        return value
+
+
+class EmailIdsModel(BaseModel):
+    ids: List[int] = Field(min_items=1, max_items=1000)
+
+
+class EmailsBulkResponse(BaseModel):
+    created: List[EmailResponse]
+    duplicates: List[str]
+    taken: List[str]
+
+
+class EmailsBulkDeleteResponse(BaseModel):
+    deleted: List[int]
+    not_found: List[int]
+
 class RequestEmail(BaseModel):
     email: EmailStr
 
@@ -52,7 +81,72 @@ class ContactModel(ContactBase):
 
 class ContactResponse(ContactBase):
     id: int
+    # the columns are nullable, contacts created before birthdays were stored have none
+    surname: Optional[str]
+    birthday: Optional[date]
+    description: Optional[str]
     emails: List[EmailResponse]
 
     class Config:
         orm_mode = True
+
+
+class ContactPatch(BaseModel):
+    """
+    Fields left out are kept, an explicit null clears surname, birthday or description.
+    """
+    name: Optional[str] = Field(None, max_length=50)
+    surname: Optional[str] = Field(None, max_length=100)
+    birthday: Optional[PastDate]
+    description: Optional[str] = Field(None, max_length=250)
+    emails: Optional[List[int]]
+
+    @root_validator(pre=True)
+    def some_change(cls, values):
+        changes = {name for name, value in values.items()
+                   if name in cls.__fields__ and (name != "emails" or value is not None)}
+        if not changes:
+            raise ValueError("No changes given")
+        return values
+
+    @validator("name", pre=True)
+    def name_not_null(cls, value):
+        if value is None:
+            raise ValueError("name cannot be cleared")
+        return value
+
+
+class ContactsBulkUpdateModel(BaseModel):
+    ids: List[int] = Field(min_items=1, max_items=1000)
+    changes: ContactPatch
+
+
+class ContactIdsModel(BaseModel):
+    ids: List[int] = Field(min_items=1, max_items=1000)
+
+
+class ContactsBulkUpdateResponse(BaseModel):
+    updated: List[int]
+    not_found: List[int]
+
+
+class ContactsBulkDeleteResponse(BaseModel):
+    deleted: List[int]
+    not_found: List[int]
+
+
+class BulkRowError(BaseModel):
+    row: int
+    errors: List[Dict[str, Any]]
+
+
+class BulkContactsResponse(BaseModel):
+    created: int
+    failed: int
+    ids: List[int]
+    errors: List[BulkRowError]
+
+
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
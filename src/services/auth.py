@@ -1,32 +1,42 @@
 from typing import Optional
 
-from celery.backends import redis
-from jose import JWTError, jwt
+from jose import JWTError
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.conf.config import settings
-from src.database.db import get_db
+from src.database.db import get_read_db, recent_writes
+from src.database.replicas import on_primary
 from src.repository import users as repository_users
+from src.services.cache import UserCache
+from src.services.metrics import InstrumentedRedis
+from src.services.passwords import password_hasher
+from src.services.profiling import phase
+from src.services.sessions import RefreshSessions
+from src.services.tokens import TokenCache, jwt_backend
 
 
 class Auth:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
     SECRET_KEY = settings.secret_key
     ALGORITHM = settings.algorithm
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
-    r = redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0)
+    r = InstrumentedRedis(host=settings.redis_host, port=settings.redis_port, db=0)
+    user_cache = UserCache(r, maxsize=settings.user_cache_size, ttl=settings.user_cache_ttl,
+                           local_ttl=settings.user_cache_local_ttl)
+    jwt = jwt_backend(settings.jwt_backend)
+    tokens = TokenCache(jwt, SECRET_KEY, ALGORITHM, maxsize=settings.jwt_cache_size)
+    sessions = RefreshSessions(r, ttl=settings.refresh_token_ttl)
 
+    async def verify_password(self, plain_password, hashed_password):
+        return await password_hasher.verify_password(plain_password, hashed_password)
 
+    async def verify_and_update_password(self, plain_password, hashed_password):
+        return await password_hasher.verify_and_update(plain_password, hashed_password)
 
-    def verify_password(self, plain_password, hashed_password):
-        return self.pwd_context.verify(plain_password, hashed_password)
-
-    def get_password_hash(self, password: str):
-        return self.pwd_context.hash(password)
+    async def get_password_hash(self, password: str):
+        return await password_hasher.hash_password(password)
 
     # define a function to generate a new access token
     async def create_access_token(self, data: dict, expires_delta: Optional[float] = None):
@@ -36,7 +46,7 @@ class Auth:
         else:
             expire = datetime.utcnow() + timedelta(minutes=15)
         to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "access_token"})
-        encoded_access_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
+        encoded_access_token = self.jwt.encode(to_encode, self.SECRET_KEY, self.ALGORITHM)
         return encoded_access_token
 
     # define a function to generate a new refresh token
@@ -45,61 +55,71 @@ class Auth:
         if expires_delta:
             expire = datetime.utcnow() + timedelta(seconds=expires_delta)
         else:
-            expire = datetime.utcnow() + timedelta(days=7)
+            expire = datetime.utcnow() + timedelta(seconds=settings.refresh_token_ttl)
         to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "refresh_token"})
-        encoded_refresh_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
+        encoded_refresh_token = self.jwt.encode(to_encode, self.SECRET_KEY, self.ALGORITHM)
         return encoded_refresh_token
 
-    async def decode_refresh_token(self, refresh_token: str):
+    async def decode_refresh_token(self, refresh_token: str) -> dict:
+        """
+        Verifies a refresh token and returns its claims, ``sub`` and ``jti`` among them.
+        """
         try:
-            payload = jwt.decode(refresh_token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            payload = self.tokens.decode(refresh_token)
             if payload['scope'] == 'refresh_token':
-                email = payload['sub']
-                return email
+                return payload
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid scope for token')
         except JWTError:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
 
-    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_read_db)):
         credentials_exception = HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-        try:
-            # Decode JWT
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
-            if payload['scope'] == 'access_token':
-                email = payload["sub"]
-                if email is None:
+        with phase("auth"):
+            try:
+                # Decode JWT, tokens seen before skip signature verification
+                payload = self.tokens.decode(token)
+                if payload['scope'] == 'access_token':
+                    email = payload["sub"]
+                    if email is None:
+                        raise credentials_exception
+                else:
                     raise credentials_exception
-            else:
+            except JWTError as e:
                 raise credentials_exception
-        except JWTError as e:
-            raise credentials_exception
 
-        user = await repository_users.get_user_by_email(email, db)
-        if user is None:
-            raise credentials_exception
-        return user
+            user = await self.user_cache.get(email)
+            if user is None:
+                # the cached row outlives the replication lag, it must not be a stale one
+                with on_primary(db):
+                    user = await repository_users.get_user_by_email(email, db)
+                if user is None:
+                    raise credentials_exception
+                # the same detached, credential-free snapshot a cache hit returns
+                user = await self.user_cache.set(user)
+            await recent_writes.route(db, user.id)
+            return user
 
     def create_email_token(self, data: dict):
         to_encode = data.copy()
         expire = datetime.utcnow() + timedelta(days=7)
         to_encode.update({"iat": datetime.utcnow(), "exp": expire})
-        token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
+        token = self.jwt.encode(to_encode, self.SECRET_KEY, self.ALGORITHM)
         return token
 
-async def get_email_from_token(self, token: str):
-  try:
-      payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
-      email = payload["sub"]
-      return email
-  except JWTError as e:
-      print(e)
-      raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-                          detail="Invalid token for email verification")
+    async def get_email_from_token(self, token: str):
+        try:
+            payload = self.jwt.decode(token, self.SECRET_KEY, self.ALGORITHM)
+            email = payload["sub"]
+            return email
+        except JWTError as e:
+            print(e)
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                                detail="Invalid token for email verification")
 
 
 auth_service = Auth()
\ No newline at end of file
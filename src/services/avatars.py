@@ -0,0 +1,207 @@
+import asyncio
+import io
+import re
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO
+
+import cloudinary
+import cloudinary.uploader
+from fastapi import HTTPException, Request, status
+from starlette.datastructures import UploadFile
+from starlette.formparsers import MultiPartParser
+
+from src.conf.config import settings
+from src.services.metrics import external_call
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - Pillow is an optional extra
+    Image = None
+
+CHUNK_SIZE = 64 * 1024
+
+
+async def _limited(stream: AsyncIterator[bytes], max_bytes: int) -> AsyncIterator[bytes]:
+    received = 0
+    async for chunk in stream:
+        received += len(chunk)
+        if received > max_bytes:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="File too large")
+        yield chunk
+
+
+async def read_upload(request: Request, field: str, max_bytes: int) -> UploadFile:
+    """
+    Parses a multipart request body chunk by chunk and returns one uploaded file.
+
+    The body is never read in full: a declared Content-Length above the limit is
+    rejected before reading, otherwise the parser stops with 413 as soon as more
+    than ``max_bytes`` have arrived. The file part itself is spooled by the parser,
+    in memory up to 1 MB and on disk beyond, since resizing and the Cloudinary SDK
+    both need the whole image; ``max_bytes`` bounds that spool.
+
+    :param request: The incoming request.
+    :type request: Request
+    :param field: The form field holding the file.
+    :type field: str
+    :param max_bytes: The largest accepted body, in bytes.
+    :type max_bytes: int
+    :return: The uploaded file.
+    :rtype: UploadFile
+    """
+    try:
+        declared = int(request.headers.get("content-length") or 0)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid Content-Length header")
+    if declared > max_bytes:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="File too large")
+    if not request.headers.get("content-type", "").startswith("multipart/form-data"):
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Expected multipart/form-data")
+    parser = MultiPartParser(request.headers, _limited(request.stream(), max_bytes), max_files=1, max_fields=1)
+    form = await parser.parse()
+    upload = form.get(field)
+    if not isinstance(upload, UploadFile):
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"Missing file field '{field}'")
+    if not (upload.content_type or "").startswith("image/"):
+        await upload.close()
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Avatar must be an image")
+    return upload
+
+
+class AvatarStorage(ABC):
+    """
+    Where avatars are kept. ``save`` stores an image under a name and returns its public URL.
+    """
+
+    @abstractmethod
+    async def save(self, name: str, file: BinaryIO, content_type: str) -> str:
+        ...
+
+
+class CloudinaryStorage(AvatarStorage):
+    """
+    Stores avatars on Cloudinary. The SDK is configured once, uploads run in a thread
+    because the SDK is synchronous.
+    """
+
+    def __init__(self, cloud_name: str, api_key: str, api_secret: str, folder: str = "NotesApp", size: int = 250):
+        cloudinary.config(cloud_name=cloud_name, api_key=api_key, api_secret=api_secret, secure=True)
+        self.folder = folder
+        self.size = size
+
+    def _upload(self, public_id: str, file: BinaryIO) -> str:
+        with external_call("cloudinary", "upload"):
+            r = cloudinary.uploader.upload(file, public_id=public_id, overwrite=True)
+        return cloudinary.CloudinaryImage(public_id).build_url(width=self.size, height=self.size, crop='fill',
+                                                               version=r.get('version'))
+
+    async def save(self, name: str, file: BinaryIO, content_type: str) -> str:
+        return await asyncio.to_thread(self._upload, f"{self.folder}/{name}", file)
+
+
+class LocalStorage(AvatarStorage):
+    """
+    Stores avatars as files in a directory served under ``base_url``.
+    """
+
+    EXTENSIONS = {"image/webp": ".webp", "image/png": ".png", "image/jpeg": ".jpg", "image/gif": ".gif"}
+
+    def __init__(self, root: str | Path, base_url: str):
+        self.root = Path(root)
+        self.base_url = base_url.rstrip("/")
+
+    def _write(self, filename: str, file: BinaryIO) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.root / f".{filename}.tmp"
+        with tmp.open("wb") as out:
+            while chunk := file.read(CHUNK_SIZE):
+                out.write(chunk)
+        tmp.replace(self.root / filename)
+
+    async def save(self, name: str, file: BinaryIO, content_type: str) -> str:
+        filename = re.sub(r"[^A-Za-z0-9_.-]", "_", name) + self.EXTENSIONS.get(content_type, "")
+        await asyncio.to_thread(self._write, filename, file)
+        return f"{self.base_url}/{filename}?v={time.time_ns()}"
+
+
+def _to_webp(file: BinaryIO, size: int) -> bytes:
+    with Image.open(file) as image:
+        image = image.convert("RGBA") if image.mode in ("P", "LA") else image
+        width, height = image.size
+        side = min(width, height)
+        box = ((width - side) // 2, (height - side) // 2, (width + side) // 2, (height + side) // 2)
+        image = image.resize((size, size), Image.LANCZOS, box=box)
+        out = io.BytesIO()
+        image.save(out, format="WEBP", quality=85)
+        return out.getvalue()
+
+
+class AvatarProcessor:
+    """
+    Crops avatars to a square, resizes them and re-encodes them as WebP in a worker pool.
+    Needs Pillow, without it images are stored as uploaded.
+    """
+
+    def __init__(self, size: int = 250, workers: int = 2):
+        self.size = size
+        self.workers = workers
+        self._executor: ThreadPoolExecutor | None = None
+
+    @property
+    def available(self) -> bool:
+        return Image is not None
+
+    async def process(self, file: BinaryIO) -> BinaryIO:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="avatar")
+        loop = asyncio.get_running_loop()
+        try:
+            data = await loop.run_in_executor(self._executor, _to_webp, file, self.size)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Unreadable image")
+        return io.BytesIO(data)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+async def store_avatar(upload: UploadFile, name: str, storage: AvatarStorage,
+                       processor: AvatarProcessor | None = None) -> str:
+    """
+    Optionally converts an uploaded avatar to a small WebP and hands it to the storage backend.
+
+    :param upload: The uploaded image.
+    :type upload: UploadFile
+    :param name: The name to store the avatar under.
+    :type name: str
+    :param storage: The storage backend.
+    :type storage: AvatarStorage
+    :param processor: The image processor, or None to store the image as uploaded.
+    :type processor: AvatarProcessor | None
+    :return: The public URL of the avatar.
+    :rtype: str
+    """
+    try:
+        file, content_type = upload.file, upload.content_type
+        if processor is not None and processor.available:
+            file, content_type = await processor.process(upload.file), "image/webp"
+        return await storage.save(name, file, content_type)
+    finally:
+        await upload.close()
+
+
+def _storage() -> AvatarStorage:
+    if settings.avatar_storage == "local":
+        return LocalStorage(settings.avatar_local_dir, settings.avatar_base_url)
+    return CloudinaryStorage(settings.cloudinary_name, settings.cloudinary_api_key, settings.cloudinary_api_secret,
+                             size=settings.avatar_size)
+
+
+avatar_storage = _storage()
+avatar_processor = AvatarProcessor(size=settings.avatar_size, workers=settings.avatar_workers) \
+    if settings.avatar_resize else None
@@ -0,0 +1,361 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from datetime import date, datetime
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from fastapi import Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from pydantic import parse_obj_as
+from redis.exceptions import RedisError
+
+from src.conf.config import settings
+from src.database.db import recent_writes
+from src.database.models import User
+from src.services.metrics import InstrumentedRedis
+from src.services.profiling import phase
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is an optional extra
+    orjson = None
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps_json(data: Any) -> bytes:
+    """
+    Encodes plain dicts, lists and dates as compact JSON, with orjson when it is installed.
+
+    :param data: The data to encode.
+    :type data: Any
+    :return: The JSON document.
+    :rtype: bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=_json_default).encode()
+
+
+class LRUCache:
+    """
+    A small in-process LRU cache with a time to live for every entry.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Returns the cached value, or default if the key is missing or expired.
+
+        :param key: The cache key.
+        :type key: Hashable
+        :param default: The value returned on a miss.
+        :type default: Any
+        :return: The cached value or default.
+        :rtype: Any
+        """
+        item = self._data.get(key)
+        if item is None:
+            return default
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Stores a value, evicting the least recently used entry when the cache is full.
+
+        :param key: The cache key.
+        :type key: Hashable
+        :param value: The value to store.
+        :type value: Any
+        :param ttl: Seconds the entry stays valid, defaults to the cache ttl.
+        :type ttl: float | None
+        """
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+@dataclass(frozen=True)
+class CachedUser:
+    """
+    A detached, read-only snapshot of a user row.
+
+    Credentials (password hash, refresh token) are never part of the snapshot.
+    """
+    id: int
+    username: str
+    email: str
+    created_at: datetime
+    confirmed: bool
+    avatar: Optional[str]
+
+    @classmethod
+    def from_user(cls, user: User) -> "CachedUser":
+        return cls(id=user.id, username=user.username, email=user.email, created_at=user.created_at,
+                   confirmed=user.confirmed, avatar=user.avatar)
+
+    def dumps(self) -> str:
+        data = asdict(self)
+        data["created_at"] = self.created_at.isoformat() if self.created_at else None
+        return json.dumps(data)
+
+    @classmethod
+    def loads(cls, raw: str | bytes) -> "CachedUser":
+        data = json.loads(raw)
+        if data["created_at"]:
+            data["created_at"] = datetime.fromisoformat(data["created_at"])
+        return cls(**data)
+
+
+class UserCache:
+    """
+    Two-tier cache of authenticated users keyed by the token subject.
+
+    The in-process LRU answers most lookups, Redis shares entries between workers.
+    Redis errors are treated as misses so authentication keeps working without it.
+    Invalidation clears the local tier of the current worker only, other workers
+    may keep serving their snapshot for up to ``local_ttl`` seconds.
+    """
+
+    def __init__(self, r, maxsize: int = 1024, ttl: int = 900, local_ttl: int = 30):
+        self.r = r
+        self.ttl = ttl
+        self.local = LRUCache(maxsize=maxsize, ttl=local_ttl)
+
+    @staticmethod
+    def key(email: str) -> str:
+        return f"user:{email}"
+
+    async def get(self, email: str) -> CachedUser | None:
+        """
+        Retrieves a cached user snapshot.
+
+        :param email: The token subject.
+        :type email: str
+        :return: The user snapshot, or None on a miss.
+        :rtype: CachedUser | None
+        """
+        user = self.local.get(email)
+        if user is not None:
+            return user
+        try:
+            raw = await self.r.get(self.key(email))
+        except RedisError:
+            return None
+        if raw is None:
+            return None
+        user = CachedUser.loads(raw)
+        self.local.set(email, user)
+        return user
+
+    async def set(self, user: User) -> CachedUser:
+        """
+        Stores a snapshot of the user in both tiers.
+
+        :param user: The user loaded from the database.
+        :type user: User
+        :return: The stored snapshot.
+        :rtype: CachedUser
+        """
+        snapshot = CachedUser.from_user(user)
+        self.local.set(user.email, snapshot)
+        try:
+            await self.r.set(self.key(user.email), snapshot.dumps(), ex=self.ttl)
+        except RedisError:
+            pass
+        return snapshot
+
+    async def invalidate(self, email: str) -> None:
+        """
+        Drops the cached user from both tiers.
+
+        :param email: The token subject.
+        :type email: str
+        """
+        self.local.pop(email)
+        try:
+            await self.r.delete(self.key(email))
+        except RedisError:
+            pass
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    """
+    A serialized JSON response body with its ETag and extra headers.
+    """
+    etag: str
+    body: bytes
+    headers: dict
+
+    @classmethod
+    def build(cls, body: bytes, headers: dict) -> "CachedResponse":
+        return cls(etag=f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"', body=body, headers=headers)
+
+    def dumps(self) -> bytes:
+        return json.dumps({"etag": self.etag, "headers": self.headers}).encode() + b"\n" + self.body
+
+    @classmethod
+    def loads(cls, raw: bytes) -> "CachedResponse":
+        meta, body = raw.split(b"\n", 1)
+        meta = json.loads(meta)
+        return cls(etag=meta["etag"], body=body, headers=meta["headers"])
+
+    def matches(self, if_none_match: str | None) -> bool:
+        if not if_none_match:
+            return False
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or self.etag in tags
+
+
+class ResponseCache:
+    """
+    Per-user cache of serialized read responses, in process and in Redis.
+
+    Entries are keyed by a per-user generation counter kept in Redis. Every write to
+    a user's contacts or emails increments it with ``bump``, which makes all cached
+    responses of the user unreachable at once; they expire after ``ttl``. Reading
+    the counter costs one Redis round trip per request, when Redis is down caching
+    is skipped.
+    """
+
+    def __init__(self, r, maxsize: int = 1024, ttl: int = 300, local_ttl: int = 30):
+        self.r = r
+        self.ttl = ttl
+        self.local = LRUCache(maxsize=maxsize, ttl=local_ttl)
+
+    async def generation(self, user_id: int) -> int | None:
+        """
+        Returns the current generation of a user's data, or None if Redis is unavailable.
+
+        :param user_id: The id of the user.
+        :type user_id: int
+        :return: The generation.
+        :rtype: int | None
+        """
+        try:
+            return int(await self.r.get(f"gen:{user_id}") or 0)
+        except RedisError:
+            return None
+
+    async def bump(self, user_id: int) -> None:
+        """
+        Invalidates every cached response of a user, after a write of theirs was committed.
+
+        The write is recorded first, see ``recent_writes``, so the user's next reads,
+        from any worker, go to the primary until the replicas have caught up.
+
+        :param user_id: The id of the user.
+        :type user_id: int
+        """
+        await recent_writes.mark(user_id)
+        try:
+            await self.r.incr(f"gen:{user_id}")
+        except RedisError:
+            # the generation could not move, drop what this worker holds at least
+            self.local.clear()
+
+    async def get(self, user_id: int, generation: int, key: str) -> CachedResponse | None:
+        cache_key = f"resp:{user_id}:{generation}:{key}"
+        entry = self.local.get(cache_key)
+        if entry is not None:
+            return entry
+        try:
+            raw = await self.r.get(cache_key)
+        except RedisError:
+            return None
+        if raw is None:
+            return None
+        entry = CachedResponse.loads(raw)
+        self.local.set(cache_key, entry)
+        return entry
+
+    async def set(self, user_id: int, generation: int, key: str, entry: CachedResponse) -> None:
+        cache_key = f"resp:{user_id}:{generation}:{key}"
+        self.local.set(cache_key, entry)
+        try:
+            await self.r.set(cache_key, entry.dumps(), ex=self.ttl)
+        except RedisError:
+            pass
+
+    async def respond(self, request: Request, user_id: int, model: Any,
+                      produce: Callable[[], Awaitable[tuple[Any, dict]]], validate: bool = True,
+                      db=None) -> Response:
+        """
+        Answers a GET request from the cache, calling ``produce`` only on a miss.
+
+        ``produce`` returns the response data and extra headers; the data is validated
+        against ``model`` and serialized once. Data that ``produce`` already built as
+        plain dicts in the shape of ``model`` can skip validation and is encoded as is.
+        A request whose If-None-Match matches the ETag gets 304 without a body.
+
+        A miss right after a write of the user is produced on the primary: the entry is
+        stored under the new generation and must not hold what a lagging replica still
+        returns. The write marker is checked after the generation is read, and ``bump``
+        sets it before moving the generation, so a new generation is never filled from
+        a replica.
+
+        :param request: The incoming request, its path and query are the cache key.
+        :type request: Request
+        :param user_id: The id of the current user.
+        :type user_id: int
+        :param model: The response model, e.g. List[ContactResponse].
+        :type model: Any
+        :param produce: Loads the data on a cache miss.
+        :type produce: Callable
+        :param validate: Whether to validate the data against ``model`` before encoding it.
+        :type validate: bool
+        :param db: The session ``produce`` reads with.
+        :type db: AsyncSession
+        :return: The response.
+        :rtype: Response
+        """
+        key = f"{request.url.path}?{request.url.query}"
+        generation = await self.generation(user_id)
+        entry = await self.get(user_id, generation, key) if generation is not None else None
+        if entry is None:
+            if db is not None:
+                await recent_writes.route(db, user_id)
+            data, headers = await produce()
+            with phase("serialization"):
+                if validate:
+                    body = json.dumps(jsonable_encoder(parse_obj_as(model, data)), separators=(",", ":")).encode()
+                else:
+                    body = dumps_json(data)
+            entry = CachedResponse.build(body, headers)
+            if generation is not None:
+                await self.set(user_id, generation, key, entry)
+        headers = {**entry.headers, "ETag": entry.etag, "Cache-Control": "private, no-cache"}
+        if entry.matches(request.headers.get("if-none-match")):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+response_cache = ResponseCache(InstrumentedRedis(host=settings.redis_host, port=settings.redis_port, db=0),
+                               maxsize=settings.response_cache_size, ttl=settings.response_cache_ttl,
+                               local_ttl=settings.response_cache_local_ttl)
@@ -1,39 +1,174 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from email.message import EmailMessage
+from email.utils import formataddr
 from pathlib import Path
 
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
-from pydantic import EmailStr
+import aiosmtplib
+from jinja2 import Environment, FileSystemLoader, Template, select_autoescape
 
 from src.conf.config import settings
-from src.services.auth import auth_service
-
-conf = ConnectionConfig(
-    MAIL_USERNAME=settings.mail_username,
-    MAIL_PASSWORD=settings.mail_password,
-    MAIL_FROM=EmailStr(settings.mail_from),
-    MAIL_PORT=settings.mail_port,
-    MAIL_SERVER=settings.mail_server,
-    MAIL_FROM_NAME="Desired Name",
-    MAIL_STARTTLS=False,
-    MAIL_SSL_TLS=True,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
-)
+from src.services.metrics import external_call
+
+logger = logging.getLogger(__name__)
+
+
+class MailSender:
+    """
+    Long-lived mail sender keeping a small pool of authenticated SMTP connections.
+
+    Connections are opened on first use and reused between messages. A connection
+    idle for longer than ``keepalive`` seconds is checked with NOOP before reuse and
+    replaced if the server dropped it. Templates are compiled once and cached.
+    """
+
+    def __init__(self, hostname: str, port: int, username: str | None, password: str | None, sender: str,
+                 sender_name: str = "Desired Name", use_tls: bool = True, start_tls: bool = False,
+                 validate_certs: bool = True, pool_size: int = 2, keepalive: float = 60, timeout: float = 30,
+                 template_folder: Path = Path(__file__).parent / 'templates'):
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.sender = formataddr((sender_name, sender))
+        self.use_tls = use_tls
+        self.start_tls = start_tls
+        self.validate_certs = validate_certs
+        self.pool_size = pool_size
+        self.keepalive = keepalive
+        self.timeout = timeout
+        self.env = Environment(loader=FileSystemLoader(template_folder), autoescape=select_autoescape())
+        self._templates: dict[str, Template] = {}
+        self._pool: asyncio.Queue | None = None
+
+    async def start(self) -> None:
+        """
+        Creates the connection pool, connections themselves are opened lazily.
+        """
+        if self._pool is None:
+            self._pool = asyncio.Queue()
+            for _ in range(self.pool_size):
+                self._pool.put_nowait((None, 0.0))
+
+    async def close(self) -> None:
+        """
+        Closes every pooled connection.
+        """
+        if self._pool is None:
+            return
+        pool, self._pool = self._pool, None
+        while not pool.empty():
+            client, _ = pool.get_nowait()
+            if client is not None and client.is_connected:
+                try:
+                    await client.quit()
+                except aiosmtplib.SMTPException:
+                    client.close()
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        client = aiosmtplib.SMTP(hostname=self.hostname, port=self.port, username=self.username,
+                                 password=self.password, use_tls=self.use_tls, start_tls=self.start_tls,
+                                 validate_certs=self.validate_certs, timeout=self.timeout)
+        await client.connect()
+        return client
 
+    async def _healthy(self, client: aiosmtplib.SMTP | None, last_used: float) -> bool:
+        if client is None or not client.is_connected:
+            return False
+        if time.monotonic() - last_used < self.keepalive:
+            return True
+        try:
+            await client.noop()
+            return True
+        except aiosmtplib.SMTPException:
+            client.close()
+            return False
 
-async def send_email(email: EmailStr, username: str, host: str):
-    try:
-        token_verification = auth_service.create_email_token({"sub": email})
-        message = MessageSchema(
-            subject="Confirm your email ",
-            recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
-            subtype=MessageType.html
-        )
-
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="email_template.html")
-    except ConnectionErrors as err:
-        print(err)
+    @asynccontextmanager
+    async def connection(self):
+        """
+        Borrows a connection from the pool, waiting while all of them are busy.
+        """
+        await self.start()
+        pool = self._pool
+        client, last_used = await pool.get()
+        try:
+            if not await self._healthy(client, last_used):
+                client = None
+                client = await self._connect()
+            yield client
+        except (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPConnectError, OSError):
+            if client is not None:
+                client.close()
+            client = None
+            raise
+        finally:
+            pool.put_nowait((client, time.monotonic()))
+
+    def render(self, template_name: str, **context) -> str:
+        """
+        Renders a template from the templates folder, compiling it only once.
+
+        :param template_name: The file name of the template.
+        :type template_name: str
+        :return: The rendered template.
+        :rtype: str
+        """
+        template = self._templates.get(template_name)
+        if template is None:
+            template = self._templates[template_name] = self.env.get_template(template_name)
+        return template.render(**context)
+
+    async def send(self, recipient: str, subject: str, template_name: str, context: dict) -> float:
+        """
+        Sends an HTML message rendered from a template over a pooled connection.
+
+        A connection the server closed in the meantime is replaced and the message
+        is sent once more.
+
+        :param recipient: The recipient address.
+        :type recipient: str
+        :param subject: The subject of the message.
+        :type subject: str
+        :param template_name: The file name of the template.
+        :type template_name: str
+        :param context: The template variables.
+        :type context: dict
+        :return: The time it took to send the message, in seconds.
+        :rtype: float
+        """
+        message = EmailMessage()
+        message["From"] = self.sender
+        message["To"] = recipient
+        message["Subject"] = subject
+        message.set_content(self.render(template_name, **context), subtype="html")
+        started = time.perf_counter()
+        for attempt in range(2):
+            try:
+                with external_call("smtp", "send"):
+                    async with self.connection() as client:
+                        await client.send_message(message)
+                break
+            except aiosmtplib.SMTPServerDisconnected:
+                if attempt:
+                    raise
+        latency = time.perf_counter() - started
+        logger.info("mail to %s sent in %.1f ms", recipient, latency * 1000)
+        return latency
+
+
+mail_sender = MailSender(
+    hostname=settings.mail_server,
+    port=settings.mail_port,
+    username=settings.mail_username,
+    password=settings.mail_password,
+    sender=settings.mail_from,
+    use_tls=settings.mail_ssl_tls,
+    start_tls=settings.mail_starttls,
+    validate_certs=settings.mail_validate_certs,
+    pool_size=settings.mail_pool_size,
+    keepalive=settings.mail_keepalive,
+)
 
@@ -0,0 +1,58 @@
+import csv
+import io
+import json
+from typing import AsyncIterator
+
+CSV_FIELDS = ["id", "name", "surname", "birthday", "description", "emails"]
+
+
+def _json_default(value):
+    return value.isoformat()
+
+
+async def to_ndjson(contacts: AsyncIterator[dict], chunk_size: int = 500) -> AsyncIterator[str]:
+    """
+    Encodes contacts as newline delimited JSON, ``chunk_size`` lines per chunk.
+
+    :param contacts: The contacts to encode.
+    :type contacts: AsyncIterator[dict]
+    :param chunk_size: The number of contacts sent to the client at once.
+    :type chunk_size: int
+    :return: The encoded chunks.
+    :rtype: AsyncIterator[str]
+    """
+    lines = []
+    async for contact in contacts:
+        lines.append(json.dumps(contact, default=_json_default))
+        if len(lines) >= chunk_size:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+async def to_csv(contacts: AsyncIterator[dict], chunk_size: int = 500) -> AsyncIterator[str]:
+    """
+    Encodes contacts as CSV with a header row, emails are joined with ``;``.
+
+    :param contacts: The contacts to encode.
+    :type contacts: AsyncIterator[dict]
+    :param chunk_size: The number of contacts sent to the client at once.
+    :type chunk_size: int
+    :return: The encoded chunks.
+    :rtype: AsyncIterator[str]
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_FIELDS)
+    rows = 0
+    async for contact in contacts:
+        writer.writerow([contact["id"], contact["name"], contact["surname"], contact["birthday"],
+                         contact["description"], ";".join(email["email"] for email in contact["emails"])])
+        rows += 1
+        if rows >= chunk_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            rows = 0
+    yield buffer.getvalue()
@@ -0,0 +1,82 @@
+import asyncio
+import logging
+from functools import lru_cache
+
+from libgravatar import Gravatar
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from src.repository import users as repository_users
+from src.services.auth import auth_service
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=4096)
+def gravatar_url(email: str) -> str:
+    """
+    Returns the Gravatar URL of an email address.
+
+    The URL is only a hash of the normalized address, nothing is fetched, so it is
+    memoized and safe to compute for many users at once.
+
+    :param email: The email address.
+    :type email: str
+    :return: The Gravatar image URL.
+    :rtype: str
+    """
+    return Gravatar(email.strip().lower()).get_image()
+
+
+async def assign_gravatar(session_factory: async_sessionmaker, user_id: int, email: str) -> None:
+    """
+    Background job run after signup: stores the Gravatar URL of the new user.
+
+    :param session_factory: Creates the database session used by the job.
+    :type session_factory: async_sessionmaker
+    :param user_id: The id of the new user.
+    :type user_id: int
+    :param email: The email of the new user.
+    :type email: str
+    """
+    try:
+        async with session_factory() as db:
+            await repository_users.set_default_avatars({user_id: gravatar_url(email)}, db)
+    except SQLAlchemyError:
+        logger.exception("could not assign the Gravatar of user %s", user_id)
+        return
+    await auth_service.user_cache.invalidate(email)
+
+
+async def assign_gravatars(session_factory: async_sessionmaker, batch_size: int = 500) -> int:
+    """
+    Gives every user without an avatar their Gravatar URL, one batch of users per query.
+
+    Backfills existing users, e.g. ``python -m src.services.gravatar``. Users that
+    uploaded an avatar in the meantime are left alone.
+
+    :param session_factory: Creates the database session used by the job.
+    :type session_factory: async_sessionmaker
+    :param batch_size: The number of users read and updated per statement.
+    :type batch_size: int
+    :return: The number of users processed.
+    :rtype: int
+    """
+    processed = 0
+    after_id = None
+    async with session_factory() as db:
+        while True:
+            users = await repository_users.get_users_without_avatar(batch_size, db, after_id=after_id)
+            if not users:
+                return processed
+            await repository_users.set_default_avatars({user.id: gravatar_url(user.email) for user in users}, db)
+            for user in users:
+                await auth_service.user_cache.invalidate(user.email)
+            processed += len(users)
+            after_id = users[-1].id
+
+
+if __name__ == "__main__":
+    from src.database.db import SessionLocal
+
+    print(f"{asyncio.run(assign_gravatars(SessionLocal))} users updated")
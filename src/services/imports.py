@@ -0,0 +1,127 @@
+import csv
+import io
+import json
+from typing import Any, Iterable, Iterator, List, Tuple
+
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import User
+from src.repository import contacts as repository_contacts
+from src.schemas import ContactModel
+
+
+def read_json(data: Any) -> Iterator[Tuple[int, Any]]:
+    """
+    Numbers the items of a JSON array body, starting from 1.
+    """
+    if not isinstance(data, list):
+        raise ValueError("Expected a JSON array of contacts")
+    return enumerate(data, start=1)
+
+
+def read_upload(file: UploadFile) -> Iterator[Tuple[int, Any]]:
+    """
+    Reads rows from an uploaded CSV or NDJSON file line by line.
+
+    CSV files need a header row with the ``ContactModel`` fields, emails are ids
+    separated by ``;``. Lines that are not valid JSON are yielded as the error. A
+    file that is not UTF-8 or not valid CSV is read up to the broken row, which is
+    yielded as the error.
+
+    :param file: The uploaded file.
+    :type file: UploadFile
+    :return: Row numbers with the parsed rows.
+    :rtype: Iterator[Tuple[int, Any]]
+    """
+    text = io.TextIOWrapper(file.file, encoding="utf-8", newline="")
+    if (file.filename or "").lower().endswith(".csv") or file.content_type == "text/csv":
+        rows = _read_csv(text)
+    else:
+        rows = _read_ndjson(text)
+    number = 0
+    try:
+        for number, row in rows:
+            yield number, row
+    except UnicodeDecodeError as err:
+        yield number + 1, ValueError(f"The file is not valid UTF-8: {err.reason} at byte {err.start}")
+    except csv.Error as err:
+        yield number + 1, ValueError(f"The file is not valid CSV: {err}")
+
+
+def _read_csv(text: io.TextIOWrapper) -> Iterator[Tuple[int, Any]]:
+    for number, row in enumerate(csv.DictReader(text), start=1):
+        row["emails"] = [email_id for email_id in (row.get("emails") or "").split(";") if email_id]
+        yield number, row
+
+
+def _read_ndjson(text: io.TextIOWrapper) -> Iterator[Tuple[int, Any]]:
+    number = 0
+    for line in text:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            yield number, json.loads(line)
+        except ValueError as err:
+            yield number, err
+
+
+def parse_chunk(rows: Iterator[Tuple[int, Any]], size: int, errors: list) -> Tuple[List[ContactModel], bool]:
+    """
+    Reads and validates rows until ``size`` contacts are valid or the rows run out.
+
+    Blocking: the rows may come from a file on disk, call it in a thread.
+
+    :param rows: Row numbers with the raw rows.
+    :type rows: Iterator[Tuple[int, Any]]
+    :param size: The number of valid contacts to return at most.
+    :type size: int
+    :param errors: The errors of the invalid rows are appended to it.
+    :type errors: list
+    :return: The valid contacts, and whether the rows ran out.
+    :rtype: Tuple[List[ContactModel], bool]
+    """
+    chunk = []
+    for number, data in rows:
+        try:
+            if isinstance(data, Exception):
+                raise data
+            chunk.append(ContactModel.parse_obj(data))
+        except ValidationError as err:
+            errors.append({"row": number, "errors": err.errors()})
+        except ValueError as err:
+            errors.append({"row": number, "errors": [{"loc": [], "msg": str(err), "type": "value_error"}]})
+        if len(chunk) >= size:
+            return chunk, False
+    return chunk, True
+
+
+async def import_contacts(rows: Iterable[Tuple[int, Any]], user: User, db: AsyncSession,
+                          chunk_size: int = 1000) -> dict:
+    """
+    Validates rows with ``ContactModel`` and inserts the valid ones in chunks.
+
+    Reading and validation run in the threadpool, a chunk at a time, so a large
+    upload does not block the event loop; only the inserts run on it.
+
+    :param rows: Row numbers with the raw rows.
+    :type rows: Iterable[Tuple[int, Any]]
+    :param user: The user to create the contacts for.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :param chunk_size: The number of contacts inserted per batch.
+    :type chunk_size: int
+    :return: Counts, the ids of the new contacts and the errors per row.
+    :rtype: dict
+    """
+    ids, errors = [], []
+    rows, done = iter(rows), False
+    while not done:
+        chunk, done = await run_in_threadpool(parse_chunk, rows, chunk_size, errors)
+        if chunk:
+            ids.extend(await repository_contacts.create_contacts(chunk, user, db))
+    return {"created": len(ids), "failed": len(errors), "ids": ids, "errors": errors}
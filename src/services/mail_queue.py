@@ -0,0 +1,240 @@
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+
+from fastapi import HTTPException, status
+from redis.exceptions import RedisError, WatchError
+
+from src.conf.config import settings
+from src.services.auth import auth_service
+from src.services.email import MailSender
+from src.services.metrics import InstrumentedRedis
+
+logger = logging.getLogger(__name__)
+
+
+class MailQueue:
+    """
+    Redis-backed queue of outbound confirmation emails.
+
+    Jobs wait in the ``queue`` list. A worker moves them to its own processing list
+    while sending and keeps a heartbeat key alive; jobs left in the processing list
+    of a worker whose heartbeat expired are put back by ``recover``. Failed jobs are
+    retried with exponential backoff through the ``retry`` sorted set and end up in
+    the ``dead`` list after ``max_attempts``.
+    """
+
+    def __init__(self, r, prefix: str = "mail", dedupe_window: int = 300, max_attempts: int = 5,
+                 backoff: float = 30, heartbeat_ttl: float = 60):
+        self.r = r
+        self.prefix = prefix
+        self.queue = f"{prefix}:queue"
+        self.workers = f"{prefix}:workers"
+        self.retry = f"{prefix}:retry"
+        self.dead = f"{prefix}:dead"
+        self.dedupe = f"{prefix}:dedupe"
+        self.dedupe_window = dedupe_window
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.heartbeat_ttl = heartbeat_ttl
+
+    def processing(self, worker_id: str) -> str:
+        return f"{self.prefix}:processing:{worker_id}"
+
+    def _alive(self, worker_id: str) -> str:
+        return f"{self.prefix}:alive:{worker_id}"
+
+    async def enqueue_confirmation(self, email: str, username: str, host: str) -> bool:
+        """
+        Queues a confirmation email unless one was queued for the address within the dedupe window.
+
+        The dedupe key and the job are written in one transaction, so a failed push
+        never leaves a dedupe key behind that would block the next attempt.
+
+        :param email: The recipient address.
+        :type email: str
+        :param username: The name used in the greeting.
+        :type username: str
+        :param host: The base URL of the confirmation link.
+        :type host: str
+        :return: True if the email was queued, False if one is queued already.
+        :rtype: bool
+        :raises HTTPException: 503 if Redis is unavailable.
+        """
+        key = f"{self.dedupe}:{email}"
+        job = {"email": email, "username": username, "host": str(host), "attempts": 0}
+        try:
+            async with self.r.pipeline(transaction=True) as pipe:
+                await pipe.watch(key)
+                if await pipe.exists(key):
+                    return False
+                pipe.multi()
+                pipe.set(key, 1, ex=self.dedupe_window)
+                pipe.lpush(self.queue, json.dumps(job))
+                await pipe.execute()
+            return True
+        except WatchError:
+            # queued concurrently by another request
+            return False
+        except RedisError:
+            logger.exception("could not queue the confirmation email to %s", email)
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail="Confirmation email could not be queued, request it again later",
+                                headers={"Retry-After": "5"})
+
+    async def heartbeat(self, worker_id: str) -> None:
+        """
+        Registers a worker and keeps its in-flight jobs claimed for ``heartbeat_ttl`` seconds.
+        """
+        async with self.r.pipeline(transaction=True) as pipe:
+            pipe.sadd(self.workers, worker_id)
+            pipe.set(self._alive(worker_id), 1, px=int(self.heartbeat_ttl * 1000))
+            await pipe.execute()
+
+    async def recover(self) -> int:
+        """
+        Moves the jobs of workers whose heartbeat expired back to the queue.
+
+        Jobs of live workers are left alone, they are still being sent.
+        """
+        moved = 0
+        for worker_id in await self.r.smembers(self.workers):
+            worker_id = worker_id.decode()
+            if await self.r.exists(self._alive(worker_id)):
+                continue
+            while await self.r.lmove(self.processing(worker_id), self.queue, "RIGHT", "RIGHT"):
+                moved += 1
+            await self.r.srem(self.workers, worker_id)
+        return moved
+
+    async def promote_retries(self) -> int:
+        """
+        Moves retries whose backoff has expired back to the queue.
+        """
+        due = await self.r.zrangebyscore(self.retry, "-inf", time.time())
+        for raw in due:
+            if await self.r.zrem(self.retry, raw):
+                await self.r.rpush(self.queue, raw)
+        return len(due)
+
+    async def take(self, worker_id: str, batch_size: int, timeout: float = 1) -> list:
+        """
+        Takes up to batch_size jobs into the processing list of a worker, waiting up to
+        timeout seconds for the first one.
+        """
+        processing = self.processing(worker_id)
+        raw = await self.r.blmove(self.queue, processing, timeout, "RIGHT", "LEFT")
+        if raw is None:
+            return []
+        batch = [raw]
+        while len(batch) < batch_size:
+            raw = await self.r.lmove(self.queue, processing, "RIGHT", "LEFT")
+            if raw is None:
+                break
+            batch.append(raw)
+        return batch
+
+    async def done(self, worker_id: str, raw) -> None:
+        await self.r.lrem(self.processing(worker_id), 1, raw)
+
+    async def fail(self, worker_id: str, raw) -> None:
+        """
+        Schedules a retry of a failed job, or moves it to the dead-letter list.
+        """
+        job = json.loads(raw)
+        job["attempts"] += 1
+        async with self.r.pipeline(transaction=True) as pipe:
+            pipe.lrem(self.processing(worker_id), 1, raw)
+            if job["attempts"] >= self.max_attempts:
+                pipe.lpush(self.dead, json.dumps(job))
+            else:
+                pipe.zadd(self.retry, {json.dumps(job): time.time() + self.backoff * 2 ** (job["attempts"] - 1)})
+            await pipe.execute()
+
+
+class MailWorker:
+    """
+    Drains a MailQueue in batches, sending each batch concurrently over the pooled SMTP connections.
+
+    While a batch is being sent the heartbeat is refreshed every third of its TTL,
+    so slow SMTP servers do not let other workers recover jobs still in flight.
+    When Redis fails the worker logs the error and waits, doubling the wait up to
+    ``max_backoff`` seconds, before it tries again.
+    """
+
+    def __init__(self, queue: MailQueue, sender: MailSender, batch_size: int = 50, worker_id: str | None = None,
+                 max_backoff: float = 30):
+        self.queue = queue
+        self.sender = sender
+        self.batch_size = batch_size
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.max_backoff = max_backoff
+        self.running = True
+
+    async def deliver(self, raw) -> None:
+        job = json.loads(raw)
+        try:
+            token = auth_service.create_email_token({"sub": job["email"]})
+            await self.sender.send(job["email"], "Confirm your email ", "email_template.html",
+                                   {"host": job["host"], "username": job["username"], "token": token})
+        except Exception as err:
+            logger.warning("mail to %s failed (attempt %s): %s", job["email"], job["attempts"] + 1, err)
+            await self.queue.fail(self.worker_id, raw)
+        else:
+            await self.queue.done(self.worker_id, raw)
+
+    async def keep_alive(self) -> None:
+        """
+        Refreshes the heartbeat every third of its TTL until cancelled.
+        """
+        while True:
+            await asyncio.sleep(self.queue.heartbeat_ttl / 3)
+            try:
+                await self.queue.heartbeat(self.worker_id)
+            except RedisError as err:
+                logger.warning("mail worker %s could not refresh its heartbeat: %s", self.worker_id, err)
+
+    async def run_once(self, timeout: float = 1) -> int:
+        """
+        Sends one batch of jobs and returns its size.
+        """
+        await self.queue.heartbeat(self.worker_id)
+        await self.queue.recover()
+        await self.queue.promote_retries()
+        batch = await self.queue.take(self.worker_id, self.batch_size, timeout)
+        if not batch:
+            return 0
+        heartbeat = asyncio.create_task(self.keep_alive())
+        try:
+            await asyncio.gather(*(self.deliver(raw) for raw in batch))
+        finally:
+            heartbeat.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await heartbeat
+        return len(batch)
+
+    async def run(self) -> None:
+        await self.sender.start()
+        backoff = 1
+        try:
+            while self.running:
+                try:
+                    await self.run_once()
+                except RedisError:
+                    logger.exception("mail worker %s lost Redis, retrying in %s s", self.worker_id, backoff)
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, self.max_backoff)
+                else:
+                    backoff = 1
+        finally:
+            await self.sender.close()
+
+
+mail_queue = MailQueue(InstrumentedRedis(host=settings.redis_host, port=settings.redis_port, db=0),
+                       dedupe_window=settings.mail_dedupe_window, max_attempts=settings.mail_max_attempts,
+                       backoff=settings.mail_retry_backoff, heartbeat_ttl=settings.mail_worker_heartbeat)
@@ -0,0 +1,207 @@
+import functools
+import inspect
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import redis.asyncio as redis
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, HistogramMetricFamily
+from redis.asyncio.client import Pipeline
+from sqlalchemy import event
+from starlette.responses import Response
+
+from src.services.profiling import phase, record_statement
+
+REQUESTS = Counter("http_requests_total", "HTTP requests by route template and status.",
+                   ["method", "route", "status"])
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency by route template.",
+                            ["method", "route"])
+IN_PROGRESS = Gauge("http_requests_in_progress", "HTTP requests being served.", ["method"])
+DB_QUERIES = Counter("db_queries_total", "SQL statements by repository function.", ["function"])
+DB_QUERY_LATENCY = Histogram("db_query_duration_seconds", "SQL statement latency by repository function.",
+                             ["function"])
+EXTERNAL_CALLS = Counter("external_calls_total", "Calls to Redis, SMTP and Cloudinary.",
+                         ["service", "operation", "outcome"])
+EXTERNAL_LATENCY = Histogram("external_call_duration_seconds", "Latency of calls to Redis, SMTP and Cloudinary.",
+                             ["service", "operation"])
+
+repository_function: ContextVar[str] = ContextVar("repository_function", default="other")
+
+
+def route_template(scope: dict) -> str:
+    """
+    Returns the path template of the matched route, e.g. ``/api/contacts/{contact_id}``,
+    so labels stay bounded whatever paths clients request.
+    """
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    # mounted apps (static files) have no route, their mount path is the root path
+    return scope.get("root_path") or "<unmatched>"
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording latency, in-flight requests and status codes per route template.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        method = scope["method"]
+        status_code = 500
+        in_progress = IN_PROGRESS.labels(method)
+        in_progress.inc()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_progress.dec()
+            route = route_template(scope)
+            REQUEST_LATENCY.labels(method, route).observe(time.perf_counter() - started)
+            REQUESTS.labels(method, route, str(status_code)).inc()
+
+
+def instrumented(func):
+    """
+    Attributes the SQL statements run inside a repository function to it in the
+    ``db_queries_total`` and ``db_query_duration_seconds`` metrics, and its own
+    time to the ``orm`` phase of a profiled request.
+    """
+    name = f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+    if inspect.isasyncgenfunction(func):
+        @functools.wraps(func)
+        async def generator_wrapper(*args, **kwargs):
+            token = repository_function.set(name)
+            try:
+                async for item in func(*args, **kwargs):
+                    yield item
+            finally:
+                repository_function.reset(token)
+
+        return generator_wrapper
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        token = repository_function.set(name)
+        try:
+            with phase("orm"):
+                return await func(*args, **kwargs)
+        finally:
+            repository_function.reset(token)
+
+    return wrapper
+
+
+def instrument_engine(engine) -> None:
+    """
+    Counts and times every statement an engine runs, labelled by repository function.
+
+    :param engine: The engine to instrument.
+    :type engine: AsyncEngine
+    """
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        function = repository_function.get()
+        DB_QUERIES.labels(function).inc()
+        DB_QUERY_LATENCY.labels(function).observe(elapsed)
+        record_statement(statement, parameters, elapsed)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(context):
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
+
+
+@contextmanager
+def external_call(service: str, operation: str):
+    """
+    Times a call to an external service and counts it as ``ok`` or ``error``.
+
+    :param service: The service, e.g. ``smtp``.
+    :type service: str
+    :param operation: The operation, e.g. ``send``.
+    :type operation: str
+    """
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        with phase(service):
+            yield
+        outcome = "ok"
+    finally:
+        EXTERNAL_LATENCY.labels(service, operation).observe(time.perf_counter() - started)
+        EXTERNAL_CALLS.labels(service, operation, outcome).inc()
+
+
+class InstrumentedPipeline(Pipeline):
+
+    async def execute(self, raise_on_error: bool = True):
+        with external_call("redis", "PIPELINE"):
+            return await super().execute(raise_on_error)
+
+
+class InstrumentedRedis(redis.Redis):
+    """
+    Redis client counting and timing its commands, pipelines count as one call.
+    """
+
+    async def execute_command(self, *args, **options):
+        with external_call("redis", str(args[0]).upper()):
+            return await super().execute_command(*args, **options)
+
+    def pipeline(self, transaction: bool = True, shard_hint=None) -> InstrumentedPipeline:
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class PoolCollector:
+    """
+    Exports the connection pool statistics of src.database.db.PoolMetrics.
+    """
+
+    def __init__(self, pool_metrics):
+        self.pool_metrics = pool_metrics
+
+    def collect(self):
+        snapshot = self.pool_metrics.snapshot()
+        for name in ("size", "in_use", "idle", "overflow"):
+            yield GaugeMetricFamily(f"db_pool_{name}", f"Connections {name.replace('_', ' ')} in the pool.",
+                                    value=snapshot[name])
+        yield CounterMetricFamily("db_pool_checkouts", "Connections checked out of the pool.",
+                                  value=snapshot["checkouts"])
+        yield CounterMetricFamily("db_pool_timeouts", "Checkouts that timed out waiting for a connection.",
+                                  value=snapshot["timeouts"])
+        buckets, total = [], 0
+        for bound, count in snapshot["wait_seconds_buckets"].items():
+            total += count
+            buckets.append((bound, total))
+        yield HistogramMetricFamily("db_pool_wait_seconds", "Time spent waiting for a pooled connection.",
+                                    buckets=buckets, sum_value=snapshot["wait_seconds_total"])
+
+
+def register_pool_metrics(pool_metrics) -> None:
+    REGISTRY.register(PoolCollector(pool_metrics))
+
+
+def metrics_response() -> Response:
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
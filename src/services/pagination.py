@@ -0,0 +1,82 @@
+import base64
+import binascii
+import math
+
+from fastapi import HTTPException, status
+
+
+def encode_cursor(last_id: int) -> str:
+    """
+    Builds an opaque cursor pointing after the row with the given id.
+
+    :param last_id: The id of the last row of the page.
+    :type last_id: int
+    :return: The cursor.
+    :rtype: str
+    """
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """
+    Reads the row id back from a cursor made by :func:`encode_cursor`.
+
+    :param cursor: The cursor sent by the client.
+    :type cursor: str
+    :return: The id of the last row of the previous page.
+    :rtype: int
+    """
+    try:
+        return int(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def next_cursor(rows: list, limit: int) -> str | None:
+    """
+    Returns the cursor of the next page, or None if this page is the last one.
+
+    :param rows: The rows of the current page, ordered by id, as objects or dicts.
+    :type rows: list
+    :param limit: The page size that was requested.
+    :type limit: int
+    :return: The cursor of the next page.
+    :rtype: str | None
+    """
+    if rows and len(rows) >= limit:
+        last = rows[-1]
+        return encode_cursor(last["id"] if isinstance(last, dict) else last.id)
+    return None
+
+
+def encode_rank_cursor(rank: float, last_id: int) -> str:
+    """
+    Builds an opaque cursor for results ordered by rank, then id.
+
+    :param rank: The rank of the last row of the page.
+    :type rank: float
+    :param last_id: The id of the last row of the page.
+    :type last_id: int
+    :return: The cursor.
+    :rtype: str
+    """
+    return base64.urlsafe_b64encode(f"{rank!r}:{last_id}".encode()).decode().rstrip("=")
+
+
+def decode_rank_cursor(cursor: str) -> tuple[float, int]:
+    """
+    Reads the rank and row id back from a cursor made by :func:`encode_rank_cursor`.
+
+    :param cursor: The cursor sent by the client.
+    :type cursor: str
+    :return: The rank and id of the last row of the previous page.
+    :rtype: tuple[float, int]
+    """
+    try:
+        rank, last_id = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split(":")
+        rank, last_id = float(rank), int(last_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    if not math.isfinite(rank):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return rank, last_id
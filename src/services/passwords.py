@@ -0,0 +1,114 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from src.conf.config import settings
+
+
+@lru_cache
+def _context(rounds: int) -> CryptContext:
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+
+
+def _hash(password: str, rounds: int) -> str:
+    return _context(rounds).hash(password)
+
+
+def _verify(password: str, hashed_password: str, rounds: int) -> bool:
+    return _context(rounds).verify(password, hashed_password)
+
+
+def _verify_and_update(password: str, hashed_password: str, rounds: int) -> tuple[bool, str | None]:
+    return _context(rounds).verify_and_update(password, hashed_password)
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt hashing and verification in a bounded worker pool.
+
+    bcrypt costs hundreds of milliseconds of CPU per call, running it on the event
+    loop would freeze every other request of the worker. A process pool is used by
+    default, a thread pool when processes are disabled or not available. When more
+    than ``workers + queue_size`` calls are pending new ones fail with 503.
+    """
+
+    def __init__(self, workers: int = 2, queue_size: int = 32, executor: str = "process", rounds: int = 12):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.executor_kind = executor
+        self.rounds = rounds
+        self._executor: Executor | None = None
+        self._pending = 0
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_kind == "process":
+                try:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                except (NotImplementedError, OSError):
+                    self._executor = None
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def _run(self, func, *args):
+        if self._pending >= self.workers + self.queue_size:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail="Too many authentication requests, try again later",
+                                headers={"Retry-After": "1"})
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, func, *args, self.rounds)
+        finally:
+            self._pending -= 1
+
+    async def hash_password(self, password: str) -> str:
+        """
+        Hashes a password with the configured bcrypt cost factor.
+
+        :param password: The plain password.
+        :type password: str
+        :return: The bcrypt hash.
+        :rtype: str
+        """
+        return await self._run(_hash, password)
+
+    async def verify_password(self, password: str, hashed_password: str) -> bool:
+        """
+        Checks a plain password against a stored hash.
+
+        :param password: The plain password.
+        :type password: str
+        :param hashed_password: The stored hash.
+        :type hashed_password: str
+        :return: True if the password matches.
+        :rtype: bool
+        """
+        return await self._run(_verify, password, hashed_password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> tuple[bool, str | None]:
+        """
+        Checks a password and rehashes it when the stored hash uses another cost factor.
+
+        :param password: The plain password.
+        :type password: str
+        :param hashed_password: The stored hash.
+        :type hashed_password: str
+        :return: Whether the password matches and the new hash, or None if no rehash is needed.
+        :rtype: tuple[bool, str | None]
+        """
+        return await self._run(_verify_and_update, password, hashed_password)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(workers=settings.password_hash_workers, queue_size=settings.password_hash_queue,
+                                 executor=settings.password_hash_executor, rounds=settings.bcrypt_rounds)
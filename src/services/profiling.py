@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+current_profile: ContextVar["RequestProfile | None"] = ContextVar("current_profile", default=None)
+
+
+class RequestProfile:
+    """
+    Time spent by one request, split by phase, and the SQL statements it ran.
+
+    Phases nest (auth runs a repository function which runs SQL), every phase
+    keeps only its own time so the phases add up to at most the request time.
+    """
+
+    def __init__(self, slow_query_ms: float = 100):
+        self.slow_query_ms = slow_query_ms
+        self.phases = defaultdict(float)
+        self.statements = []
+        self._stack = []
+
+    def enter(self, name: str) -> None:
+        self._stack.append([name, 0.0])
+
+    def leave(self, elapsed: float) -> None:
+        name, nested = self._stack.pop()
+        self.add(name, elapsed - nested)
+        if self._stack:
+            self._stack[-1][1] += nested
+
+    def add(self, name: str, elapsed: float) -> None:
+        self.phases[name] += elapsed
+        if self._stack:
+            self._stack[-1][1] += elapsed
+
+    def statement(self, statement: str, parameters, elapsed: float) -> None:
+        self.add("sql", elapsed)
+        self.statements.append((statement, parameters, elapsed))
+        if elapsed * 1000 >= self.slow_query_ms:
+            logger.warning("slow query (%.1f ms): %s %s", elapsed * 1000, statement, _shorten(parameters))
+
+    def report(self, method: str, path: str, total: float) -> str:
+        phases = dict(self.phases)
+        phases["other"] = max(0.0, total - sum(phases.values()))
+        lines = [f"slow request {method} {path} {total * 1000:.1f} ms: "
+                 + ", ".join(f"{name} {elapsed * 1000:.1f} ms" for name, elapsed in phases.items())]
+        for statement, parameters, elapsed in self.statements:
+            lines.append(f"  {elapsed * 1000:8.1f} ms  {' '.join(statement.split())}  {_shorten(parameters)}")
+        return "\n".join(lines)
+
+
+def _shorten(parameters, limit: int = 200) -> str:
+    text = repr(parameters)
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+@contextmanager
+def phase(name: str):
+    """
+    Accounts the time of the block to a phase of the request being profiled.
+    Does nothing when profiling is off.
+
+    :param name: The phase, e.g. ``auth`` or ``serialization``.
+    :type name: str
+    """
+    profile = current_profile.get()
+    if profile is None:
+        yield
+        return
+    profile.enter(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.leave(time.perf_counter() - started)
+
+
+def record_statement(statement: str, parameters, elapsed: float) -> None:
+    profile = current_profile.get()
+    if profile is not None:
+        profile.statement(statement, parameters, elapsed)
+
+
+class StackSampler:
+    """
+    Samples the event loop thread while a given task runs on it and counts the
+    stacks in the folded format of flamegraph.pl and speedscope.
+
+    Samples taken while the loop runs another task, or waits for I/O, are dropped,
+    so the flamegraph shows the CPU time of the sampled request only.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.current_task()
+        self._thread_id = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            if asyncio.current_task(self._loop) is not self._task:
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware logging requests slower than ``slow_ms`` with their time by phase
+    and their SQL statements, and running a sampling profiler on one request in
+    every ``sample_every``. Sampled stacks are written to ``directory`` as ``.folded``
+    files.
+    """
+
+    def __init__(self, app, slow_ms: float = 500, slow_query_ms: float = 100, sample_every: int = 0,
+                 sample_interval: float = 0.005, directory: str = "profiles"):
+        self.app = app
+        self.slow_ms = slow_ms
+        self.slow_query_ms = slow_query_ms
+        self.sample_every = sample_every
+        self.sample_interval = sample_interval
+        self.directory = directory
+        self.requests = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        self.requests += 1
+        sampler = None
+        if self.sample_every and self.requests % self.sample_every == 0:
+            sampler = StackSampler(self.sample_interval)
+            sampler.start()
+        profile = RequestProfile(self.slow_query_ms)
+        token = current_profile.set(profile)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            total = time.perf_counter() - started
+            current_profile.reset(token)
+            if sampler is not None:
+                sampler.stop()
+                await asyncio.to_thread(self.write, scope, sampler)
+            if total * 1000 >= self.slow_ms:
+                logger.warning(profile.report(scope["method"], scope["path"], total))
+
+    def write(self, scope: dict, sampler: StackSampler) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        name = re.sub(r"[^A-Za-z0-9]+", "_", scope["path"]).strip("_") or "root"
+        path = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{self.requests}-"
+                                            f"{scope['method']}-{name}.folded")
+        with open(path, "w") as f:
+            f.write(sampler.folded())
+        return path
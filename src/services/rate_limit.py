@@ -0,0 +1,126 @@
+import math
+import time
+from dataclasses import dataclass
+from typing import Dict
+
+from fastapi import Depends, HTTPException, status
+from redis.exceptions import RedisError
+
+from src.conf.config import settings
+from src.database.models import User
+from src.services.auth import auth_service
+from src.services.cache import LRUCache
+from src.services.metrics import InstrumentedRedis
+
+
+@dataclass(frozen=True)
+class Limit:
+    times: int
+    seconds: int
+
+    @classmethod
+    def parse(cls, value: str) -> "Limit":
+        """
+        Parses a limit written as ``"times/seconds"``, e.g. ``"10/60"``.
+        """
+        times, seconds = value.split("/")
+        return cls(times=int(times), seconds=int(seconds))
+
+
+class _Bucket:
+    __slots__ = ("window", "tokens")
+
+    def __init__(self, window: int):
+        self.window = window
+        self.tokens = 0
+
+
+class RateLimiter:
+    """
+    Fixed-window rate limiter per (route, user) that takes quota from Redis in batches.
+
+    Every window of ``seconds`` allows ``times`` requests in total, counted in Redis
+    and shared by all workers. A worker leases ``lease_fraction`` of the limit at once
+    (at least one request) into an in-process bucket and serves the next requests
+    from it without a Redis round trip. Leased but unused tokens are lost when the
+    window ends, so a user may be cut off slightly before the limit when many workers
+    hold partial leases.
+
+    When Redis is unreachable requests are let through (``fail_open``) or rejected
+    with 503.
+    """
+
+    def __init__(self, r, limits: Dict[str, str], lease_fraction: float = 0.2, fail_open: bool = True,
+                 maxsize: int = 10000):
+        self.r = r
+        self.limits = {name: Limit.parse(value) for name, value in limits.items()}
+        self.lease_fraction = lease_fraction
+        self.fail_open = fail_open
+        self.buckets = LRUCache(maxsize=maxsize, ttl=max((limit.seconds for limit in self.limits.values()), default=60))
+
+    def lease_size(self, limit: Limit) -> int:
+        return max(1, math.ceil(limit.times * self.lease_fraction))
+
+    async def _lease(self, key: str, limit: Limit, size: int) -> int:
+        async with self.r.pipeline(transaction=True) as pipe:
+            pipe.incrby(key, size)
+            pipe.expire(key, limit.seconds + 1)
+            used, _ = await pipe.execute()
+        before = used - size
+        return max(0, min(size, limit.times - before))
+
+    async def hit(self, name: str, user_id: int) -> None:
+        """
+        Counts one request of a user against the limit of a route.
+
+        :param name: The name of the limit in the ``rate_limits`` setting.
+        :type name: str
+        :param user_id: The id of the authenticated user.
+        :type user_id: int
+        :raises HTTPException: 429 when the limit is reached, 503 when Redis fails and the policy is fail-closed.
+        """
+        limit = self.limits.get(name)
+        if limit is None:
+            return
+        now = time.time()
+        window = int(now // limit.seconds)
+        bucket = self.buckets.get((name, user_id))
+        if bucket is None or bucket.window != window:
+            bucket = _Bucket(window)
+            self.buckets.set((name, user_id), bucket, ttl=limit.seconds)
+        if bucket.tokens > 0:
+            bucket.tokens -= 1
+            return
+        retry_after = str(math.ceil((window + 1) * limit.seconds - now))
+        try:
+            granted = await self._lease(f"rl:{name}:{user_id}:{window}", limit, self.lease_size(limit))
+        except RedisError:
+            if self.fail_open:
+                return
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail="Rate limiter unavailable", headers={"Retry-After": "1"})
+        if granted == 0:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too Many Requests",
+                                headers={"Retry-After": retry_after})
+        bucket.tokens += granted - 1
+
+
+rate_limiter = RateLimiter(InstrumentedRedis(host=settings.redis_host, port=settings.redis_port, db=0),
+                           limits=settings.rate_limits, lease_fraction=settings.rate_limit_lease_fraction,
+                           fail_open=settings.rate_limit_fail_open)
+
+
+def rate_limit(name: str):
+    """
+    Returns a route dependency applying the limit ``name`` from the ``rate_limits`` setting
+    to the authenticated user.
+
+    :param name: The name of the limit.
+    :type name: str
+    :return: The dependency.
+    """
+
+    async def dependency(current_user: User = Depends(auth_service.get_current_user)):
+        await rate_limiter.hit(name, current_user.id)
+
+    return dependency
@@ -0,0 +1,130 @@
+import uuid
+
+from fastapi import HTTPException, status
+from redis.exceptions import RedisError
+
+
+class TokenReuseError(Exception):
+    """
+    A refresh token was presented a second time, its whole family has been revoked.
+    """
+
+
+class RefreshSessions:
+    """
+    Refresh token sessions kept in Redis instead of the users table.
+
+    Every refresh token has a ``jti``; ``rt:{jti}`` holds its subject, its family
+    and a use counter, and expires with the token. A login starts a family, each
+    refresh rotates to a new token of the same family. A family is alive while
+    ``rtf:{family}`` exists, so revoking it invalidates all of its tokens at once.
+    Used tokens are kept until they expire: presenting one again means it was
+    stolen, and the family is revoked. ``rt:user:{email}`` lists the families of a
+    user, one per logged in device, for logging out everywhere.
+    """
+
+    def __init__(self, r, ttl: int = 7 * 24 * 3600):
+        self.r = r
+        self.ttl = ttl
+
+    @staticmethod
+    def _unavailable() -> HTTPException:
+        return HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Session store unavailable",
+                             headers={"Retry-After": "1"})
+
+    async def issue(self, email: str, family: str | None = None) -> str:
+        """
+        Registers a new refresh token and returns its jti.
+
+        Rotating within a family only refreshes ``rtf:{family}`` if it still exists,
+        so a revocation that lands while a token is rotated is not undone.
+
+        :param email: The token subject.
+        :type email: str
+        :param family: The family to rotate within, or None to start a new session.
+        :type family: str | None
+        :return: The jti of the new token.
+        :rtype: str
+        :raises HTTPException: 401 if the family has been revoked.
+        """
+        jti = uuid.uuid4().hex
+        rotating = family is not None
+        family = family or uuid.uuid4().hex
+        try:
+            async with self.r.pipeline(transaction=True) as pipe:
+                pipe.set(f"rtf:{family}", email, ex=self.ttl, xx=rotating)
+                pipe.hset(f"rt:{jti}", mapping={"sub": email, "family": family, "used": 0})
+                pipe.expire(f"rt:{jti}", self.ttl)
+                pipe.sadd(f"rt:user:{email}", family)
+                pipe.expire(f"rt:user:{email}", self.ttl)
+                alive, *_ = await pipe.execute()
+            if not alive:
+                # revoked in the meantime, drop what the transaction wrote
+                async with self.r.pipeline(transaction=True) as pipe:
+                    pipe.delete(f"rt:{jti}")
+                    pipe.srem(f"rt:user:{email}", family)
+                    await pipe.execute()
+        except RedisError:
+            raise self._unavailable()
+        if not alive:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+        return jti
+
+    async def rotate(self, jti: str, email: str) -> str:
+        """
+        Spends a refresh token and issues the next one of its family.
+
+        :param jti: The jti of the presented token.
+        :type jti: str
+        :param email: The subject of the presented token.
+        :type email: str
+        :return: The jti of the new token.
+        :rtype: str
+        :raises TokenReuseError: If the token was already used.
+        :raises HTTPException: 401 if the token is unknown, expired or revoked.
+        """
+        invalid = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+        try:
+            async with self.r.pipeline(transaction=True) as pipe:
+                pipe.hincrby(f"rt:{jti}", "used", 1)
+                pipe.hgetall(f"rt:{jti}")
+                used, session = await pipe.execute()
+            session = {key.decode(): value.decode() for key, value in session.items()}
+            if session.get("sub") != email:
+                await self.r.delete(f"rt:{jti}")
+                raise invalid
+            if used > 1:
+                await self.revoke_family(session["family"], email)
+                raise TokenReuseError(jti)
+        except RedisError:
+            raise self._unavailable()
+        return await self.issue(email, session["family"])
+
+    async def revoke_family(self, family: str, email: str) -> None:
+        try:
+            async with self.r.pipeline(transaction=True) as pipe:
+                pipe.delete(f"rtf:{family}")
+                pipe.srem(f"rt:user:{email}", family)
+                await pipe.execute()
+        except RedisError:
+            raise self._unavailable()
+
+    async def revoke_all(self, email: str) -> int:
+        """
+        Revokes every session of a user.
+
+        :param email: The user's email.
+        :type email: str
+        :return: The number of sessions revoked.
+        :rtype: int
+        """
+        try:
+            families = await self.r.smembers(f"rt:user:{email}")
+            async with self.r.pipeline(transaction=True) as pipe:
+                for family in families:
+                    pipe.delete(f"rtf:{family.decode()}")
+                pipe.delete(f"rt:user:{email}")
+                await pipe.execute()
+        except RedisError:
+            raise self._unavailable()
+        return len(families)
@@ -0,0 +1,95 @@
+import hashlib
+import time
+
+from jose import JWTError, jwt
+
+from src.services.cache import LRUCache
+
+
+class JoseBackend:
+    """
+    Encodes and verifies tokens with python-jose.
+    """
+
+    def encode(self, claims: dict, key: str, algorithm: str) -> str:
+        return jwt.encode(claims, key, algorithm=algorithm)
+
+    def decode(self, token: str, key: str, algorithm: str) -> dict:
+        return jwt.decode(token, key, algorithms=[algorithm])
+
+
+class PyJWTBackend:
+    """
+    Encodes and verifies tokens with PyJWT, which skips python-jose's generic JWK
+    handling. Errors are raised as jose's JWTError so callers do not depend on the backend.
+    """
+
+    def __init__(self):
+        import jwt as pyjwt
+
+        self.pyjwt = pyjwt
+
+    def encode(self, claims: dict, key: str, algorithm: str) -> str:
+        return self.pyjwt.encode(claims, key, algorithm=algorithm)
+
+    def decode(self, token: str, key: str, algorithm: str) -> dict:
+        try:
+            return self.pyjwt.decode(token, key, algorithms=[algorithm], options={"verify_iat": False})
+        except self.pyjwt.PyJWTError as e:
+            raise JWTError(str(e)) from e
+
+
+BACKENDS = {"jose": JoseBackend, "pyjwt": PyJWTBackend}
+
+
+def jwt_backend(name: str):
+    """
+    Returns the JWT backend configured by name, ``jose`` or ``pyjwt``.
+
+    :param name: The backend name.
+    :type name: str
+    :return: The backend.
+    """
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown JWT backend {name!r}, expected one of {', '.join(BACKENDS)}")
+
+
+class TokenCache:
+    """
+    Bounded LRU of verified tokens and their claims.
+
+    Entries are keyed by a SHA-256 of the token, so tokens are not kept in memory,
+    and expire together with the token's ``exp`` claim. Tokens without ``exp`` and
+    tokens that fail verification are never cached.
+    """
+
+    def __init__(self, backend, key: str, algorithm: str, maxsize: int = 4096):
+        self.backend = backend
+        self.key = key
+        self.algorithm = algorithm
+        self.cache = LRUCache(maxsize=maxsize)
+
+    def decode(self, token: str) -> dict:
+        """
+        Verifies a token, or returns the claims verified earlier.
+
+        :param token: The encoded token.
+        :type token: str
+        :return: The claims.
+        :rtype: dict
+        :raises JWTError: If the token is invalid or expired.
+        """
+        digest = hashlib.sha256(token.encode()).digest()
+        claims = self.cache.get(digest)
+        if claims is not None:
+            return claims
+        claims = self.backend.decode(token, self.key, self.algorithm)
+        ttl = claims.get("exp", 0) - time.time()
+        if ttl > 0:
+            self.cache.set(digest, claims, ttl=ttl)
+        return claims
+
+    def clear(self) -> None:
+        self.cache.clear()
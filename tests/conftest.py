@@ -1,50 +1,99 @@
+import asyncio
+from contextlib import contextmanager
+from unittest.mock import AsyncMock
+
 import pytest
+from fakeredis import FakeAsyncRedis
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import NullPool
 
 from src.database.models import Base
-from src.database.db import get_db
+from src.database.db import get_db, get_read_db, get_read_session_factory, get_session_factory
+from src.services.auth import auth_service
+from src.services.cache import response_cache
 from main import app
 
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
+SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///./test.db"
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine = create_async_engine(SQLALCHEMY_DATABASE_URL, poolclass=NullPool)
+TestingSessionLocal = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 
 @pytest.fixture(scope="module")
 def session():
     # Create the database
 
-    Base.metadata.drop_all(bind=engine)
-    Base.metadata.create_all(bind=engine)
+    async def init_models():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+
+    asyncio.run(init_models())
 
-    db = TestingSessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+    yield TestingSessionLocal
 
 
 @pytest.fixture(scope="module")
 def client(session):
     # Dependency override
 
-    def override_get_db():
-        try:
-            yield session
-        finally:
-            session.close()
+    async def override_get_db():
+        async with session() as db:
+            yield db
 
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
+    app.dependency_overrides[get_session_factory] = lambda: session
+    app.dependency_overrides[get_read_session_factory] = lambda: session
 
     yield TestClient(app)
 
 
+@pytest.fixture(scope="session", autouse=True)
+def user_cache_redis():
+    # Keep the user cache in process, the tests do not run a Redis server
+    r = AsyncMock()
+    r.get.return_value = None
+    auth_service.user_cache.r = r
+    return r
+
+
+@pytest.fixture(scope="session", autouse=True)
+def fake_redis():
+    # Response cache and refresh sessions need real Redis semantics
+    r = FakeAsyncRedis()
+    response_cache.r = r
+    auth_service.sessions.r = r
+    return r
+
+
 @pytest.fixture(scope="module")
 def user():
     return {"username": "deadpool", "email": "deadpool@example.com", "password": "123456789"}
+
+
+@pytest.fixture
+def query_budget():
+    """
+    Counts the SQL statements sent to the test database inside a ``with`` block
+    and fails the test when there are more than ``limit`` of them.
+    """
+
+    @contextmanager
+    def budget(limit: int):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+        assert len(statements) <= limit, f"{len(statements)} queries, budget {limit}:\n" + "\n".join(statements)
+
+    return budget
@@ -1,11 +1,17 @@
-from unittest.mock import MagicMock
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+from redis.exceptions import ConnectionError
+
+from sqlalchemy import select, update
 
 from src.database.models import User
+from src.services.mail_queue import mail_queue
 
 
-def test_create_user(client, user, monkeypatch):
-    mock_send_email = MagicMock()
-    monkeypatch.setattr("src.routes.auth.send_email", mock_send_email)
+def test_create_user(client, session, user, monkeypatch):
+    mock_enqueue = AsyncMock(return_value=True)
+    monkeypatch.setattr("src.routes.auth.mail_queue.enqueue_confirmation", mock_enqueue)
     response = client.post(
         "/api/auth/signup",
         json=user,
@@ -14,6 +20,24 @@ def test_create_user(client, user, monkeypatch):
     data = response.json()
     assert data["user"]["email"] == user.get("email")
     assert "id" in data["user"]
+    mock_enqueue.assert_awaited_once()
+
+    async def avatar():
+        async with session() as db:
+            return await db.scalar(select(User.avatar).filter(User.email == user["email"]))
+
+    # assigned by the background job once the response is sent
+    assert asyncio.run(avatar()).startswith("https://www.gravatar.com/avatar/")
+
+
+def test_create_user_mail_queue_down(client, monkeypatch):
+    r = MagicMock()
+    r.pipeline.side_effect = ConnectionError()
+    monkeypatch.setattr(mail_queue, "r", r)
+    response = client.post("/api/auth/signup",
+                           json={"username": "xavier", "email": "xavier@example.com", "password": "123456789"})
+    assert response.status_code == 201, response.text
+    assert "request it again" in response.json()["detail"]
 
 
 def test_repeat_create_user(client, user):
@@ -37,9 +61,12 @@ def test_login_user_not_confirmed(client, user):
 
 
 def test_login_user(client, session, user):
-    current_user: User = session.query(User).filter(User.email == user.get('email')).first()
-    current_user.confirmed = True
-    session.commit()
+    async def confirm_user():
+        async with session() as db:
+            await db.execute(update(User).where(User.email == user.get('email')).values(confirmed=True))
+            await db.commit()
+
+    asyncio.run(confirm_user())
     response = client.post(
         "/api/auth/login",
         data={"username": user.get('email'), "password": user.get('password')},
@@ -67,3 +94,48 @@ def test_login_wrong_email(client, user):
     assert response.status_code == 401, response.text
     data = response.json()
     assert data["detail"] == "Invalid email"
+
+
+def login(client, user):
+    response = client.post(
+        "/api/auth/login",
+        data={"username": user.get('email'), "password": user.get('password')},
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def refresh(client, token):
+    return client.get("/api/auth/refresh_token", headers={"Authorization": f"Bearer {token}"})
+
+
+def test_refresh_token_rotates(client, user, query_budget):
+    tokens = login(client, user)
+    with query_budget(0):
+        response = refresh(client, tokens["refresh_token"])
+    assert response.status_code == 200, response.text
+    rotated = response.json()
+    assert rotated["refresh_token"] != tokens["refresh_token"]
+    assert refresh(client, rotated["refresh_token"]).status_code == 200
+
+
+def test_refresh_token_reuse_revokes_family(client, user):
+    tokens = login(client, user)
+    other_device = login(client, user)
+    rotated = refresh(client, tokens["refresh_token"]).json()
+    response = refresh(client, tokens["refresh_token"])
+    assert response.status_code == 401, response.text
+    assert response.json()["detail"] == "Refresh token reused, the session has been revoked"
+    # the rotated token belonged to the same family, the other session is untouched
+    assert refresh(client, rotated["refresh_token"]).status_code == 401
+    assert refresh(client, other_device["refresh_token"]).status_code == 200
+
+
+def test_logout_all(client, user):
+    sessions = [login(client, user) for _ in range(2)]
+    response = client.post("/api/auth/logout_all",
+                           headers={"Authorization": f"Bearer {sessions[0]['access_token']}"})
+    assert response.status_code == 200, response.text
+    assert response.json()["revoked"] >= 2
+    for tokens in sessions:
+        assert refresh(client, tokens["refresh_token"]).status_code == 401
@@ -0,0 +1,390 @@
+import asyncio
+import base64
+import csv
+import io
+import json
+from datetime import date
+from typing import List
+from unittest.mock import AsyncMock
+
+import pytest
+from fakeredis import FakeAsyncRedis
+from fastapi.encoders import jsonable_encoder
+from pydantic import parse_obj_as
+
+from src.database.models import User, Email, Contact
+from src.repository import contacts as repository_contacts, users as repository_users
+from src.schemas import ContactResponse
+from src.services.auth import auth_service
+from src.services.cache import response_cache
+from src.services.rate_limit import Limit, rate_limiter
+
+
+@pytest.fixture(scope="module")
+def token(client, session):
+    async def seed():
+        async with session() as db:
+            user = User(username="wolverine", email="wolverine@example.com", password="hash", confirmed=True)
+            emails = [Email(email=f"logan{i}@example.com", user=user) for i in range(3)]
+            db.add_all([user, *emails])
+            db.add_all([Contact(name=f"name{i}", surname="surname", description="contact", birthday=date(1990, 5, i + 1),
+                                user=user, emails=emails[:i % 3 + 1]) for i in range(20)])
+            await db.commit()
+        return await auth_service.create_access_token(data={"sub": "wolverine@example.com"})
+
+    return asyncio.run(seed())
+
+
+@pytest.fixture(autouse=True)
+def limits(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "r", FakeAsyncRedis())
+    monkeypatch.setitem(rate_limiter.limits, "contacts:list", Limit(times=1000, seconds=60))
+    rate_limiter.buckets.clear()
+    return rate_limiter.limits
+
+
+def test_read_contacts(client, token, query_budget):
+    auth_service.user_cache.local.clear()
+    # user lookup, contacts, emails of all contacts
+    with query_budget(3):
+        response = client.get("/api/contacts/", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert len(data) == 20
+    assert [len(contact["emails"]) for contact in data[:3]] == [1, 2, 3]
+
+
+def test_read_contacts_matches_response_model(client, token, session):
+    async def validated():
+        async with session() as db:
+            user = await repository_users.get_user_by_email("wolverine@example.com", db)
+            contacts = await repository_contacts.get_contacts(0, 100, user, db)
+            return jsonable_encoder(parse_obj_as(List[ContactResponse], contacts))
+
+    response = client.get("/api/contacts/?limit=100", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    expected = asyncio.run(validated())
+    for contact in expected:
+        contact["emails"].sort(key=lambda email: email["id"])
+    assert response.json() == expected
+    schema = client.get("/openapi.json").json()["paths"]["/api/contacts/"]["get"]["responses"]["200"]
+    assert schema["content"]["application/json"]["schema"]["items"] == {"$ref": "#/components/schemas/ContactResponse"}
+
+
+def test_read_contact(client, token, query_budget):
+    auth_service.user_cache.local.clear()
+    with query_budget(3):
+        response = client.get("/api/contacts/3", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    assert len(response.json()["emails"]) == 3
+
+
+def test_read_contacts_cached(client, token, query_budget):
+    headers = {"Authorization": f"Bearer {token}"}
+    first = client.get("/api/contacts/?limit=5", headers=headers)
+    assert first.status_code == 200, first.text
+    etag = first.headers["ETag"]
+    # served from the response cache, the user comes from the user cache
+    with query_budget(0):
+        cached = client.get("/api/contacts/?limit=5", headers=headers)
+        not_modified = client.get("/api/contacts/?limit=5", headers={**headers, "If-None-Match": etag})
+    assert cached.content == first.content
+    assert cached.headers["X-Next-Cursor"] == first.headers["X-Next-Cursor"]
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+
+
+def test_contact_write_invalidates_cache(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    before = client.get("/api/contacts/1", headers=headers)
+    body = {**before.json(), "description": "updated", "emails": [email["id"] for email in before.json()["emails"]]}
+    response = client.put("/api/contacts/1", json=body, headers=headers)
+    assert response.status_code == 200, response.text
+    after = client.get("/api/contacts/1", headers={**headers, "If-None-Match": before.headers["ETag"]})
+    assert after.status_code == 200
+    assert after.json()["description"] == "updated"
+    assert after.headers["ETag"] != before.headers["ETag"]
+
+
+def test_read_contacts_rate_limited(client, token, limits):
+    limits["contacts:list"] = Limit(times=2, seconds=60)
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/api/contacts/", headers=headers).status_code == 200
+    assert client.get("/api/contacts/", headers=headers).status_code == 200
+    response = client.get("/api/contacts/", headers=headers)
+    assert response.status_code == 429, response.text
+    assert int(response.headers["Retry-After"]) <= 60
+
+
+def test_metrics_use_route_templates(client, token):
+    client.get("/api/contacts/3", headers={"Authorization": f"Bearer {token}"})
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert 'route="/api/contacts/{contact_id}"' in response.text
+    assert 'route="/api/contacts/3"' not in response.text
+    assert "db_pool_in_use" in response.text
+
+
+def test_read_contact_not_found(client, token):
+    response = client.get("/api/contacts/1000", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 404, response.text
+    assert response.json()["detail"] == "Contact not found"
+
+
+def test_read_contacts_cursor(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get("/api/contacts/", params={"limit": 8}, headers=headers)
+    ids = [contact["id"] for contact in response.json()]
+    while "X-Next-Cursor" in response.headers:
+        response = client.get("/api/contacts/", params={"limit": 8, "cursor": response.headers["X-Next-Cursor"]},
+                              headers=headers)
+        assert response.status_code == 200, response.text
+        ids.extend(contact["id"] for contact in response.json())
+    assert ids == sorted(ids)
+    assert len(ids) == 20
+
+
+def test_search_contacts_invalid_parameters(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    for limit in (0, 101):
+        response = client.get("/api/contacts/search", params={"q": "name", "limit": limit}, headers=headers)
+        assert response.status_code == 422, response.text
+    for rank in ("nan", "inf", "-inf"):
+        cursor = base64.urlsafe_b64encode(f"{rank}:5".encode()).decode()
+        response = client.get("/api/contacts/search", params={"q": "name", "cursor": cursor}, headers=headers)
+        assert response.status_code == 400, response.text
+        assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_read_contacts_invalid_cursor(client, token):
+    response = client.get("/api/contacts/", params={"cursor": "not a cursor"},
+                          headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 400, response.text
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_export_contacts_ndjson(client, token, monkeypatch):
+    user_id = client.get("/api/users/me/", headers={"Authorization": f"Bearer {token}"}).json()["id"]
+    route = AsyncMock()
+    monkeypatch.setattr("src.routes.contacts.recent_writes.route", route)
+    response = client.get("/api/contacts/export", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    # the export's own session is routed like the request session of get_current_user
+    assert [call.args[1] for call in route.await_args_list] == [user_id, user_id]
+    assert route.await_args_list[0].args[0] is not route.await_args_list[1].args[0]
+    assert response.headers["content-type"] == "application/x-ndjson"
+    contacts = [json.loads(line) for line in response.text.splitlines()]
+    assert len(contacts) == 20
+    assert contacts[0]["birthday"] == "1990-05-01"
+    assert [len(contact["emails"]) for contact in contacts[:3]] == [1, 2, 3]
+
+
+def test_export_contacts_csv(client, token):
+    response = client.get("/api/contacts/export", params={"format": "csv"},
+                          headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == 20
+    assert rows[2]["emails"] == "logan0@example.com;logan1@example.com;logan2@example.com"
+
+
+def test_create_contacts_bulk_json(client, token):
+    rows = [{"name": f"bulk{i}", "surname": "surname", "birthday": "1991-01-01", "description": "bulk",
+             "emails": [1, 2]} for i in range(5)]
+    rows.insert(2, {"name": "broken", "surname": "surname", "birthday": "3000-01-01", "description": "bulk",
+                    "emails": []})
+    response = client.post("/api/contacts/bulk", json=rows, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 201, response.text
+    data = response.json()
+    assert data["created"] == 5
+    assert data["failed"] == 1
+    assert data["errors"][0]["row"] == 3
+    contact = client.get(f"/api/contacts/{data['ids'][0]}", headers={"Authorization": f"Bearer {token}"}).json()
+    assert [email["id"] for email in contact["emails"]] == [1, 2]
+
+
+def test_create_contacts_bulk_csv(client, token):
+    content = "name,surname,birthday,description,emails\nbulk,csv,1991-01-01,from csv,1;3\n"
+    response = client.post("/api/contacts/bulk", files={"file": ("contacts.csv", content, "text/csv")},
+                           headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 201, response.text
+    data = response.json()
+    assert data["created"] == 1
+    assert data["failed"] == 0
+
+
+def test_create_contacts_bulk_ndjson(client, token):
+    content = '{"name": "bulk", "surname": "ndjson", "birthday": "1991-01-01", "description": "x", "emails": []}\n' \
+              'not json\n'
+    response = client.post("/api/contacts/bulk", files={"file": ("contacts.ndjson", content, "application/x-ndjson")},
+                           headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 201, response.text
+    data = response.json()
+    assert data["created"] == 1
+    assert data["errors"][0]["row"] == 2
+
+
+def test_create_contacts_bulk_unreadable_files(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    content = "name,surname,birthday,description,emails\nJosé,csv,1991-01-01,latin-1,\n".encode("latin-1")
+    response = client.post("/api/contacts/bulk", files={"file": ("contacts.csv", content, "text/csv")},
+                           headers=headers)
+    assert response.status_code == 201, response.text
+    data = response.json()
+    assert data["created"] == 0
+    assert "not valid UTF-8" in data["errors"][0]["errors"][0]["msg"]
+
+    content = "name,surname,birthday,description,emails\nbulk,csv,1991-01-01,ok,\n" \
+              f"big,csv,1991-01-01,{'x' * 200000},\n"
+    response = client.post("/api/contacts/bulk", files={"file": ("contacts.csv", content, "text/csv")},
+                           headers=headers)
+    assert response.status_code == 201, response.text
+    data = response.json()
+    assert data["created"] == 1
+    assert data["errors"][0]["row"] == 2
+    assert "not valid CSV" in data["errors"][0]["errors"][0]["msg"]
+
+
+def test_search_contacts(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    contact = {"name": "Jean", "surname": "Grey", "birthday": "1990-01-01", "description": "telepath", "emails": []}
+    client.post("/api/contacts/", json=contact, headers=headers)
+    contact.update(name="Jeanette", description="pilot, knows Jean Grey", emails=[2])
+    client.post("/api/contacts/", json=contact, headers=headers)
+    response = client.get("/api/contacts/search", params={"q": "jean gre"}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert sorted(contact["name"] for contact in response.json()) == ["Jean", "Jeanette"]
+    response = client.get("/api/contacts/search", params={"q": "telepath"}, headers=headers)
+    assert [contact["name"] for contact in response.json()] == ["Jean"]
+    response = client.get("/api/contacts/search", params={"q": "logan1@"}, headers=headers)
+    assert "Jeanette" in [contact["name"] for contact in response.json()]
+
+
+def test_search_contacts_cursor(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get("/api/contacts/search", params={"q": "name", "limit": 7}, headers=headers)
+    ids = [contact["id"] for contact in response.json()]
+    while "X-Next-Cursor" in response.headers:
+        response = client.get("/api/contacts/search",
+                              params={"q": "name", "limit": 7, "cursor": response.headers["X-Next-Cursor"]},
+                              headers=headers)
+        ids.extend(contact["id"] for contact in response.json())
+    assert len(ids) == len(set(ids)) == 20
+
+
+def test_upcoming_birthdays(client, token, session):
+    headers = {"Authorization": f"Bearer {token}"}
+    for name, birthday in [("Storm", "1990-12-31"), ("Rogue", "1991-01-02"), ("Gambit", "1991-01-10")]:
+        contact = {"name": name, "surname": "x", "birthday": birthday, "description": "x", "emails": []}
+        client.post("/api/contacts/", json=contact, headers=headers)
+
+    async def upcoming(today, days):
+        async with session() as db:
+            user = await repository_users.get_user_by_email("wolverine@example.com", db)
+            contacts = await repository_contacts.get_upcoming_birthdays(days, 100, user, db, today=today)
+            return [contact.name for contact in contacts]
+
+    names = asyncio.run(upcoming(date(2024, 12, 29), 7))
+    assert names[0] == "Storm"
+    assert names[-1] == "Rogue"
+    assert "Gambit" not in names
+    assert asyncio.run(upcoming(date(2024, 5, 18), 3)) == ["name17", "name18", "name19"]
+    response = client.get("/api/contacts/birthdays", params={"days": 400}, headers=headers)
+    assert response.status_code == 422, response.text
+
+
+@pytest.fixture(scope="module")
+def other_contact(session):
+    async def seed():
+        async with session() as db:
+            user = User(username="sabretooth", email="sabretooth@example.com", password="hash", confirmed=True)
+            contact = Contact(name="Victor", surname="Creed", description="x", birthday=date(1970, 1, 1), user=user)
+            db.add(contact)
+            await db.commit()
+            return contact.id
+
+    return asyncio.run(seed())
+
+
+def test_update_contact_of_other_user(client, token, other_contact):
+    contact = {"name": "x", "surname": "x", "birthday": "1990-01-01", "description": "x", "emails": []}
+    response = client.put(f"/api/contacts/{other_contact}", json=contact, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 404, response.text
+
+
+def test_update_contacts_bulk(client, token, other_contact, query_budget):
+    headers = {"Authorization": f"Bearer {token}"}
+    client.get("/api/contacts/4", headers=headers)
+    emails = client.get("/api/emails/", headers=headers).json()
+    body = {"ids": [4, 5, 6, other_contact, 10 ** 6],
+            "changes": {"description": "teammate", "emails": [emails[0]["id"], emails[1]["id"]]}}
+    auth_service.user_cache.local.clear()
+    # user lookup, update, association delete and insert
+    with query_budget(4):
+        response = client.patch("/api/contacts/bulk", json=body, headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json() == {"updated": [4, 5, 6], "not_found": [other_contact, 10 ** 6]}
+    for contact_id in (4, 5, 6):
+        contact = client.get(f"/api/contacts/{contact_id}", headers=headers).json()
+        assert contact["description"] == "teammate"
+        assert contact["name"] == f"name{contact_id - 1}"
+        assert sorted(email["id"] for email in contact["emails"]) == [emails[0]["id"], emails[1]["id"]]
+
+    response = client.patch("/api/contacts/bulk", json={"ids": [4], "changes": {"emails": []}}, headers=headers)
+    assert response.json()["updated"] == [4]
+    assert client.get("/api/contacts/4", headers=headers).json()["emails"] == []
+
+
+def test_update_contacts_bulk_clears_nullable_fields(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    body = {"ids": [5], "changes": {"surname": None, "birthday": None}}
+    response = client.patch("/api/contacts/bulk", json=body, headers=headers)
+    assert response.status_code == 200, response.text
+    contact = client.get("/api/contacts/5", headers=headers).json()
+    assert contact["surname"] is None
+    assert contact["birthday"] is None
+    assert contact["description"] == "teammate"
+    response = client.patch("/api/contacts/bulk", json={"ids": [5], "changes": {"name": None}}, headers=headers)
+    assert response.status_code == 422, response.text
+
+
+def test_update_contacts_bulk_without_changes(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    user_id = client.get("/api/users/me/", headers=headers).json()["id"]
+    generation = asyncio.run(response_cache.generation(user_id))
+    for changes in ({}, {"emails": None}, {"unknown": 1}):
+        response = client.patch("/api/contacts/bulk", json={"ids": [5], "changes": changes}, headers=headers)
+        assert response.status_code == 422, response.text
+    assert asyncio.run(response_cache.generation(user_id)) == generation
+
+
+def test_remove_contacts_bulk(client, token, other_contact):
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.request("DELETE", "/api/contacts/bulk", json={"ids": [7, 8, other_contact]}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json() == {"deleted": [7, 8], "not_found": [other_contact]}
+    assert client.get("/api/contacts/7", headers=headers).status_code == 404
+    response = client.request("DELETE", "/api/contacts/bulk", json={"ids": []}, headers=headers)
+    assert response.status_code == 422
+
+
+def test_read_contacts_without_birthday(client, session):
+    async def seed():
+        async with session() as db:
+            user = User(username="legacy", email="legacy@example.com", password="hash", confirmed=True)
+            # contacts created before the birthday column was added have none
+            contact = Contact(name="Kurt", user=user)
+            db.add(contact)
+            await db.commit()
+            return contact.id, await auth_service.create_access_token(data={"sub": "legacy@example.com"})
+
+    contact_id, legacy_token = asyncio.run(seed())
+    headers = {"Authorization": f"Bearer {legacy_token}"}
+    response = client.get("/api/contacts/", headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json() == [{"id": contact_id, "name": "Kurt", "surname": None, "birthday": None,
+                                "description": None, "emails": []}]
+    assert parse_obj_as(List[ContactResponse], response.json())[0].birthday is None
+    response = client.get(f"/api/contacts/{contact_id}", headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["birthday"] is None
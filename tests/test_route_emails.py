@@ -0,0 +1,63 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from src.database.models import User, Email
+from src.repository import emails as repository_emails
+from src.services.auth import auth_service
+
+
+@pytest.fixture(scope="module")
+def token(client, session):
+    async def seed():
+        async with session() as db:
+            user = User(username="cyclops", email="cyclops@example.com", password="hash", confirmed=True)
+            other = User(username="jean", email="jean@example.com", password="hash", confirmed=True)
+            db.add_all([user, other, Email(email="scott@example.com", user=user),
+                        Email(email="phoenix@example.com", user=other)])
+            await db.commit()
+        return await auth_service.create_access_token(data={"sub": "cyclops@example.com"})
+
+    return asyncio.run(seed())
+
+
+def test_create_emails_bulk(client, token, query_budget):
+    body = {"emails": ["scott@example.com", "summers@example.com", "phoenix@example.com", "xmen@example.com",
+                       "summers@example.com"]}
+    auth_service.user_cache.local.clear()
+    # user lookup, other users' addresses, insert
+    with query_budget(3):
+        response = client.post("/api/emails/bulk", json=body, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 201, response.text
+    data = response.json()
+    assert sorted(email["email"] for email in data["created"]) == ["summers@example.com", "xmen@example.com"]
+    assert data["duplicates"] == ["scott@example.com"]
+    assert data["taken"] == ["phoenix@example.com"]
+
+
+def test_create_emails_bulk_validates_length(client, token):
+    body = {"emails": ["ok@example.com", "a-rather-long-address@example.com"]}
+    response = client.post("/api/emails/bulk", json=body, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 422, response.text
+    assert response.json()["detail"][0]["loc"] == ["body", "emails", 1]
+
+
+def test_create_emails_bulk_taken_meanwhile(client, token):
+    with patch.object(repository_emails, "get_taken_addresses", AsyncMock(return_value=[])):
+        response = client.post("/api/emails/bulk", json={"emails": ["new@example.com", "phoenix@example.com"]},
+                               headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 409, response.text
+    emails = client.get("/api/emails/", headers={"Authorization": f"Bearer {token}"}).json()
+    assert "new@example.com" not in [email["email"] for email in emails]
+
+
+def test_remove_emails_bulk(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    ids = [email["id"] for email in client.get("/api/emails/", headers=headers).json()]
+    response = client.request("DELETE", "/api/emails/bulk", json={"ids": ids + [1000]}, headers=headers)
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert sorted(data["deleted"]) == sorted(ids)
+    assert data["not_found"] == [1000]
+    assert client.get("/api/emails/", headers=headers).json() == []
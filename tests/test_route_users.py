@@ -0,0 +1,70 @@
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi import HTTPException
+
+from src.database.models import User
+from src.services.auth import auth_service
+from src.services.avatars import LocalStorage, read_upload
+from src.services.cache import CachedUser
+
+
+@pytest.fixture(scope="module")
+def token(client, session):
+    async def seed():
+        async with session() as db:
+            db.add(User(username="storm", email="storm@example.com", password="hash", confirmed=True))
+            await db.commit()
+        return await auth_service.create_access_token(data={"sub": "storm@example.com"})
+
+    return asyncio.run(seed())
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    storage = LocalStorage(tmp_path, "/static/avatars")
+    monkeypatch.setattr("src.routes.users.avatar_storage", storage)
+    monkeypatch.setattr("src.routes.users.avatar_processor", None)
+    return storage
+
+
+def test_update_avatar(client, token, storage):
+    files = {"file": ("avatar.png", b"\x89PNG\r\n\x1a\n" + b"0" * 1000, "image/png")}
+    response = client.patch("/api/users/avatar", files=files, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    assert response.json()["avatar"].startswith("/static/avatars/storm.png?v=")
+    assert (storage.root / "storm.png").read_bytes() == files["file"][1]
+
+
+def test_update_avatar_too_large(client, token, storage, monkeypatch):
+    monkeypatch.setattr("src.routes.users.settings.avatar_max_bytes", 1024)
+    files = {"file": ("avatar.png", b"0" * 2048, "image/png")}
+    response = client.patch("/api/users/avatar", files=files, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 413, response.text
+    assert not (storage.root / "storm.png").exists()
+
+
+def test_update_avatar_not_an_image(client, token, storage):
+    files = {"file": ("notes.txt", b"hello", "text/plain")}
+    response = client.patch("/api/users/avatar", files=files, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 415, response.text
+
+
+def test_update_avatar_invalid_content_length():
+    request = MagicMock(headers={"content-length": "12abc", "content-type": "multipart/form-data; boundary=x"})
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(read_upload(request, "file", 1024))
+    assert exc_info.value.status_code == 400
+
+
+def test_current_user_is_a_snapshot_on_miss_and_hit(token, session):
+    async def current_users():
+        auth_service.user_cache.local.clear()
+        async with session() as db:
+            return [await auth_service.get_current_user(token, db) for _ in range(2)]
+
+    miss, hit = asyncio.run(current_users())
+    assert isinstance(miss, CachedUser)
+    assert miss == hit
+    assert not hasattr(miss, "password")
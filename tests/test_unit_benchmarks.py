@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from benchmarks.report import summarize
+from benchmarks.seed import Dataset, seed
+from src.database.models import Contact, Email, contacts_emails
+
+
+class TestSeed(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(self.tmp.name, 'bench.db')}")
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+        self.tmp.cleanup()
+
+    async def count(self, table) -> int:
+        async with self.engine.connect() as conn:
+            return await conn.scalar(select(func.count()).select_from(table))
+
+    async def test_seed_sizes(self):
+        dataset = await seed(self.engine, Dataset(users=2, contacts=30, emails=3), chunk_size=7)
+        self.assertEqual(list(dataset.accounts), ["bench0@example.com", "bench1@example.com"])
+        self.assertEqual([len(ids) for ids in dataset.accounts.values()], [30, 30])
+        self.assertEqual(await self.count(Contact.__table__), 60)
+        self.assertEqual(await self.count(Email.__table__), 180)
+        self.assertEqual(await self.count(contacts_emails), 180)
+
+    async def test_seed_is_reproducible(self):
+        async def names():
+            await seed(self.engine, Dataset(users=1, contacts=20, emails=1, seed=7))
+            async with self.engine.connect() as conn:
+                return (await conn.execute(select(Contact.name, Contact.birthday).order_by(Contact.id))).all()
+
+        self.assertEqual(await names(), await names())
+
+
+class TestSummarize(unittest.TestCase):
+
+    def test_percentiles(self):
+        stats = summarize([i / 1000 for i in range(1, 101)], wall_time=2)
+        self.assertEqual(stats["count"], 100)
+        self.assertEqual(stats["throughput"], 50)
+        self.assertAlmostEqual(stats["p50_ms"], 50.5)
+        self.assertAlmostEqual(stats["p99_ms"], 99.01)
+
+    def test_single_and_no_samples(self):
+        self.assertEqual(summarize([0.002])["p95_ms"], 2)
+        self.assertEqual(summarize([]), {"count": 0})
@@ -0,0 +1,126 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import AsyncMock
+
+from fakeredis import FakeAsyncRedis
+from redis.exceptions import ConnectionError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from src.database.models import Base, User
+from src.database.replicas import RecentWrites, ReplicaSet, RoutingSession, on_primary, use_primary
+from src.repository import users as repository_users
+
+
+class TestRoutingSession(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engines = {}
+        for name in ("primary", "replica1", "replica2"):
+            engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(self.tmp.name, name)}.db")
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            async with AsyncSession(engine) as db:
+                # every database holds a different user, so a lookup tells where it ran
+                db.add(User(username=name, email="logan@example.com", password="hash"))
+                await db.commit()
+            self.engines[name] = engine
+        self.replicas = ReplicaSet([self.engines["replica1"], self.engines["replica2"]])
+        self.session_factory = async_sessionmaker(self.engines["primary"], class_=AsyncSession,
+                                                  sync_session_class=RoutingSession, replicas=self.replicas,
+                                                  expire_on_commit=False)
+
+    async def asyncTearDown(self):
+        for engine in self.engines.values():
+            await engine.dispose()
+        self.tmp.cleanup()
+
+    async def lookup(self, db) -> str:
+        return (await repository_users.get_user_by_email("logan@example.com", db)).username
+
+    async def test_sessions_round_robin_over_replicas(self):
+        names = []
+        for _ in range(3):
+            async with self.session_factory() as db:
+                names.append(await self.lookup(db))
+        self.assertEqual(names, ["replica1", "replica2", "replica1"])
+
+    async def test_session_keeps_its_replica(self):
+        async with self.session_factory() as db:
+            await self.lookup(db)
+            replica = db.info["replica"]
+            await db.execute(select(User))
+            await db.execute(select(User))
+            self.assertIs(db.info["replica"], replica)
+            self.assertEqual(self.replicas._next, 1)
+
+    async def test_reads_after_write_stay_on_primary(self):
+        async with self.session_factory() as db:
+            db.add(User(username="wolverine", email="wolverine@example.com", password="hash"))
+            await db.commit()
+            self.assertEqual(await self.lookup(db), "primary")
+            user = await repository_users.get_user_by_email("wolverine@example.com", db)
+            self.assertIsNotNone(user)
+
+    async def test_locking_reads_and_use_primary(self):
+        async with self.session_factory() as db:
+            user = (await db.execute(select(User).with_for_update())).scalar_one()
+            self.assertEqual(user.username, "primary")
+        async with self.session_factory() as db:
+            use_primary(db)
+            self.assertEqual(await self.lookup(db), "primary")
+
+    async def test_on_primary_block(self):
+        async with self.session_factory() as db:
+            with on_primary(db):
+                self.assertEqual(await self.lookup(db), "primary")
+            self.assertNotIn("use_primary", db.info)
+        async with self.session_factory() as db:
+            use_primary(db)
+            with on_primary(db):
+                pass
+            self.assertTrue(db.info["use_primary"])
+
+    async def test_recent_writes_route_to_primary(self):
+        recent_writes = RecentWrites(FakeAsyncRedis(), ttl=5)
+        async with self.session_factory() as db:
+            await recent_writes.route(db, 1)
+            self.assertEqual(await self.lookup(db), "replica1")
+        await recent_writes.mark(1)
+        self.assertGreater(await recent_writes.r.pttl("rw:1"), 4000)
+        async with self.session_factory() as db:
+            await recent_writes.route(db, 1)
+            self.assertEqual(await self.lookup(db), "primary")
+        async with self.session_factory() as db:
+            await recent_writes.route(db, 2)
+            self.assertEqual(await self.lookup(db), "replica2")
+
+    async def test_unhealthy_replicas_are_skipped(self):
+        broken = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(self.tmp.name, 'missing', 'x.db')}")
+        self.replicas.engines.append(broken)
+        self.assertEqual(await self.replicas.check(), [True, True, False])
+        self.replicas.healthy = [False, False, False]
+        async with self.session_factory() as db:
+            self.assertEqual(await self.lookup(db), "primary")
+        await broken.dispose()
+
+
+class TestRecentWrites(unittest.IsolatedAsyncioTestCase):
+
+    async def test_redis_errors_fail_over_to_primary(self):
+        r = AsyncMock()
+        r.set.side_effect = ConnectionError()
+        r.exists.side_effect = ConnectionError()
+        recent_writes = RecentWrites(r)
+        await recent_writes.mark(1)
+        self.assertTrue(await recent_writes.recent(1))
+
+    async def test_disabled_without_replicas(self):
+        r = AsyncMock()
+        recent_writes = RecentWrites(r, enabled=False)
+        await recent_writes.mark(1)
+        self.assertFalse(await recent_writes.recent(1))
+        r.set.assert_not_called()
+        r.exists.assert_not_called()
@@ -3,46 +3,50 @@ from datetime import date, datetime
 from unittest.mock import MagicMock
 
 from sqlalchemy import and_
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import Contact, Email, User
-from src.schemas import ContactModel
+from src.schemas import ContactModel, ContactPatch
 from src.repository.contacts import (
     get_contacts,
     get_contact,
     create_contact,
     remove_contact,
     update_contact,
+    update_contacts,
+    remove_contacts,
 )
 
 
 class TestContacts(unittest.IsolatedAsyncioTestCase):
 
     def setUp(self):
-        self.session = MagicMock(spec=Session)
+        self.session = MagicMock(spec=AsyncSession)
+        self.result = MagicMock()
+        self.session.execute.return_value = self.result
         self.user = User(id=1)
 
     async def test_get_contacts(self):
         contacts = [Contact(), Contact(), Contact()]
-        self.session.query().filter().offset().limit().all.return_value = contacts
+        self.result.scalars().all.return_value = contacts
         result = await get_contacts(skip=0, limit=10, user=self.user, db=self.session)
         self.assertEqual(result, contacts)
 
     async def test_get_contact_found(self):
         contact = Contact()
-        self.session.query().filter().first.return_value = contact
+        self.result.scalar_one_or_none.return_value = contact
         result = await get_contact(contact_id=1, user=self.user, db=self.session)
         self.assertEqual(result, contact)
 
     async def test_get_contact_not_found(self):
-        self.session.query().filter().first.return_value = None
+        self.result.scalar_one_or_none.return_value = None
         result = await get_contact(contact_id=1, user=self.user, db=self.session)
         self.assertIsNone(result)
 
     async def test_create_contact(self):
         body = ContactModel(name="test", surname="surnametest", birthday=datetime.strptime('2020-09-20 00:00:00', '%Y-%m-%d %H:%M:%S'), description="test contact", emails=[1, 2])
         emails = [Email(id=1, email='qwe@tre.yy', user_id=1), Email(id=2, email='qwer@trye.yyy', user_id=1)]
-        self.session.query().filter().all.return_value = emails
+        self.result.scalars().all.return_value = emails
 
         result = await create_contact(body=body, user=self.user, db=self.session)
         self.assertEqual(result.name, body.name)
@@ -55,12 +59,12 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
 
     async def test_remove_contact_found(self):
         contact = Contact()
-        self.session.query().filter().first.return_value = contact
+        self.result.scalar_one_or_none.return_value = contact
         result = await remove_contact(contact_id=1, user=self.user, db=self.session)
         self.assertEqual(result, contact)
 
     async def test_remove_contact_not_found(self):
-        self.session.query().filter().first.return_value = None
+        self.result.scalar_one_or_none.return_value = None
         result = await remove_contact(contact_id=1, user=self.user, db=self.session)
         self.assertIsNone(result)
 
@@ -68,19 +72,40 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
         body = ContactModel(name="test", surname="surnametest", birthday=datetime.strptime('2020-09-20 00:00:00', '%Y-%m-%d %H:%M:%S'), description="test contact", emails=[1, 2])
         emails = [Email(id=1, user_id=1), Email(id=5, user_id=1)]
         contact = Contact(emails=emails)
-        self.session.query().filter().first.return_value = contact
-        self.session.query().filter().all.return_value = emails
+        self.result.scalar_one_or_none.return_value = contact
+        self.result.scalars().all.return_value = emails
         self.session.commit.return_value = None
         result = await update_contact(contact_id=1, body=body, user=self.user, db=self.session)
         self.assertEqual(result, contact)
 
     async def test_update_contact_not_found(self):
         body = ContactModel(name="test", surname="surnametest", birthday=datetime.strptime('2020-09-20 00:00:00', '%Y-%m-%d %H:%M:%S'), description="test contact", emails=[1, 2])
-        self.session.query().filter().first.return_value = None
+        self.result.scalar_one_or_none.return_value = None
         self.session.commit.return_value = None
         result = await update_contact(contact_id=1, body=body, user=self.user, db=self.session)
         self.assertIsNone(result)
 
+    async def test_update_contacts(self):
+        self.result.scalars().all.return_value = [3, 1]
+        result = await update_contacts([1, 3, 9], ContactPatch(description="x", emails=[2]), user=self.user,
+                                       db=self.session)
+        self.assertEqual(result, [1, 3])
+        # update, association delete and insert
+        self.assertEqual(self.session.execute.call_count, 3)
+        self.session.commit.assert_awaited_once()
+
+    async def test_update_contacts_none_owned(self):
+        self.result.scalars().all.return_value = []
+        result = await update_contacts([9], ContactPatch(emails=[2]), user=self.user, db=self.session)
+        self.assertEqual(result, [])
+        self.assertEqual(self.session.execute.call_count, 1)
+
+    async def test_remove_contacts(self):
+        self.result.scalars().all.return_value = [2, 1]
+        result = await remove_contacts([1, 2], user=self.user, db=self.session)
+        self.assertEqual(result, [1, 2])
+        self.session.commit.assert_awaited_once()
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,140 @@
+import unittest
+from datetime import date, datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from fakeredis import FakeAsyncRedis
+
+from redis.exceptions import ConnectionError
+
+from src.database.models import User
+from src.database.replicas import RecentWrites
+from src.services import cache
+from src.services.cache import LRUCache, CachedUser, UserCache, CachedResponse, ResponseCache, dumps_json
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_expired_entry_is_a_miss(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        with patch("src.services.cache.time.monotonic", return_value=100):
+            cache.set("a", 1)
+        with patch("src.services.cache.time.monotonic", return_value=161):
+            self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+
+class TestUserCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.r = AsyncMock()
+        self.cache = UserCache(self.r)
+        self.user = User(id=1, username="deadpool", email="deadpool@example.com", password="hash",
+                         created_at=datetime(2024, 5, 1), confirmed=True, avatar=None, refresh_token="token")
+
+    async def test_set_then_get_returns_snapshot(self):
+        snapshot = await self.cache.set(self.user)
+        self.r.set.assert_awaited_once()
+        result = await self.cache.get(self.user.email)
+        self.assertEqual(result, snapshot)
+        self.assertFalse(hasattr(result, "password"))
+        self.r.get.assert_not_awaited()
+
+    async def test_get_falls_back_to_redis(self):
+        self.r.get.return_value = CachedUser.from_user(self.user).dumps().encode()
+        result = await self.cache.get(self.user.email)
+        self.assertEqual(result.id, self.user.id)
+        self.assertEqual(result.created_at, self.user.created_at)
+
+    async def test_invalidate(self):
+        await self.cache.set(self.user)
+        self.r.get.return_value = None
+        await self.cache.invalidate(self.user.email)
+        self.r.delete.assert_awaited_once_with("user:deadpool@example.com")
+        self.assertIsNone(await self.cache.get(self.user.email))
+
+    async def test_redis_error_is_a_miss(self):
+        self.r.get.side_effect = ConnectionError()
+        self.assertIsNone(await self.cache.get(self.user.email))
+
+
+class TestResponseCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.r = AsyncMock()
+        self.cache = ResponseCache(self.r)
+
+    def test_cached_response_roundtrip_and_etag_match(self):
+        entry = CachedResponse.build(b'[{"id":1}]\n', {"X-Next-Cursor": "abc"})
+        self.assertEqual(CachedResponse.loads(entry.dumps()), entry)
+        self.assertTrue(entry.matches(f'"other", W/{entry.etag}'))
+        self.assertTrue(entry.matches("*"))
+        self.assertFalse(entry.matches('"other"'))
+        self.assertFalse(entry.matches(None))
+
+    async def test_entries_are_keyed_by_generation(self):
+        self.r.get.return_value = None
+        entry = CachedResponse.build(b"[]", {})
+        await self.cache.set(1, 0, "/api/emails/?", entry)
+        self.assertEqual(await self.cache.get(1, 0, "/api/emails/?"), entry)
+        self.assertIsNone(await self.cache.get(1, 1, "/api/emails/?"))
+
+    async def test_bump_increments_generation(self):
+        self.r.get.return_value = b"4"
+        self.assertEqual(await self.cache.generation(1), 4)
+        await self.cache.bump(1)
+        self.r.incr.assert_awaited_once_with("gen:1")
+
+    async def test_redis_error_disables_caching(self):
+        self.r.get.side_effect = ConnectionError()
+        self.assertIsNone(await self.cache.generation(1))
+        self.r.incr.side_effect = ConnectionError()
+        await self.cache.set(1, 0, "key", CachedResponse.build(b"[]", {}))
+        await self.cache.bump(1)
+        self.assertEqual(len(self.cache.local), 0)
+
+    async def test_fill_after_write_reads_the_primary(self):
+        r = FakeAsyncRedis()
+        self.cache.r = r
+        request = MagicMock()
+        request.url.path, request.url.query = "/api/emails/", ""
+        request.headers = {}
+        sessions = []
+
+        async def produce():
+            sessions.append(dict(db.info))
+            return [], {}
+
+        with patch.object(cache, "recent_writes", RecentWrites(r, ttl=5)):
+            db = MagicMock(info={})
+            await self.cache.respond(request, 1, list, produce, db=db)
+            self.assertNotIn("use_primary", sessions[-1])
+            await self.cache.bump(1)
+            self.assertTrue(await r.exists("rw:1"))
+            db = MagicMock(info={})
+            await self.cache.respond(request, 1, list, produce, db=db)
+            self.assertTrue(sessions[-1]["use_primary"])
+            self.assertEqual(await r.exists("resp:1:1:/api/emails/?"), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+class TestDumpsJson(unittest.TestCase):
+
+    def test_stdlib_fallback_matches(self):
+        data = [{"name": "Logan", "birthday": date(1990, 5, 1), "emails": [{"email": "logan@x.io", "id": 1}]}]
+        expected = b'[{"name":"Logan","birthday":"1990-05-01","emails":[{"email":"logan@x.io","id":1}]}]'
+        self.assertEqual(dumps_json(data), expected)
+        with patch.object(cache, "orjson", None):
+            self.assertEqual(dumps_json(data), expected)
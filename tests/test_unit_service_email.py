@@ -0,0 +1,66 @@
+import socket
+import unittest
+
+from aiosmtpd.controller import Controller
+from aiosmtpd.handlers import Message
+
+from src.services.email import MailSender
+
+
+class Mailbox(Message):
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def handle_message(self, message):
+        self.messages.append(message)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class TestMailSender(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.mailbox = Mailbox()
+        self.controller = Controller(self.mailbox, hostname="127.0.0.1", port=free_port())
+        self.controller.start()
+        self.sender = MailSender(hostname="127.0.0.1", port=self.controller.port, username=None, password=None,
+                                 sender="noreply@example.com", use_tls=False, pool_size=1)
+
+    async def asyncTearDown(self):
+        await self.sender.close()
+        self.controller.stop()
+
+    async def test_send_reuses_connection(self):
+        context = {"host": "http://localhost/", "username": "deadpool", "token": "token"}
+        await self.sender.send("deadpool@example.com", "Confirm your email", "email_template.html", context)
+        async with self.sender.connection() as client:
+            first = client
+        await self.sender.send("wolverine@example.com", "Confirm your email", "email_template.html", context)
+        async with self.sender.connection() as client:
+            self.assertIs(client, first)
+        self.assertEqual([m["To"] for m in self.mailbox.messages], ["deadpool@example.com", "wolverine@example.com"])
+        self.assertIn("api/auth/confirmed_email/token", self.mailbox.messages[0].get_payload(decode=True).decode())
+
+    async def test_dropped_connection_is_replaced(self):
+        context = {"host": "http://localhost/", "username": "deadpool", "token": "token"}
+        await self.sender.send("deadpool@example.com", "Confirm your email", "email_template.html", context)
+        async with self.sender.connection() as client:
+            client.close()
+        await self.sender.send("deadpool@example.com", "Confirm your email", "email_template.html", context)
+        self.assertEqual(len(self.mailbox.messages), 2)
+
+    def test_template_is_compiled_once(self):
+        self.sender.render("email_template.html", host="", username="", token="")
+        template = self.sender._templates["email_template.html"]
+        self.sender.render("email_template.html", host="", username="", token="")
+        self.assertIs(self.sender._templates["email_template.html"], template)
+
+
+if __name__ == '__main__':
+    unittest.main()
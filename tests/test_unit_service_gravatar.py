@@ -0,0 +1,38 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from sqlalchemy.exc import OperationalError
+
+from src.database.models import User
+from src.services.gravatar import assign_gravatar, assign_gravatars, gravatar_url
+
+
+class TestGravatar(unittest.IsolatedAsyncioTestCase):
+
+    def test_url_uses_normalized_email(self):
+        self.assertEqual(gravatar_url(" Logan@Example.com "), gravatar_url("logan@example.com"))
+        self.assertTrue(gravatar_url("logan@example.com").startswith("https://www.gravatar.com/avatar/"))
+
+    async def test_assign_gravatars_in_batches(self):
+        users = [User(id=i, email=f"user{i}@example.com") for i in range(1, 4)]
+        session_factory = MagicMock()
+        with patch("src.services.gravatar.repository_users") as repository, \
+                patch("src.services.gravatar.auth_service.user_cache.invalidate", AsyncMock()):
+            repository.get_users_without_avatar = AsyncMock(side_effect=[users[:2], users[2:], []])
+            repository.set_default_avatars = AsyncMock()
+            processed = await assign_gravatars(session_factory, batch_size=2)
+        self.assertEqual(processed, 3)
+        self.assertEqual([call.kwargs["after_id"] for call in repository.get_users_without_avatar.await_args_list],
+                         [None, 2, 3])
+        first_batch = repository.set_default_avatars.await_args_list[0].args[0]
+        self.assertEqual(first_batch, {1: gravatar_url("user1@example.com"), 2: gravatar_url("user2@example.com")})
+
+    async def test_assign_gravatar_logs_database_errors(self):
+        invalidate = AsyncMock()
+        with patch("src.services.gravatar.repository_users") as repository, \
+                patch("src.services.gravatar.auth_service.user_cache.invalidate", invalidate), \
+                self.assertLogs("src.services.gravatar", level="ERROR") as logs:
+            repository.set_default_avatars = AsyncMock(side_effect=OperationalError("UPDATE", {}, Exception("down")))
+            await assign_gravatar(MagicMock(), 7, "logan@example.com")
+        self.assertIn("user 7", logs.output[0])
+        invalidate.assert_not_awaited()
@@ -0,0 +1,127 @@
+import asyncio
+import json
+import time
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from fakeredis import FakeAsyncRedis
+from fastapi import HTTPException
+from redis.asyncio.client import Pipeline
+from redis.exceptions import ConnectionError
+
+from src.services.mail_queue import MailQueue, MailWorker
+
+
+class TestMailQueue(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.r = FakeAsyncRedis()
+        self.queue = MailQueue(self.r, max_attempts=2, backoff=0)
+        self.sender = AsyncMock()
+        self.worker = MailWorker(self.queue, self.sender, batch_size=10, worker_id="w1")
+
+    async def asyncTearDown(self):
+        await self.r.flushall()
+        await self.r.aclose()
+
+    async def test_enqueue_dedupes(self):
+        self.assertTrue(await self.queue.enqueue_confirmation("a@example.com", "a", "http://localhost/"))
+        self.assertFalse(await self.queue.enqueue_confirmation("a@example.com", "a", "http://localhost/"))
+        self.assertTrue(await self.queue.enqueue_confirmation("b@example.com", "b", "http://localhost/"))
+        self.assertEqual(await self.r.llen(self.queue.queue), 2)
+
+    async def test_worker_sends_batch(self):
+        for i in range(3):
+            await self.queue.enqueue_confirmation(f"user{i}@example.com", f"user{i}", "http://localhost/")
+        sent = await self.worker.run_once(timeout=0.1)
+        self.assertEqual(sent, 3)
+        self.assertEqual(self.sender.send.await_count, 3)
+        self.assertEqual(await self.r.llen(self.queue.queue), 0)
+        self.assertEqual(await self.r.llen(self.queue.processing("w1")), 0)
+
+    async def test_failed_job_is_retried_then_dead_lettered(self):
+        self.sender.send.side_effect = OSError("connection refused")
+        await self.queue.enqueue_confirmation("a@example.com", "a", "http://localhost/")
+        await self.worker.run_once(timeout=0.1)
+        self.assertEqual(await self.r.zcard(self.queue.retry), 1)
+        await self.worker.run_once(timeout=0.1)
+        self.assertEqual(await self.r.zcard(self.queue.retry), 0)
+        dead = [json.loads(raw) for raw in await self.r.lrange(self.queue.dead, 0, -1)]
+        self.assertEqual(dead, [{"email": "a@example.com", "username": "a", "host": "http://localhost/",
+                                 "attempts": 2}])
+
+    async def test_retry_waits_for_backoff(self):
+        queue = MailQueue(self.r, backoff=60)
+        await queue.fail("w1", json.dumps({"email": "a@example.com", "username": "a", "host": "", "attempts": 0}))
+        self.assertEqual(await queue.promote_retries(), 0)
+        [(_, due)] = await self.r.zrange(queue.retry, 0, -1, withscores=True)
+        self.assertGreater(due, time.time() + 50)
+
+    async def test_recover_requeues_only_expired_workers(self):
+        for i in range(2):
+            await self.queue.enqueue_confirmation(f"user{i}@example.com", f"user{i}", "http://localhost/")
+        for worker_id in ("live", "dead"):
+            await self.queue.heartbeat(worker_id)
+            await self.queue.take(worker_id, 1, timeout=0.1)
+        await self.r.delete(self.queue._alive("dead"))
+        self.assertEqual(await self.queue.recover(), 1)
+        self.assertEqual(await self.r.llen(self.queue.queue), 1)
+        self.assertEqual(await self.r.llen(self.queue.processing("live")), 1)
+        self.assertEqual(await self.r.smembers(self.queue.workers), {b"live"})
+
+    async def test_enqueue_redis_error(self):
+        r = MagicMock()
+        r.pipeline.side_effect = ConnectionError()
+        queue = MailQueue(r)
+        with self.assertRaises(HTTPException) as cm:
+            await queue.enqueue_confirmation("a@example.com", "a", "http://localhost/")
+        self.assertEqual(cm.exception.status_code, 503)
+
+    async def test_enqueue_failed_push_leaves_no_dedupe_key(self):
+        with patch.object(Pipeline, "execute", side_effect=ConnectionError()):
+            with self.assertRaises(HTTPException):
+                await self.queue.enqueue_confirmation("a@example.com", "a", "http://localhost/")
+        self.assertFalse(await self.r.exists(f"{self.queue.dedupe}:a@example.com"))
+        self.assertTrue(await self.queue.enqueue_confirmation("a@example.com", "a", "http://localhost/"))
+
+    async def test_slow_batch_keeps_its_jobs(self):
+        queue = MailQueue(self.r, heartbeat_ttl=0.3)
+        sent = []
+
+        async def send(email, *args):
+            await asyncio.sleep(0.5)
+            sent.append(email)
+
+        slow = MailWorker(queue, AsyncMock(send=send), batch_size=10, worker_id="slow")
+        other = MailWorker(queue, AsyncMock(send=send), batch_size=10, worker_id="other")
+        for i in range(3):
+            await queue.enqueue_confirmation(f"user{i}@example.com", f"user{i}", "http://localhost/")
+
+        batch = asyncio.create_task(slow.run_once(timeout=0.1))
+        while await self.r.llen(queue.processing("slow")) < 3:
+            await asyncio.sleep(0.01)
+        # another worker keeps recovering while the slow batch outlives the heartbeat TTL
+        while not batch.done():
+            await other.run_once(timeout=0.05)
+            await asyncio.sleep(0.05)
+        self.assertEqual(batch.result(), 3)
+        self.assertEqual(sorted(sent), [f"user{i}@example.com" for i in range(3)])
+        self.assertEqual(await self.r.llen(queue.queue), 0)
+        self.assertEqual(await self.r.llen(queue.processing("slow")), 0)
+
+    async def test_worker_survives_redis_errors(self):
+        calls = 0
+
+        async def run_once():
+            nonlocal calls
+            calls += 1
+            if calls == 1:
+                raise ConnectionError()
+            self.worker.running = False
+            return 0
+
+        self.worker.run_once = run_once
+        with patch("src.services.mail_queue.asyncio.sleep", AsyncMock()) as sleep:
+            await self.worker.run()
+        self.assertEqual(calls, 2)
+        sleep.assert_awaited_once_with(1)
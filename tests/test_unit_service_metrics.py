@@ -0,0 +1,52 @@
+import unittest
+
+from fakeredis import FakeAsyncRedis
+from prometheus_client import REGISTRY
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.services.metrics import InstrumentedRedis, external_call, instrument_engine, instrumented
+
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@instrumented
+async def count_rows(conn):
+    await conn.execute(text("SELECT 1"))
+    await conn.execute(text("SELECT 2"))
+
+
+class TestMetrics(unittest.IsolatedAsyncioTestCase):
+
+    async def test_queries_are_labelled_by_repository_function(self):
+        engine = create_async_engine("sqlite+aiosqlite://")
+        instrument_engine(engine)
+        before = sample("db_queries_total", function="test_unit_service_metrics.count_rows")
+        async with engine.connect() as conn:
+            await count_rows(conn)
+            await conn.execute(text("SELECT 3"))
+        await engine.dispose()
+        self.assertEqual(sample("db_queries_total", function="test_unit_service_metrics.count_rows") - before, 2)
+        self.assertGreater(sample("db_query_duration_seconds_count", function="other"), 0)
+
+    async def test_redis_commands_and_pipelines_are_counted(self):
+        r = InstrumentedRedis(connection_pool=FakeAsyncRedis().connection_pool)
+        labels = {"service": "redis", "outcome": "ok"}
+        set_before = sample("external_calls_total", operation="SET", **labels)
+        pipeline_before = sample("external_calls_total", operation="PIPELINE", **labels)
+        await r.set("key", 1)
+        async with r.pipeline() as pipe:
+            pipe.incr("key")
+            pipe.get("key")
+            await pipe.execute()
+        self.assertEqual(sample("external_calls_total", operation="SET", **labels) - set_before, 1)
+        self.assertEqual(sample("external_calls_total", operation="PIPELINE", **labels) - pipeline_before, 1)
+
+    def test_external_call_counts_errors(self):
+        before = sample("external_calls_total", service="smtp", operation="send", outcome="error")
+        with self.assertRaises(OSError):
+            with external_call("smtp", "send"):
+                raise OSError("connection refused")
+        self.assertEqual(sample("external_calls_total", service="smtp", operation="send", outcome="error") - before, 1)
@@ -0,0 +1,48 @@
+import asyncio
+import unittest
+
+from fastapi import HTTPException
+
+from src.services.passwords import PasswordHasher
+
+
+class TestPasswordHasher(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.hasher = PasswordHasher(workers=1, queue_size=1, executor="thread", rounds=4)
+
+    def tearDown(self):
+        self.hasher.shutdown()
+
+    async def test_hash_and_verify(self):
+        hashed = await self.hasher.hash_password("123456789")
+        self.assertTrue(await self.hasher.verify_password("123456789", hashed))
+        self.assertFalse(await self.hasher.verify_password("password", hashed))
+
+    async def test_process_pool(self):
+        hasher = PasswordHasher(workers=1, queue_size=1, executor="process", rounds=4)
+        try:
+            hashed = await hasher.hash_password("123456789")
+            self.assertTrue(await hasher.verify_password("123456789", hashed))
+        finally:
+            hasher.shutdown()
+
+    async def test_rehash_when_cost_changes(self):
+        hashed = await self.hasher.hash_password("123456789")
+        self.assertEqual(await self.hasher.verify_and_update("123456789", hashed), (True, None))
+        self.hasher.rounds = 5
+        verified, new_hash = await self.hasher.verify_and_update("123456789", hashed)
+        self.assertTrue(verified)
+        self.assertTrue(new_hash.startswith("$2b$05$"))
+
+    async def test_saturated_queue_is_rejected(self):
+        tasks = [asyncio.create_task(self.hasher.hash_password("123456789")) for _ in range(2)]
+        await asyncio.sleep(0)
+        with self.assertRaises(HTTPException) as cm:
+            await self.hasher.hash_password("123456789")
+        self.assertEqual(cm.exception.status_code, 503)
+        await asyncio.gather(*tasks)
+
+
+if __name__ == '__main__':
+    unittest.main()
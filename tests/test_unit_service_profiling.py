@@ -0,0 +1,88 @@
+import os
+import tempfile
+import time
+import unittest
+
+from src.services.profiling import ProfilingMiddleware, RequestProfile, current_profile, phase, record_statement
+
+
+def busy_loop(seconds: float):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+async def app(scope, receive, send):
+    with phase("auth"):
+        busy_loop(0.05)
+        with phase("orm"):
+            record_statement("SELECT * FROM contacts WHERE user_id = ?", (1,), 0.002)
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"[]"})
+
+
+async def call(middleware):
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    await middleware({"type": "http", "method": "GET", "path": "/api/contacts/"}, receive, send)
+
+
+class TestRequestProfile(unittest.TestCase):
+
+    def test_nested_phases_keep_their_own_time(self):
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        try:
+            with phase("auth"):
+                busy_loop(0.01)
+                with phase("orm"):
+                    record_statement("SELECT 1", (), 0.004)
+        finally:
+            current_profile.reset(token)
+        self.assertEqual(profile.phases["sql"], 0.004)
+        self.assertGreater(profile.phases["auth"], 0.009)
+        self.assertEqual(profile.statements, [("SELECT 1", (), 0.004)])
+
+    def test_phase_without_profile(self):
+        with phase("auth"):
+            record_statement("SELECT 1", (), 0.004)
+        self.assertIsNone(current_profile.get())
+
+
+class TestProfilingMiddleware(unittest.IsolatedAsyncioTestCase):
+
+    async def test_slow_request_is_logged_with_phases_and_statements(self):
+        middleware = ProfilingMiddleware(app, slow_ms=0)
+        with self.assertLogs("src.services.profiling", level="WARNING") as logs:
+            await call(middleware)
+        report = logs.output[0]
+        self.assertIn("slow request GET /api/contacts/", report)
+        self.assertIn("auth", report)
+        self.assertIn("sql 2.0 ms", report)
+        self.assertIn("SELECT * FROM contacts WHERE user_id = ?  (1,)", report)
+
+    async def test_fast_request_is_not_logged(self):
+        middleware = ProfilingMiddleware(app, slow_ms=10000)
+        with self.assertNoLogs("src.services.profiling", level="WARNING"):
+            await call(middleware)
+
+    async def test_sampled_request_writes_folded_stacks(self):
+        with tempfile.TemporaryDirectory() as directory:
+            middleware = ProfilingMiddleware(app, slow_ms=10000, sample_every=2, sample_interval=0.001,
+                                             directory=directory)
+            await call(middleware)
+            self.assertEqual(os.listdir(directory), [])
+            await call(middleware)
+            files = os.listdir(directory)
+            self.assertEqual(len(files), 1)
+            self.assertTrue(files[0].endswith("-2-GET-api_contacts.folded"))
+            with open(os.path.join(directory, files[0])) as f:
+                lines = f.read().splitlines()
+        self.assertTrue(lines)
+        self.assertTrue(any("busy_loop" in line for line in lines))
+        stack, count = lines[0].rsplit(" ", 1)
+        self.assertGreater(int(count), 0)
@@ -0,0 +1,53 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+from fakeredis import FakeAsyncRedis
+from fastapi import HTTPException
+from redis.exceptions import ConnectionError
+
+from src.services.rate_limit import Limit, RateLimiter
+
+
+class TestRateLimiter(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.r = FakeAsyncRedis()
+
+    async def asyncTearDown(self):
+        await self.r.aclose()
+
+    def test_parse_limit(self):
+        self.assertEqual(Limit.parse("10/60"), Limit(times=10, seconds=60))
+
+    async def test_leases_quota_in_batches(self):
+        limiter = RateLimiter(self.r, {"route": "10/60"}, lease_fraction=0.5)
+        limiter._lease = AsyncMock(wraps=limiter._lease)
+        for _ in range(10):
+            await limiter.hit("route", 1)
+        self.assertEqual(limiter._lease.await_count, 2)
+        with self.assertRaises(HTTPException) as cm:
+            await limiter.hit("route", 1)
+        self.assertEqual(cm.exception.status_code, 429)
+
+    async def test_limit_is_shared_between_workers(self):
+        workers = [RateLimiter(self.r, {"route": "4/60"}, lease_fraction=0.5) for _ in range(2)]
+        for worker in workers:
+            await worker.hit("route", 1)
+            await worker.hit("route", 1)
+        for worker in workers:
+            with self.assertRaises(HTTPException):
+                await worker.hit("route", 1)
+
+    async def test_limits_are_per_user(self):
+        limiter = RateLimiter(self.r, {"route": "1/60"})
+        await limiter.hit("route", 1)
+        await limiter.hit("route", 2)
+        await limiter.hit("other", 1)
+
+    async def test_redis_failure_policy(self):
+        broken = MagicMock()
+        broken.pipeline.side_effect = ConnectionError()
+        await RateLimiter(broken, {"route": "1/60"}, fail_open=True).hit("route", 1)
+        with self.assertRaises(HTTPException) as cm:
+            await RateLimiter(broken, {"route": "1/60"}, fail_open=False).hit("route", 1)
+        self.assertEqual(cm.exception.status_code, 503)
@@ -0,0 +1,47 @@
+import unittest
+
+from fakeredis import FakeAsyncRedis
+from fastapi import HTTPException
+
+from src.services.sessions import RefreshSessions, TokenReuseError
+
+
+class TestRefreshSessions(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.r = FakeAsyncRedis()
+        self.sessions = RefreshSessions(self.r, ttl=60)
+
+    async def family(self, jti: str) -> str:
+        return (await self.r.hget(f"rt:{jti}", "family")).decode()
+
+    async def test_rotate_within_family(self):
+        jti = await self.sessions.issue("logan@example.com")
+        new_jti = await self.sessions.rotate(jti, "logan@example.com")
+        self.assertEqual(await self.family(new_jti), await self.family(jti))
+        with self.assertRaises(TokenReuseError):
+            await self.sessions.rotate(jti, "logan@example.com")
+        self.assertFalse(await self.r.exists(f"rtf:{await self.family(jti)}"))
+
+    async def test_rotation_does_not_revive_revoked_family(self):
+        jti = await self.sessions.issue("logan@example.com")
+        family = await self.family(jti)
+        # the family is revoked after the token was checked, before the new one is issued
+        await self.sessions.revoke_all("logan@example.com")
+        with self.assertRaises(HTTPException) as cm:
+            await self.sessions.issue("logan@example.com", family)
+        self.assertEqual(cm.exception.status_code, 401)
+        self.assertFalse(await self.r.exists(f"rtf:{family}"))
+        self.assertEqual(await self.r.smembers("rt:user:logan@example.com"), set())
+        self.assertEqual(await self.r.keys("rt:*"), [f"rt:{jti}".encode()])
+
+    async def test_rotate_revoked_family(self):
+        jti = await self.sessions.issue("logan@example.com")
+        await self.sessions.revoke_family(await self.family(jti), "logan@example.com")
+        with self.assertRaises(HTTPException) as cm:
+            await self.sessions.rotate(jti, "logan@example.com")
+        self.assertEqual(cm.exception.status_code, 401)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from jose import JWTError
+
+from src.services.tokens import JoseBackend, TokenCache, jwt_backend
+
+
+class TestTokenCache(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = MagicMock(wraps=JoseBackend())
+        self.tokens = TokenCache(self.backend, "secret", "HS256", maxsize=2)
+        self.token = JoseBackend().encode({"sub": "logan@example.com", "exp": int(time.time()) + 60},
+                                          "secret", "HS256")
+
+    def test_verified_token_is_decoded_once(self):
+        self.assertEqual(self.tokens.decode(self.token)["sub"], "logan@example.com")
+        self.assertEqual(self.tokens.decode(self.token)["sub"], "logan@example.com")
+        self.assertEqual(self.backend.decode.call_count, 1)
+        self.assertNotIn(self.token, self.tokens.cache._data)
+
+    def test_entry_expires_with_token(self):
+        self.tokens.decode(self.token)
+        with patch("src.services.cache.time.monotonic", return_value=time.monotonic() + 61):
+            self.tokens.decode(self.token)
+        self.assertEqual(self.backend.decode.call_count, 2)
+
+    def test_invalid_token_is_not_cached(self):
+        forged = self.token[:-2] + ("AA" if not self.token.endswith("AA") else "BB")
+        for _ in range(2):
+            with self.assertRaises(JWTError):
+                self.tokens.decode(forged)
+        self.assertEqual(len(self.tokens.cache), 0)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            jwt_backend("fast")
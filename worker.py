@@ -0,0 +1,14 @@
+import asyncio
+
+from src.conf.config import settings
+from src.services.email import mail_sender
+from src.services.mail_queue import MailWorker, mail_queue
+
+
+async def main():
+    worker = MailWorker(mail_queue, mail_sender, batch_size=settings.mail_queue_batch)
+    await worker.run()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())